@@ -1,11 +1,45 @@
 import os
+import re
 import json 
+import time
+import numpy as np
 import streamlit as st
-import sqlite3
-import psycopg2
-import psycopg2.extras
 from datetime import date, datetime
 
+from fabric_costing import (
+    aio, bulk_edit, catalog, db, dedupe, export, impact, kernel, perf, replica, similar, snapshots, solver, tracing, weft_mix,
+)
+from fabric_costing import costing as core
+from fabric_costing.costing import (
+    calculate_costing,
+    calculate_costing_multi_weft,
+    calculate_deal_margin,
+)
+from fabric_costing.sheets import (
+    COSTING_SHEET_COLUMNS,
+    COSTING_SHEET_COST_SORTS,
+    COSTING_SHEET_RECIPE_SORTS,
+    PRICING_SHEET_COLUMNS,
+    costing_sheet_row,
+    filter_qualities,
+    in_range,
+    pricing_sheet_row,
+    sheet_weight,
+)
+from fabric_costing.db import (
+    get_latest_yarn_price,
+    list_yarn_names,
+    save_yarn_price,
+    get_latest_yarn_row,
+    update_yarn_row,
+    delete_yarn_completely,
+    list_all_qualities,
+    get_quality_by_id,
+    save_quality,
+    update_quality,
+    delete_quality,
+)
+
 st.caption("🔁 Build: v3")
 
 # ------------- SIMPLE PASSWORD PROTECTION -------------
@@ -39,16 +73,21 @@ def check_password():
 # Database setup (Supabase Postgres)
 # ---------------------------
 
-from psycopg2.extras import RealDictCursor  # optional but handy
+# Connection string stored in Streamlit secrets as SUPABASE_URI
+# (you already set this in Streamlit Cloud). The helpers live in fabric_costing.db.
+db.set_conn_str_provider(lambda: st.secrets["SUPABASE_URI"])
 
 
-def get_conn():
+@st.cache_resource
+def start_metrics_endpoint():
     """
-    Open a new connection to Supabase Postgres using the connection string
-    stored in Streamlit secrets as SUPABASE_URI.
+    Query latency histograms as OpenMetrics on http://127.0.0.1:<port>/metrics
+    when FABRIC_METRICS_PORT is set. Started once per process.
     """
-    conn_str = st.secrets["SUPABASE_URI"]  # you already set this in Streamlit Cloud
-    return psycopg2.connect(conn_str)
+    port = os.getenv("FABRIC_METRICS_PORT")
+    if not port:
+        return None
+    return tracing.serve_metrics(int(port))
 
 
 def init_db():
@@ -59,764 +98,514 @@ def init_db():
     pass
 
 init_db()
+start_metrics_endpoint()
 
 # ---------------------------
 # Helper functions (Postgres)
 # ---------------------------
 
-def normalize_json(val):
-    if val is None:
-        return None
-    if isinstance(val, (dict, list)):
-        return json.dumps(val)
-    if isinstance(val, str):
-        return val
-    return None
-
-@st.cache_data(ttl=300)
-def list_all_qualities_full():
+# ---------------------------
+# Cache invalidation & data version
+# ---------------------------
+
+@st.cache_resource
+def _data_version_state():
+    # Process-wide counter, shared by every session
+    return {"version": 0}
+
+
+def get_data_version():
+    """Current data version. Bumped on every write made through this app."""
+    return _data_version_state()["version"]
+
+
+def invalidate_caches():
     """
-    Fetch ALL qualities with all columns in one query.
-    Returns: list of dicts (same shape as get_quality_by_id)
+    Call after any write (yarn prices / qualities).
+    Clears cached reads and bumps the data version, so anything keyed
+    on it (sheet exports, ...) is rebuilt on next request – the catalog
+    caches start reloading in the background right away.
     """
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    cur.execute("""
-        SELECT *
-        FROM qualities
-        ORDER BY quality_name
-    """)
+    st.cache_data.clear()
+    _data_version_state()["version"] += 1
+    for cache in (_qualities_cache, _yarn_price_map_cache, _recipe_batch_cache, _yarn_usage_cache):
+        cache.clear()  # retire the old version's holders (and their reload schedules)
+    warm_catalog_caches()
 
-    rows = cur.fetchall()
-    conn.close()
-    return rows
 
-@st.cache_data(ttl=300)
-def get_latest_yarn_price_map():
+def follow_replica():
     """
-    Fetch latest yarn prices ONCE and cache them.
-    Key: (name, yarn_type)
-    Value: dict with price_per_kg, denier, count
+    With a local replica (FABRIC_REPLICA), changes its reconciliation pulls
+    in from other writers retire the caches just like a write made here.
     """
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    rep = replica.active()
+    if rep is None:
+        return
+    state = _data_version_state()
+    if state.setdefault("replica_generation", rep.generation) != rep.generation:
+        state["replica_generation"] = rep.generation
+        invalidate_caches()
+
+
+def render_replica_status():
+    rep = replica.current()
+    if rep is None:
+        return
+    if rep.online is False:
+        st.sidebar.warning("📴 Database unreachable – read-only, showing the local copy.")
+    elif rep.last_sync:
+        st.sidebar.caption(f"💾 Local replica · synced {time.time() - rep.last_sync:.0f}s ago")
+
 
-    cur.execute("""
-        SELECT DISTINCT ON (name, yarn_type)
-            name, yarn_type, price_per_kg, denier, count
-        FROM yarn_prices
-        ORDER BY name, yarn_type, valid_from DESC, id DESC
-    """)
+# Catalog reads are cached as frozen, shared structures (st.cache_resource):
+# every session gets the same object, nothing is copied or unpickled on a hit.
+# Keyed on the data version, so invalidate_caches() retires them. Within a
+# version each is a catalog.RefreshAhead: reloaded in the background before
+# CATALOG_TTL runs out and swapped in, so no rerun waits on the reload.
+# Values derived from them (recipe batch, yarn usage) rebuild after a swap.
 
-    rows = cur.fetchall()
-    conn.close()
+CATALOG_TTL = float(os.getenv("FABRIC_CATALOG_TTL", "300"))
 
-    price_map = {}
 
-    for r in rows:
-        # exact type
-        price_map[(r["name"], r["yarn_type"])] = r
+def _load_qualities(columns):
+    perf.cache_miss("qualities")
+    rows = catalog.freeze_rows(db.list_qualities(columns))
+    label = "all" if columns is None else len(columns)
+    return catalog.register(f"qualities ({label} cols)", rows)
 
-        # fallback: treat "both" as warp + weft
-        if r["yarn_type"] == "both":
-            price_map[(r["name"], "warp")] = r
-            price_map[(r["name"], "weft")] = r
 
-    return price_map
+def _load_yarn_price_map():
+    perf.cache_miss("yarn_price_map")
+    table = db.get_latest_yarn_price_map()
+    return catalog.register("yarn_price_map", table, rows=table.n_rows)
 
-def get_latest_yarn_price(name, yarn_type=None):
+
+@st.cache_resource(max_entries=8)
+def _qualities_cache(data_version, columns):
+    return catalog.RefreshAhead("qualities", lambda: _load_qualities(columns), ttl=CATALOG_TTL)
+
+
+@st.cache_resource(max_entries=2)
+def _yarn_price_map_cache(data_version):
+    return catalog.RefreshAhead("yarn_price_map", _load_yarn_price_map, ttl=CATALOG_TTL)
+
+
+@perf.cache_probe("qualities")
+def list_qualities(columns=None):
     """
-    Returns (price_per_kg, denier, count) for the most recent record of this yarn.
-    Optionally filter by yarn_type.
+    ALL qualities, only the given columns (cached per column set, shared).
+    columns: e.g. PRICING_SHEET_COLUMNS; None = every column.
+    Returns: tuple of read-only rows
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    if yarn_type:
-        cur.execute("""
-            SELECT price_per_kg, denier, count
-            FROM yarn_prices
-            WHERE name = %s AND (yarn_type = %s OR yarn_type = 'both')
-            ORDER BY valid_from DESC, id DESC
-            LIMIT 1
-        """, (name, yarn_type))
-    else:
-        cur.execute("""
-            SELECT price_per_kg, denier, count
-            FROM yarn_prices
-            WHERE name = %s
-            ORDER BY valid_from DESC, id DESC
-            LIMIT 1
-        """, (name,))
-    row = cur.fetchone()
-    conn.close()
-    if row:
-        return row[0], row[1], row[2]
-    return None, None, None
-
-def list_yarn_names(yarn_type=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    if yarn_type:
-        cur.execute("""
-            SELECT DISTINCT name FROM yarn_prices
-            WHERE yarn_type = %s OR yarn_type = 'both'
-            ORDER BY name
-        """, (yarn_type,))
-    else:
-        cur.execute("""
-            SELECT DISTINCT name FROM yarn_prices
-            ORDER BY name
-        """)
-    names = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return names
-
-
-def save_yarn_price(name, yarn_type, count, denier, price_per_kg, valid_from):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO yarn_prices (name, yarn_type, count, denier, price_per_kg, valid_from)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (name, yarn_type, count, denier, price_per_kg, valid_from))
-    conn.commit()
-    conn.close()
-
-
-def get_latest_yarn_row(name, yarn_type=None):
+    return _qualities_cache(get_data_version(), db.quality_columns(columns)).get()
+
+@perf.cache_probe("yarn_price_map")
+def get_latest_yarn_price_map():
     """
-    Return latest full row for this yarn:
-    {id, name, yarn_type, count, denier, price_per_kg, valid_from}
+    Latest yarn prices, loaded ONCE and shared (read-only YarnTable).
+    Key: (name, yarn_type)
+    Value: row with price_per_kg, denier, count
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    if yarn_type:
-        cur.execute("""
-            SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
-            FROM yarn_prices
-            WHERE name = %s AND (yarn_type = %s OR yarn_type = 'both')
-            ORDER BY valid_from DESC, id DESC
-            LIMIT 1
-        """, (name, yarn_type))
-    else:
-        cur.execute("""
-            SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
-            FROM yarn_prices
-            WHERE name = %s
-            ORDER BY valid_from DESC, id DESC
-            LIMIT 1
-        """, (name,))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return None
-    return {
-        "id": row[0],
-        "name": row[1],
-        "yarn_type": row[2],
-        "count": row[3],
-        "denier": row[4],
-        "price_per_kg": row[5],
-        "valid_from": row[6],
-    }
+    return _yarn_price_map_cache(get_data_version()).get()
 
+@st.cache_resource(max_entries=2)
+def _recipe_batch_cache(data_version):
+    qualities = _qualities_cache(data_version, db.quality_columns(PRICING_SHEET_COLUMNS))
+    prices = _yarn_price_map_cache(data_version)
 
-def update_yarn_row(row_id, name, yarn_type, count, denier, price_per_kg, valid_from):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE yarn_prices
-        SET name = %s, yarn_type = %s, count = %s, denier = %s, price_per_kg = %s, valid_from = %s
-        WHERE id = %s
-    """, (name, yarn_type, count, denier, price_per_kg, valid_from, row_id))
-    conn.commit()
-    conn.close()
+    def load():
+        perf.cache_miss("recipe_batch")
+        rows = qualities.get()
+        batch = kernel.RecipeBatch.from_qualities(rows, prices.get())
+        catalog.register("recipe_batch", batch)
+        return rows, batch
 
+    return catalog.RefreshAhead("recipe_batch", load, ttl=None, depends=(qualities, prices))
 
-def delete_yarn_completely(name):
+
+@perf.cache_probe("recipe_batch")
+def priced_qualities():
     """
-    Delete ALL rows for this yarn name.
+    (qualities, batch): the PRICING_SHEET_COLUMNS rows and every one of them
+    resolved to costing inputs (numpy arrays, see kernel.py), position for
+    position. Shared, read-only.
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM yarn_prices WHERE name = %s", (name,))
-    conn.commit()
-    conn.close()
-
-def list_all_qualities():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, quality_name, created_at
-        FROM qualities
-        ORDER BY quality_name
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-def get_quality_by_id(q_id):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    # Get column names from Postgres information_schema
-    cur.execute("""
-        SELECT column_name
-        FROM information_schema.columns
-        WHERE table_name = 'qualities'
-        ORDER BY ordinal_position
-    """)
-    cols = [r[0] for r in cur.fetchall()]
-
-    cur.execute("SELECT * FROM qualities WHERE id = %s", (q_id,))
-    row = cur.fetchone()
-    conn.close()
-    if row:
-        return dict(zip(cols, row))
-    return None
-
-
-def save_quality(data):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        INSERT INTO qualities (
-            created_at, quality_name,
-            ends_mode, ends, reed, rs, borders, warp_denier,
-            warp_yarn_name, warp_yarn_price,
-            picks, weft_rs, weft_denier_mode, weft_denier, weft_count,
-            weft_yarn_name, weft_yarn_price,
-            weaving_rate_per_pick, grey_markup_percent,
-            rfd_charge_per_m, rfd_shortage_percent, rfd_markup_percent,
-            warp_weight_100, weft_weight_100, fabric_weight_100,
-            warp_cost_100, weft_cost_100, weaving_charge_100,
-            interest_on_yarn_100, final_grey_cost_100,
-            grey_sale_100, rfd_cost_100, rfd_sale_100,
-            include_interest,
-            wefts_json
-        )
-        VALUES (
-            %s, %s,
-            %s, %s, %s, %s, %s, %s,
-            %s, %s,
-            %s, %s, %s, %s, %s,
-            %s, %s,
-            %s, %s,
-            %s, %s, %s,
-            %s, %s, %s,
-            %s, %s, %s,
-            %s, %s,
-            %s, %s, %s,
-            %s, %s
-        )
-    """, (
-        data["created_at"], data["quality_name"],
-        data["ends_mode"], data["ends"], data["reed"], data["rs"], data["borders"], data["warp_denier"],
-        data["warp_yarn_name"], data["warp_yarn_price"],
-        data["picks"], data["weft_rs"], data["weft_denier_mode"], data["weft_denier"], data["weft_count"],
-        data["weft_yarn_name"], data["weft_yarn_price"],
-        data["weaving_rate_per_pick"], data["grey_markup_percent"],
-        data["rfd_charge_per_m"], data["rfd_shortage_percent"], data["rfd_markup_percent"],
-        data["warp_weight_100"], data["weft_weight_100"], data["fabric_weight_100"],
-        data["warp_cost_100"], data["weft_cost_100"], data["weaving_charge_100"],
-        data["interest_on_yarn_100"], data["final_grey_cost_100"],
-        data["grey_sale_100"], data["rfd_cost_100"], data["rfd_sale_100"],
-        bool(data.get("include_interest", True)),
-        normalize_json(data.get("wefts_json"))
-    ))
-
-    conn.commit()
-    conn.close()
-
-
-def update_quality(q_id, data):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        UPDATE qualities SET
-            created_at = %s,
-            quality_name = %s,
-
-            ends_mode = %s,
-            ends = %s,
-            reed = %s,
-            rs = %s,
-            borders = %s,
-            warp_denier = %s,
-
-            warp_yarn_name = %s,
-            warp_yarn_price = %s,
-
-            picks = %s,
-            weft_rs = %s,
-            weft_denier_mode = %s,
-            weft_denier = %s,
-            weft_count = %s,
-
-            weft_yarn_name = %s,
-            weft_yarn_price = %s,
-
-            weaving_rate_per_pick = %s,
-            grey_markup_percent = %s,
-
-            rfd_charge_per_m = %s,
-            rfd_shortage_percent = %s,
-            rfd_markup_percent = %s,
-
-            warp_weight_100 = %s,
-            weft_weight_100 = %s,
-            fabric_weight_100 = %s,
-
-            warp_cost_100 = %s,
-            weft_cost_100 = %s,
-            weaving_charge_100 = %s,
-
-            interest_on_yarn_100 = %s,
-            final_grey_cost_100 = %s,
-            grey_sale_100 = %s,
-            rfd_cost_100 = %s,
-            rfd_sale_100 = %s,
-
-            wefts_json = %s,
-            include_interest = %s
-        WHERE id = %s
-    """, (
-        data["created_at"],
-        data["quality_name"],
-
-        data["ends_mode"],
-        data["ends"],
-        data["reed"],
-        data["rs"],
-        data["borders"],
-        data["warp_denier"],
-
-        data["warp_yarn_name"],
-        data["warp_yarn_price"],
-
-        data["picks"],
-        data["weft_rs"],
-        data["weft_denier_mode"],
-        data["weft_denier"],
-        data["weft_count"],
-
-        data["weft_yarn_name"],
-        data["weft_yarn_price"],
-
-        data["weaving_rate_per_pick"],
-        data["grey_markup_percent"],
-
-        data["rfd_charge_per_m"],
-        data["rfd_shortage_percent"],
-        data["rfd_markup_percent"],
-
-        data["warp_weight_100"],
-        data["weft_weight_100"],
-        data["fabric_weight_100"],
-
-        data["warp_cost_100"],
-        data["weft_cost_100"],
-        data["weaving_charge_100"],
-
-        data["interest_on_yarn_100"],
-        data["final_grey_cost_100"],
-        data["grey_sale_100"],
-        data["rfd_cost_100"],
-        data["rfd_sale_100"],
-
-        normalize_json(data.get("wefts_json")),
-        bool(data["include_interest"]),
-        q_id
-    ))
-
-    conn.commit()
-    conn.close()
-
-
-def delete_quality(q_id):
-    """Delete a quality by id."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM qualities WHERE id = %s", (q_id,))
-    conn.commit()
-    conn.close()
+    return _recipe_batch_cache(get_data_version()).get()
+
+
+def recipe_batch():
+    """priced_qualities() batch alone – for lookups by id (batch.positions)."""
+    return priced_qualities()[1]
+
+@st.cache_resource(max_entries=2)
+def _yarn_usage_cache(data_version):
+    qualities = _qualities_cache(data_version, db.quality_columns(PRICING_SHEET_COLUMNS))
 
+    def load():
+        perf.cache_miss("yarn_usage")
+        rows = qualities.get()
+        return rows, impact.yarn_usage(rows)
+
+    return catalog.RefreshAhead("yarn_usage", load, ttl=None, depends=(qualities,))
+
+
+def yarn_usage():
+    """(qualities, {yarn name: positions in qualities}) of the qualities that link each yarn. Shared, read-only."""
+    return _yarn_usage_cache(get_data_version()).get()
+
+
+def warm_catalog_caches():
+    """Start loading the catalog caches in the background (no-op once they are loaded)."""
+    version = get_data_version()
+    for columns in (PRICING_SHEET_COLUMNS, COSTING_SHEET_COLUMNS):
+        _qualities_cache(version, db.quality_columns(columns)).warm()
+    _yarn_price_map_cache(version).warm()
+    _recipe_batch_cache(version).warm()
+    _yarn_usage_cache(version).warm()
+
+
+@st.cache_resource
+def start_catalog_warmup():
+    """Once per process: the first visitor's login screen already has the catalog loading."""
+    warm_catalog_caches()
+    return True
+
+@perf.timed("compute_dynamic_cost")
 def compute_dynamic_cost(q):
-    
+    """Recompute costing for a stored quality using the cached latest yarn prices."""
+    return core.compute_dynamic_cost(q, get_latest_yarn_price_map())
+
+# ---------------------------
+# Sheet exports (lazy, cached per data version)
+# ---------------------------
+
+# label -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Excel (XLSX)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+@perf.cache_probe("sheet_export")
+@st.cache_data(ttl=300, max_entries=32, show_spinner="Preparing download...")
+def build_sheet_export(sheet_name, data_version, variant, ext, _build_rows):
     """
-    Recompute costing using the recipe + latest yarn prices.
-    - Uses wefts_json if present (multi-weft).
-    - Falls back to single-weft fields if not.
+    Serialize a sheet to bytes.
+    Cache key is (sheet_name, data_version, variant, ext) – the builder is
+    not hashed, so a cached artifact is reused until the data (or the
+    filter variant) changes. The rows are only built on a cache miss, and
+    CSV / XLSX are written chunk by chunk as they are produced (export.py):
+    no DataFrame or whole-sheet string on the way to the bytes.
     """
-    yarn_price_map = get_latest_yarn_price_map()
+    perf.cache_miss("sheet_export")
+    import io
+
+    rows = _build_rows()
+    buf = io.BytesIO()
+    if ext in export.FORMATS:
+        for chunk in export.iter_export(ext, rows, sheet_name=sheet_name):
+            buf.write(chunk)
+    elif ext == "parquet":
+        import pandas as pd
 
-    # --- Warp: dynamic price & optional denier from yarn table ---
-    warp_denier = float(q["warp_denier"]) if q["warp_denier"] is not None else 0.0
-    warp_price = float(q["warp_yarn_price"]) if q["warp_yarn_price"] is not None else 0.0
+        pd.DataFrame(list(rows)).to_parquet(buf, index=False)
+    else:
+        raise ValueError(f"Unknown export format: {ext}")
+    return buf.getvalue()
 
-    if q.get("warp_yarn_name"):
-        row = yarn_price_map.get((q["warp_yarn_name"], "warp"))
-        if row:
-            if row["price_per_kg"] is not None:
-                warp_price = row["price_per_kg"]
-            if row["denier"] is not None:
-                warp_denier = row["denier"]  # if you want denier to follow yarn table
 
-    ends = float(q["ends"])
-    rs = float(q["rs"])
+def render_sheet_download(sheet_name, build_rows, variant=""):
+    """
+    Export controls for a sheet. `build_rows` is a callable returning the
+    rows to export (row dicts, any iterable – a generator keeps memory
+    flat); nothing is built or serialized until the user
+    clicks "Prepare download", and after that the cached artifact is
+    served until the data version (or `variant`, e.g. active filters) changes.
+    """
+    version = get_data_version()
+    ready_key = f"{sheet_name}_export_ready"
 
-    # --- Build weft list ---
-    # --- Build weft list ---
-    weft_entries = []
-    weft_details = []   # 👈 for per-weft breakdown
+    dc1, dc2 = st.columns([2, 1])
+    with dc1:
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key=f"{sheet_name}_export_fmt")
+    with dc2:
+        st.write("")
+        if st.button("Prepare download", key=f"{sheet_name}_export_prepare"):
+            st.session_state[ready_key] = (version, variant, fmt)
 
-    if q.get("wefts_json"):
-        # Multi-weft case
-        try:
-            stored_wefts = json.loads(q["wefts_json"])
-        except Exception:
-            stored_wefts = []
+    if st.session_state.get(ready_key) != (version, variant, fmt):
+        return
 
-        for wf in stored_wefts:
-            p = float(wf.get("picks", 0.0) or 0.0)
-            d = float(wf.get("denier", 0.0) or 0.0)
-            price = float(wf.get("price", 0.0) or 0.0)
-            mode = wf.get("mode", "denier")
-            cnt = wf.get("count", 0.0) or 0.0
-            yarn_name = wf.get("yarn_name")
+    ext, mime = EXPORT_FORMATS[fmt]
+    try:
+        data = build_sheet_export(sheet_name, version, variant, ext, build_rows)
+    except ImportError as e:
+        st.error(f"{fmt} export needs an extra package: {e.name or e}")
+        return
+
+    st.download_button(
+        f"Download as {fmt}",
+        data=data,
+        file_name=f"{sheet_name}.{ext}",
+        mime=mime,
+        key=f"{sheet_name}_export_download",
+    )
 
-            # Override from yarn table if yarn_name is linked
-            if yarn_name and yarn_name != "(manual price)":
-                row = yarn_price_map.get((yarn_name, "weft"))
-                if row:
-                    if row["price_per_kg"] is not None:
-                        price = row["price_per_kg"]
+# ---------------------------
+# Concurrent page loads
+# ---------------------------
 
-                    if mode == "denier" and row["denier"]:
-                        d = row["denier"]
+def _quality_id_from_label(label):
+    """Labels look like 'Name (ID 12)'."""
+    m = re.search(r"\(ID (\d+)\)$", label or "")
+    return int(m.group(1)) if m else None
 
-                    if mode == "count":
-                        cnt = row["count"]
-                        if cnt and cnt > 0:
-                            d = 5315.0 / cnt
 
-            # per-weft technical weight / 100 m (no shortage)
-            if p > 0 and d > 0:
-                weight_100 = (p * d * rs) / 90000.0
-            else:
-                weight_100 = 0.0
+def load_quality_page(select_key, with_price_map=True):
+    """
+    Load what a "pick a quality" page needs concurrently, so the page waits
+    about one DB round trip instead of three:
+      - the quality list,
+      - the quality currently selected in `select_key` (read from session
+        state before the selectbox is drawn),
+      - the yarn price map (warms the cache for compute_dynamic_cost).
+    Returns (qualities, prefetched) where prefetched is {id: quality row}.
+    """
+    prefetch_id = _quality_id_from_label(st.session_state.get(select_key))
+    loaded = aio.run_concurrently({
+        "qualities": (list_all_qualities,),
+        "quality": (get_quality_by_id, prefetch_id) if prefetch_id is not None else None,
+        "price_map": (get_latest_yarn_price_map,) if with_price_map else None,
+    })
+    prefetched = {prefetch_id: loaded["quality"]} if loaded["quality"] else {}
+    return loaded["qualities"], prefetched
 
-            if p > 0 and d > 0 and price > 0:
-                weft_entries.append({"picks": p, "denier": d, "price": price})
-
-            if p > 0 and d > 0:
-                weft_details.append({
-                    "label": f"Weft {len(weft_details) + 1}",
-                    "picks": p,
-                    "denier": d,
-                    "price": price,
-                    "weight_100": weight_100,
-                    "mode": mode,
-                    "count": cnt,
-                    "yarn_name": yarn_name,
-                })
-    else:
-        # Old single-weft records (no wefts_json)
-        p = float(q["picks"])
-        d = float(q["weft_denier"])
-        price = float(q["weft_yarn_price"])
-        mode = q.get("weft_denier_mode", "denier")
-        cnt = q.get("weft_count")
-        yarn_name = q.get("weft_yarn_name")
-
-        if yarn_name:
-            row = yarn_price_map.get((yarn_name, "weft"))
-            if row:
-                if row["price_per_kg"] is not None:
-                    price = row["price_per_kg"]
-                if mode == "denier" and row["denier"]:
-                    d = row["denier"]
-                if mode == "count":
-                    cnt = row["count"]
-                    if cnt and cnt > 0:
-                        d = 5315.0 / cnt
-
-        if p > 0 and d > 0 and price > 0:
-            weft_entries.append({"picks": p, "denier": d, "price": price})
-
-        if p > 0 and d > 0:
-            weight_100 = (p * d * rs) / 90000.0
-            weft_details.append({
-                "label": "Weft 1",
-                "picks": p,
-                "denier": d,
-                "price": price,
-                "weight_100": weight_100,
-                "mode": mode,
-                "count": cnt,
-                "yarn_name": yarn_name,
-            })
-
-    # --- Aggregate wefts to effective denier & price ---
-    total_picks = sum(w["picks"] for w in weft_entries)
-    num_for_den = sum(w["picks"] * w["denier"] for w in weft_entries)
-    num_for_price = sum(w["picks"] * w["denier"] * w["price"] for w in weft_entries)
-
-    if total_picks <= 0 or num_for_den <= 0:
-        # Fallback to stored single-weft values if something's off
-        total_picks = float(q["picks"])
-        eff_weft_denier = float(q["weft_denier"])
-        eff_weft_price = float(q["weft_yarn_price"])
-    else:
-        eff_weft_denier = num_for_den / total_picks
-        eff_weft_price = num_for_price / num_for_den
-
-    weaving_rate = float(q["weaving_rate_per_pick"])
-    grey_markup = float(q["grey_markup_percent"])
-    rfd_charge = float(q["rfd_charge_per_m"])
-    rfd_short = float(q["rfd_shortage_percent"])
-    rfd_markup = float(q["rfd_markup_percent"])
-
-    # 🔥 Use your existing costing function
-    cost = calculate_costing(
-        ends=ends,
-        warp_denier=warp_denier,
-        picks=total_picks,
-        weft_denier=eff_weft_denier,
-        rs=rs,
-        warp_yarn_price=warp_price,
-        weft_yarn_price=eff_weft_price,
-        weaving_rate_per_pick=weaving_rate,
-        grey_markup_percent=grey_markup,
-        rfd_charge_per_m=rfd_charge,
-        rfd_shortage_percent=rfd_short,
-        rfd_markup_percent=rfd_markup,
-        include_interest=bool(q.get("include_interest", True)),
+
+def get_quality(q_id, prefetched):
+    """get_quality_by_id, unless load_quality_page already fetched it."""
+    q = prefetched.get(q_id)
+    return q if q is not None else get_quality_by_id(q_id)
+
+
+# ---------------------------
+# Nearest-construction search
+# ---------------------------
+
+@st.cache_resource(ttl=3600)
+def similarity_index():
+    """
+    KD-tree over every saved recipe, shared by all sessions. Writes made
+    here update it in place (upsert / remove); the hourly rebuild picks up
+    writes made outside this app.
+    """
+    perf.cache_miss("similarity_index")
+    return similar.SimilarityIndex.build(db.list_qualities(similar.SIMILARITY_COLUMNS))
+
+
+def render_similar_qualities(recipe, exclude_id=None, k=10):
+    """Table of the k saved qualities closest to `recipe`, with current dynamic costs."""
+    import pandas as pd
+
+    index = similarity_index()
+    t0 = time.perf_counter()
+    found = index.nearest(recipe, k=k, exclude_id=exclude_id)
+    search_ms = (time.perf_counter() - t0) * 1000.0
+    if not found:
+        st.info("No saved qualities to compare with yet.")
+        return
+
+    by_id = {q["id"]: q for q in db.get_qualities_by_ids([q_id for q_id, _ in found])}
+    rows = []
+    for q_id, distance in found:
+        q = by_id.get(q_id)
+        if q is None:  # deleted outside this app since the last rebuild
+            continue
+        cost = cached_dynamic_cost(q)
+        rows.append({
+            "ID": q_id,
+            "Quality": q["quality_name"],
+            "Distance": round(distance, 2),
+            "Ends": q["ends"],
+            "Reed": q["reed"],
+            "RS": q["rs"],
+            "Warp denier": q["warp_denier"],
+            "Picks": q["picks"],
+            "Weft denier": round(q["weft_denier"] or 0, 1),
+            "Grey cost / m": round(cost["grey_cost_per_m"], 2),
+            "RFD cost / m": round(cost["rfd_cost_per_m"], 2),
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    st.caption(
+        f"Searched {len(index):,} recipes in {search_ms:.1f} ms. "
+        "Distance 0 = same construction (ends, reed, RS, warp denier, picks, weft deniers)."
     )
 
-    # Also return the aggregated weft info in case UI wants it
-    cost["_dynamic_total_picks"] = total_picks
-    cost["_dynamic_eff_weft_denier"] = eff_weft_denier
-    cost["_dynamic_eff_weft_price"] = eff_weft_price
-    cost["_weft_breakdown"] = weft_details
 
-    return cost
+# ---------------------------
+# Duplicate recipes
+# ---------------------------
 
-def calculate_costing(
-    ends, warp_denier, picks, weft_denier, rs,
-    warp_yarn_price, weft_yarn_price,
-    weaving_rate_per_pick, grey_markup_percent,
-    rfd_charge_per_m, rfd_shortage_percent, rfd_markup_percent,
-    include_interest=True,       # 👈 NEW
-):
-    
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def find_recipe_matches(recipe_hash, construction_hash, data_version):
+    return db.find_recipe_matches(recipe_hash, construction_hash)
 
-    # Base weights (NO shortage)
-    warp_weight_100 = (ends * warp_denier) / 90000.0
-    weft_weight_100 = (picks * weft_denier * rs) / 90000.0
 
-    # With shortage (for costing)
-    warp_weight_100_short = warp_weight_100 * 1.09
-    weft_weight_100_short = weft_weight_100 * 1.03
+def render_duplicate_warning(recipe):
+    """Warn when `recipe` (a quality-shaped dict) is already saved, exactly or as the same construction."""
+    matches = find_recipe_matches(*dedupe.recipe_hashes(recipe), get_data_version())
+    exact = [m for m in matches if m["exact"]]
+    near = [m for m in matches if not m["exact"]]
 
-    warp_cost_100 = warp_weight_100_short * warp_yarn_price
-    weft_cost_100 = weft_weight_100_short * weft_yarn_price
+    def _names(ms):
+        return ", ".join(f"{m['quality_name']} (ID {m['id']})" for m in ms)
 
-    fabric_weight_100 = warp_weight_100 + weft_weight_100  # technical, no shortage
+    if exact:
+        st.warning(f"⚠️ This exact recipe is already saved as: {_names(exact)}")
+    if near:
+        st.info(f"Same construction (other yarns, prices or charges) already saved as: {_names(near)}")
 
-    # Weaving (per meter, then per 100 m)
-    weaving_per_m = weaving_rate_per_pick * picks
-    weaving_charge_100 = weaving_per_m * 100.0
 
-    # 🔹 Interest on yarn – now optional
-    interest_on_yarn_100_full = (warp_cost_100 + weft_cost_100) * 0.04
-    interest_on_yarn_100 = interest_on_yarn_100_full if include_interest else 0.0
+# ---------------------------
+# Pricing snapshots
+# ---------------------------
 
-    # Grey cost
-    final_grey_cost_100 = warp_cost_100 + weft_cost_100 + weaving_charge_100 + interest_on_yarn_100
-    grey_cost_per_m = final_grey_cost_100 / 100.0
+@st.cache_data(ttl=300, show_spinner=False)
+def list_pricing_snapshots(data_version):
+    return db.list_pricing_snapshots()
 
-    # Grey sale with markup as margin on selling price
-    if grey_markup_percent == 0:
-        grey_sale_per_m = grey_cost_per_m
-    else:
-        grey_sale_per_m = grey_cost_per_m / (1 - grey_markup_percent / 100.0)
-    grey_sale_100 = grey_sale_per_m * 100.0
 
-    # RFD cost: (grey + RFD charge) * (1 + shortage%)
-    base_for_rfd = grey_cost_per_m + rfd_charge_per_m
-    rfd_cost_per_m = base_for_rfd * (1 + rfd_shortage_percent / 100.0)
+# Snapshots never change; the data version only refreshes the joined quality names.
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def get_pricing_snapshot(snapshot_id, data_version):
+    return db.get_pricing_snapshot(snapshot_id)
 
-    # RFD sale with markup as margin on selling price
-    if rfd_markup_percent == 0:
-        rfd_sale_per_m = rfd_cost_per_m
-    else:
-        rfd_sale_per_m = rfd_cost_per_m / (1 - rfd_markup_percent / 100.0)
-    rfd_cost_100 = rfd_cost_per_m * 100.0
-    rfd_sale_100 = rfd_sale_per_m * 100.0
-
-    return {
-        "warp_weight_100": warp_weight_100,
-        "weft_weight_100": weft_weight_100,
-        "fabric_weight_100": fabric_weight_100,
-        "warp_cost_100": warp_cost_100,
-        "weft_cost_100": weft_cost_100,
-        "weaving_charge_100": weaving_charge_100,
-        "interest_on_yarn_100": interest_on_yarn_100,
-        "final_grey_cost_100": final_grey_cost_100,
-        "grey_cost_per_m": grey_cost_per_m,
-        "grey_sale_per_m": grey_sale_per_m,
-        "grey_sale_100": grey_sale_100,
-        "rfd_cost_per_m": rfd_cost_per_m,
-        "rfd_sale_per_m": rfd_sale_per_m,
-        "rfd_cost_100": rfd_cost_100,
-        "rfd_sale_100": rfd_sale_100,
-    }
 
-def calculate_costing_multi_weft(
-    ends, warp_denier, rs,
-    warp_yarn_price,
-    weft_list,
-    weaving_rate_per_pick, grey_markup_percent,
-    rfd_charge_per_m, rfd_shortage_percent, rfd_markup_percent,
-    include_interest=True,
-):
-    
-    """
-    Multi-weft version of calculate_costing.
-    weft_list = [
-        {"picks": ..., "weft_denier": ..., "weft_yarn_price": ...},
-        ...
-    ]
-    """
-    # ---- Warp (same logic as before) ----
-    warp_weight_100 = (ends * warp_denier) / 90000.0
-    warp_weight_100_short = warp_weight_100 * 1.09
-    warp_cost_100 = warp_weight_100_short * warp_yarn_price
-
-    # ---- Sum over all wefts ----
-    total_weft_weight_100 = 0.0          # technical (no shortage)
-    total_weft_weight_100_short = 0.0    # with shortage
-    total_weft_cost_100 = 0.0
-    total_picks = 0.0
-
-    for w in weft_list:
-        picks = w["picks"]
-        weft_den = w["weft_denier"]
-        price = w["weft_yarn_price"]
-
-        weft_weight_100 = (picks * weft_den * rs) / 90000.0
-        weft_weight_100_short = weft_weight_100 * 1.03
-        weft_cost_100 = weft_weight_100_short * price
-
-        total_weft_weight_100 += weft_weight_100
-        total_weft_weight_100_short += weft_weight_100_short
-        total_weft_cost_100 += weft_cost_100
-        total_picks += picks
-
-    # ---- Fabric weight (technical) ----
-    fabric_weight_100 = warp_weight_100 + total_weft_weight_100
-
-    # ---- Weaving ----
-    weaving_per_m = weaving_rate_per_pick * total_picks
-    weaving_charge_100 = weaving_per_m * 100.0
-
-    # ---- Interest on yarn (respect toggle) ----
-    if include_interest:
-        interest_on_yarn_100 = (warp_cost_100 + total_weft_cost_100) * 0.04
-    else:
-        interest_on_yarn_100 = 0.0
+@st.cache_data(ttl=600, max_entries=16, show_spinner=False)
+def diff_pricing_snapshots(old_id, new_id, data_version):
+    return db.diff_pricing_snapshots(old_id, new_id)
 
-    # ---- Grey cost ----
-    final_grey_cost_100 = warp_cost_100 + total_weft_cost_100 + weaving_charge_100 + interest_on_yarn_100
-    grey_cost_per_m = final_grey_cost_100 / 100.0
 
-    # Grey sale with markup as margin on selling price
-    if grey_markup_percent == 0:
-        grey_sale_per_m = grey_cost_per_m
-    else:
-        grey_sale_per_m = grey_cost_per_m / (1 - grey_markup_percent / 100.0)
-    grey_sale_100 = grey_sale_per_m * 100.0
+SNAPSHOT_HEADERS = {
+    "weight": "Weight",
+    "grey_cost": "Grey Cost (₹/m)",
+    "grey_sale": "Grey Sale (₹/m)",
+    "rfd_cost": "RFD Cost (₹/m)",
+    "rfd_sale": "RFD Sale (₹/m)",
+}
 
-    # RFD cost: (grey + RFD charge) * (1 + shortage%)
-    base_for_rfd = grey_cost_per_m + rfd_charge_per_m
-    rfd_cost_per_m = base_for_rfd * (1 + rfd_shortage_percent / 100.0)
 
-    # RFD sale with markup as margin on selling price
-    if rfd_markup_percent == 0:
-        rfd_sale_per_m = rfd_cost_per_m
-    else:
-        rfd_sale_per_m = rfd_cost_per_m / (1 - rfd_markup_percent / 100.0)
-    rfd_cost_100 = rfd_cost_per_m * 100.0
-    rfd_sale_100 = rfd_sale_per_m * 100.0
-
-    return {
-        "warp_weight_100": warp_weight_100,
-        "weft_weight_100": total_weft_weight_100,
-        "fabric_weight_100": fabric_weight_100,
-        "warp_cost_100": warp_cost_100,
-        "weft_cost_100": total_weft_cost_100,
-        "weaving_charge_100": weaving_charge_100,
-        "interest_on_yarn_100": interest_on_yarn_100,
-        "final_grey_cost_100": final_grey_cost_100,
-        "grey_cost_per_m": grey_cost_per_m,
-        "grey_sale_per_m": grey_sale_per_m,
-        "grey_sale_100": grey_sale_100,
-        "rfd_cost_per_m": rfd_cost_per_m,
-        "rfd_sale_per_m": rfd_sale_per_m,
-        "rfd_cost_100": rfd_cost_100,
-        "rfd_sale_100": rfd_sale_100,
+def render_pricing_snapshots():
+    """Capture the Pricing Sheet as a dated snapshot, view one, or diff two."""
+    st.subheader("📸 Snapshots")
+    sc1, sc2 = st.columns([3, 1])
+    with sc1:
+        label = st.text_input("Label (optional)", placeholder="e.g. Price list sent to buyers",
+                              key="snapshot_label")
+    with sc2:
+        st.write("")
+        if st.button("📸 Capture snapshot", key="snapshot_capture"):
+            ensure_writable()
+            snapshot_id = snapshots.capture(label=label.strip() or None, batch=recipe_batch())
+            list_pricing_snapshots.clear()
+            st.success(f"Snapshot #{snapshot_id} saved.")
+
+    try:
+        _render_saved_snapshots()
+    except db.ReadOnlyError:
+        # snapshots are not in the local replica
+        st.caption("📴 Snapshots are unavailable while the database is offline.")
+
+
+def _render_saved_snapshots():
+    """View one saved snapshot or diff two (reads Postgres directly)."""
+    import pandas as pd
+
+    saved = list_pricing_snapshots(get_data_version())
+    if not saved:
+        st.caption("No snapshots yet.")
+        return
+
+    labels = {
+        f"#{s['id']} · {s['taken_at']:%Y-%m-%d %H:%M}" + (f" · {s['label']}" if s["label"] else ""): s["id"]
+        for s in saved
     }
+    mode = st.radio("Show", ["One snapshot", "Compare two"], horizontal=True, key="snapshot_mode")
+    if mode == "One snapshot":
+        chosen = st.selectbox("Snapshot", list(labels), key="snapshot_view")
+        rows = get_pricing_snapshot(labels[chosen], get_data_version())
+        df = pd.DataFrame([{
+            "ID": r["quality_id"],
+            "Quality": r["quality_name"] or "(deleted)",
+            **{head: round(r[col], 3 if col == "weight" else 2) for col, head in SNAPSHOT_HEADERS.items()},
+        } for r in rows])
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        return
+
+    if len(labels) < 2:
+        st.caption("Capture a second snapshot to compare.")
+        return
+    names = list(labels)
+    dc1, dc2 = st.columns(2)
+    with dc1:
+        old_label = st.selectbox("From (older)", names, index=1, key="snapshot_old")
+    with dc2:
+        new_label = st.selectbox("To (newer)", names, index=0, key="snapshot_new")
+    t0 = time.perf_counter()
+    rows = diff_pricing_snapshots(labels[old_label], labels[new_label], get_data_version())
+    diff_ms = (time.perf_counter() - t0) * 1000.0
+    if not rows:
+        st.info("No price moved between these snapshots.")
+        return
+
+    def _delta(r, col):
+        old, new = r[f"old_{col}"], r[f"new_{col}"]
+        return round(new - old, 2) if old is not None and new is not None else None
+
+    df = pd.DataFrame([{
+        "ID": r["quality_id"],
+        "Quality": r["quality_name"] or "(deleted)",
+        "Status": r["status"],
+        "Grey Sale then": r["old_grey_sale"],
+        "Grey Sale now": r["new_grey_sale"],
+        "Grey Sale Δ": _delta(r, "grey_sale"),
+        "RFD Sale then": r["old_rfd_sale"],
+        "RFD Sale now": r["new_rfd_sale"],
+        "RFD Sale Δ": _delta(r, "rfd_sale"),
+        "Weight Δ": _delta(r, "weight"),
+    } for r in rows]).round(2)
+    st.dataframe(df, hide_index=True, use_container_width=True)
+    st.caption(f"{len(rows):,} qualities moved (biggest RFD sale change first) – compared in {diff_ms:.0f} ms.")
+
+
+# ---------------------------
+# Costing Sheet: filter / sort / paginate
+# ---------------------------
 
-def calculate_deal_margin(
-    cost_with_interest_per_m,
-    interest_per_m,
-    deal_price_per_m,
-    payment_mode,        # "net" or "discount"
-    discount_percent,
-    brokerage_percent,
-    quantity_m,
-):
-    # ---- Discount ----
-    discount_amt = deal_price_per_m * (discount_percent / 100.0)
-    price_after_discount = deal_price_per_m - discount_amt
-
-    # ---- Brokerage (after discount) ----
-    brokerage_amt = price_after_discount * (brokerage_percent / 100.0)
-    realised_price = price_after_discount - brokerage_amt
-
-    # ---- Interest logic (ONLY CHANGE HERE) ----
-    # Full interest is 4%, but even discounted deals carry ~2%
-    effective_interest = interest_per_m / 2.0
-
-    if payment_mode == "discount":
-        actual_cost = cost_with_interest_per_m - (interest_per_m / 2.0)
-        interest_gain = interest_per_m / 2.0
+@st.cache_resource(ttl=300, max_entries=4)
+def _dynamic_cost_memo(data_version):
+    # quality id -> compute_dynamic_cost result, shared by all sessions
+    return {}
+
+
+def cached_dynamic_cost(q):
+    """compute_dynamic_cost(q), memoized per quality id for the current data version."""
+    memo = _dynamic_cost_memo(get_data_version())
+    cost = memo.get(q["id"])
+    if cost is None:
+        perf.cache_miss("dynamic_cost")
+        cost = compute_dynamic_cost(q)
+        memo[q["id"]] = cost
     else:
-        actual_cost = cost_with_interest_per_m
-        interest_gain = 0.0
-
-    profit_per_m = realised_price - actual_cost
-    total_profit = profit_per_m * quantity_m
-
-    return {
-        "realised_price": realised_price,
-        "discount_amt": discount_amt,
-        "brokerage_amt": brokerage_amt,
-        "actual_cost": actual_cost,
-        "interest_gain": interest_gain,
-        "profit_per_m": profit_per_m,
-        "total_profit": total_profit,
-    }
+        perf.cache_hit("dynamic_cost")
+    return cost
 
 # ---------------------------
 # Streamlit UI
 # ---------------------------
 
 st.set_page_config(page_title="Fabric Costing App", layout="wide")
+start_catalog_warmup()
 
 # 🔒 Password gate – everything below runs only after correct password
 if not check_password():
@@ -828,6 +617,8 @@ st.title("🧵 Fabric Costing App")
 if "scratch_weft_rows" not in st.session_state:
     st.session_state["scratch_weft_rows"] = 1
 
+follow_replica()
+
 page = st.sidebar.radio(
     "Go to",
     [
@@ -837,10 +628,127 @@ page = st.sidebar.radio(
         "🔍 Search Qualities",
         "📄 Pricing Sheet",
         "📊 Costing Sheet",
+        "✏️ Bulk Edit Charges",
+        "🎯 Target Price Solver",
+        "🧵 Weft Mix Optimizer",
         "💰 Deal Margin Calculator"
     ]
 )
 
+render_replica_status()
+
+# ⏱ Opt-in instrumentation (sidebar toggle, or FABRIC_PERF=1 for every rerun)
+perf_enabled = st.sidebar.checkbox("⏱ Performance panel", key="perf_panel_on") or perf.enabled_by_env()
+if perf_enabled:
+    perf.start_run(page)
+
+
+def render_perf_panel(stats):
+    d = stats.to_dict()
+    with st.sidebar.expander("⏱ Performance (this rerun)", expanded=True):
+        st.metric("Wall time", f"{d['wall_ms']:.0f} ms")
+        st.write(f"Queries: **{d['queries']}** on {d['connections']} connection(s), {d['query_ms']:.0f} ms")
+        st.write(f"Rows fetched: **{d['rows']}**")
+        if d["spans"]:
+            st.markdown("**Timed spans**")
+            st.table([{"span": k, **v} for k, v in d["spans"].items()])
+        if d["cache"]:
+            st.markdown("**Caches**")
+            st.table([{"cache": k, **v} for k, v in d["cache"].items()])
+        catalog_mem = catalog.memory_report()
+        if catalog_mem:
+            st.markdown("**Shared catalog caches**")
+            st.table(catalog_mem)
+        slowest = tracing.snapshot()[:5]
+        if slowest:
+            st.markdown("**DB time by function (since start)**")
+            st.table([
+                {"function": r["function"], "calls": r["count"], "avg ms": r["avg_ms"], "total ms": r["sum_ms"]}
+                for r in slowest
+            ])
+
+
+def end_perf_run():
+    """Close this rerun's perf record (appends to the log) and show the panel."""
+    stats = perf.finish_run()
+    if stats is not None:
+        render_perf_panel(stats)
+
+    # Optional OpenMetrics text file (e.g. for a node_exporter textfile collector)
+    metrics_file = os.getenv("FABRIC_METRICS_FILE")
+    if metrics_file:
+        try:
+            tracing.write_openmetrics(metrics_file)
+        except OSError:
+            pass
+
+
+def stop_page():
+    """st.stop() for page code – still closes the perf record first."""
+    end_perf_run()
+    st.stop()
+
+
+def ensure_writable():
+    """Call before a write: stops the page while the database is unreachable (replica serving reads)."""
+    if db.read_only():
+        st.error("📴 The database can't be reached right now – the app is read-only. Try again shortly.")
+        stop_page()
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def latest_yarn_dates(data_version):
+    """{(name, yarn_type): valid_from of its latest row} – exact types, the slots the price map keys."""
+    out = {}
+    for r in db.list_yarn_prices():  # latest first, same order as the latest-price query
+        out.setdefault((r["name"], r["yarn_type"]), r["valid_from"])
+    return out
+
+
+def render_price_change_impact(new_row):
+    """Preview of saving a yarn price: every quality whose cost moves, old vs new, and the catalog-wide delta."""
+    qualities, usage = yarn_usage()
+    if new_row["name"] not in usage:
+        st.caption("No saved quality uses this yarn – saving changes no costs.")
+        return
+    dates = latest_yarn_dates(get_data_version())
+    key = (new_row["name"], new_row["yarn_type"])
+    # the saved row only becomes the latest of its own type (valid_from DESC with NULLs first, then newest id)
+    if key in dates and (dates[key] is None or dates[key] > new_row["valid_from"]):
+        st.caption(f"A {new_row['yarn_type']} price valid from {dates[key] or '(no date)'} stays the latest – "
+                   "saving this row changes no costs.")
+        return
+
+    res = impact.price_change_impact(qualities, get_latest_yarn_price_map(), usage, new_row)
+    changed = res["changed"]
+    if not changed.any():
+        st.caption(f"{len(changed)} qualities use this yarn; none of their costs change.")
+        return
+
+    before = {k: v[changed] for k, v in res["before"].items()}
+    after = {k: v[changed] for k, v in res["after"].items()}
+    d_grey = after["grey_cost_per_m"] - before["grey_cost_per_m"]
+    d_rfd = after["rfd_cost_per_m"] - before["rfd_cost_per_m"]
+
+    st.markdown(f"**Impact:** {int(changed.sum())} of {len(qualities)} qualities change")
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Grey cost Δ, catalog total (₹/m)", f"{np.nansum(d_grey):+,.2f}")
+    m2.metric("RFD cost Δ, catalog total (₹/m)", f"{np.nansum(d_rfd):+,.2f}")
+    m3.metric("RFD cost Δ, avg per changed quality", f"{np.nanmean(d_rfd):+.2f}")
+
+    import pandas as pd
+    positions = res["positions"][changed].tolist()
+    df = pd.DataFrame({
+        "Quality": [qualities[i]["quality_name"] for i in positions],
+        "Grey cost/m (old)": before["grey_cost_per_m"],
+        "Grey cost/m (new)": after["grey_cost_per_m"],
+        "Grey Δ": d_grey,
+        "RFD cost/m (old)": before["rfd_cost_per_m"],
+        "RFD cost/m (new)": after["rfd_cost_per_m"],
+        "RFD Δ": d_rfd,
+    }).round(2)
+    st.dataframe(df.sort_values("RFD Δ", key=abs, ascending=False), hide_index=True, use_container_width=True)
+
 # ---------------------------
 # Page: Yarn Prices
 # ---------------------------
@@ -848,10 +756,11 @@ if page == "🧶 Yarn Prices":
     st.header("🧶 Manage Yarn Prices")
 
     # Add / update yarn
-    with st.form("add_yarn"):
+    # (plain widgets, not a form: the impact preview below follows every edit)
+    with st.container(border=True):
         col1, col2 = st.columns(2)
         with col1:
-            name = st.text_input("Yarn name", placeholder="e.g. 120D Poly Warp")
+            name = st.text_input("Yarn name", placeholder="e.g. 120D Poly Warp").strip()
             yarn_type = st.selectbox("Yarn type", ["warp", "weft", "both"])
             price_per_kg = st.number_input("Price per kg (₹)", min_value=0.0, step=0.1)
         with col2:
@@ -859,35 +768,29 @@ if page == "🧶 Yarn Prices":
             denier = st.number_input("Denier (optional)", min_value=0.0, step=0.1, value=0.0)
             valid_from = st.date_input("Valid from", value=date.today())
 
-        submitted = st.form_submit_button("Save yarn price")
+        new_row = {
+            "name": name,
+            "yarn_type": yarn_type,
+            "count": count if count > 0 else None,
+            "denier": denier if denier > 0 else None,
+            "price_per_kg": price_per_kg,
+            "valid_from": valid_from.isoformat(),
+        }
+        if name and price_per_kg > 0:
+            render_price_change_impact(new_row)
 
-        if submitted:
+        if st.button("Save yarn price"):
             if not name or price_per_kg <= 0:
                 st.error("Please enter a yarn name and a valid price.")
             else:
-                save_yarn_price(
-                    name=name,
-                    yarn_type=yarn_type,
-                    count=count if count > 0 else None,
-                    denier=denier if denier > 0 else None,
-                    price_per_kg=price_per_kg,
-                    valid_from=valid_from.isoformat()
-                )
-                st.cache_data.clear()   # 🔥 THIS LINE
+                ensure_writable()
+                save_yarn_price(**new_row)
+                invalidate_caches()
                 st.success("Yarn price saved as latest for this yarn.")
 
     st.subheader("Existing yarn prices (latest first)")
-    conn = get_conn()
-    df = None
-    try:
-        import pandas as pd
-        df = pd.read_sql_query("""
-            SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
-            FROM yarn_prices
-            ORDER BY date(valid_from) DESC, id DESC
-        """, conn)
-    finally:
-        conn.close()
+    import pandas as pd
+    df = pd.DataFrame(db.list_yarn_prices())
 
     if df is not None and not df.empty:
         st.dataframe(df, use_container_width=True)
@@ -953,6 +856,7 @@ if page == "🧶 Yarn Prices":
             b1, b2 = st.columns(2)
             with b1:
                 if st.button("💾 Save changes to this yarn", key=f"save_yarn_{selected_yarn}"):
+                    ensure_writable()
                     update_yarn_row(
                         row_id=row["id"],
                         name=new_name,
@@ -962,12 +866,13 @@ if page == "🧶 Yarn Prices":
                         price_per_kg=new_price,
                         valid_from=new_valid_from.isoformat()
                     )
-                    st.cache_data.clear()
+                    invalidate_caches()
                     st.success("Yarn updated successfully.")
             with b2:
                 if st.button("🗑 Delete this yarn completely", key=f"delete_yarn_{selected_yarn}"):
+                    ensure_writable()
                     delete_yarn_completely(selected_yarn)
-                    st.cache_data.clear()
+                    invalidate_caches()
                     st.warning(f"Yarn '{selected_yarn}' deleted. Reload page to refresh.")
         else:
             st.info("No data found for this yarn.")
@@ -1193,20 +1098,43 @@ elif page == "➕ New Costing":
         key="include_interest_new"
     )
 
+    # 🔎 Duplicate check, live while the recipe is entered (same weft filter as the save below)
+    preview_wefts = [
+        wf for wf in wefts
+        if (wf.get("picks") or 0) > 0 and (wf.get("denier") or 0) > 0 and (wf.get("price") or 0) > 0
+    ]
+    preview_ends = ends if ends_mode == "direct" else (reed or 0) * (rs or 0) + (borders or 0)
+    if preview_wefts and preview_ends and warp_denier > 0 and rs > 0:
+        render_duplicate_warning({
+            "ends": preview_ends,
+            "reed": reed,
+            "rs": rs,
+            "warp_denier": warp_denier,
+            "warp_yarn_name": warp_yarn_name,
+            "warp_yarn_price": warp_yarn_price,
+            "wefts_json": preview_wefts,
+            "weaving_rate_per_pick": weaving_rate_per_pick,
+            "grey_markup_percent": grey_markup_percent,
+            "rfd_charge_per_m": rfd_charge_per_m,
+            "rfd_shortage_percent": rfd_shortage_percent,
+            "rfd_markup_percent": rfd_markup_percent,
+            "include_interest": include_interest_new,
+        })
+
     if st.button("Calculate & Save"):
         # ✅ Basic validation (warp + RS etc.)
         if not quality_name:
             st.error("Please enter a quality name.")
-            st.stop()
+            stop_page()
         elif warp_denier <= 0 or warp_yarn_price <= 0:
             st.error("Please enter valid warp yarn denier/price.")
-            st.stop()
+            stop_page()
         elif rs is None or rs <= 0:
             st.error("Please enter a valid RS.")
-            st.stop()
+            stop_page()
         elif grey_markup_percent >= 100 or rfd_markup_percent >= 100:
             st.error("Markup % must be less than 100 (it's margin on sale).")
-            st.stop()
+            stop_page()
 
         # ✅ Build wefts list from session
         raw_wefts = st.session_state.get("new_costing_wefts", [])
@@ -1241,7 +1169,7 @@ elif page == "➕ New Costing":
 
         if not valid_wefts:
             st.error("Please enter at least one valid weft (picks, denier and price > 0).")
-            st.stop()
+            stop_page()
 
         # 🔢 Effective weft values for the existing single-weft formula
         # We want weight and cost to match sums over all wefts.
@@ -1252,11 +1180,11 @@ elif page == "➕ New Costing":
         if ends_mode == "direct":
             if ends is None or ends <= 0:
                 st.error("Please enter valid ends.")
-                st.stop()
+                stop_page()
         else:
             if reed is None or reed <= 0:
                 st.error("Please enter a valid reed.")
-                st.stop()
+                stop_page()
             if borders is None:
                 borders = 0.0
             ends = reed * rs + borders
@@ -1326,8 +1254,10 @@ elif page == "➕ New Costing":
             "wefts_json": json.dumps(valid_wefts),
         }
 
-        save_quality(data)
-        st.cache_data.clear()
+        ensure_writable()
+        q_id = save_quality(data)
+        similarity_index().upsert(q_id, data)
+        invalidate_caches()
         st.success("Costing calculated and saved.")
 
         st.markdown("### Results (per meter)")
@@ -1371,16 +1301,16 @@ elif page == "🔁 What-if Costing":
 
     # ---------- MODE 1: EXISTING QUALITY AS BASE ----------
     if mode == "Use existing quality as base":
-        qualities = list_all_qualities()
+        qualities, prefetched = load_quality_page("what_if_base_quality", with_price_map=False)
         if not qualities:
             st.info("No qualities saved yet.")
         else:
             label_to_id = {f"{q[1]} (ID {q[0]})": q[0] for q in qualities}
             labels = ["-- Select quality --"] + list(label_to_id.keys())
-            selected_label = st.selectbox("Select base quality", labels)
+            selected_label = st.selectbox("Select base quality", labels, key="what_if_base_quality")
 
             if selected_label != "-- Select quality --":
-                q = get_quality_by_id(label_to_id[selected_label])
+                q = get_quality(label_to_id[selected_label], prefetched)
                 if not q:
                     st.error("Could not load this quality.")
                 else:
@@ -1930,6 +1860,15 @@ elif page == "🔁 What-if Costing":
                             f"Denier used {weft_den_val:.2f}, Price {row['price']} ₹/kg"
                         )
 
+                st.markdown("### Closest saved constructions")
+                render_similar_qualities({
+                    "ends": sc_ends,
+                    "reed": sc_reed if sc_ends_mode == "calc" else None,
+                    "rs": sc_rs,
+                    "warp_denier": sc_warp_denier,
+                    "wefts_json": [{"picks": w["picks"], "denier": w["weft_denier"]} for w in active_wefts],
+                })
+
 
 # ---------------------------
 # Page: Search Qualities
@@ -1941,7 +1880,7 @@ elif page == "🔁 What-if Costing":
 elif page == "🔍 Search Qualities":
     st.header("🔍 Search Saved Qualities")
 
-    qualities = list_all_qualities()
+    qualities, prefetched = load_quality_page("search_quality_select")
     if not qualities:
         st.info("No qualities saved yet.")
     else:
@@ -1956,7 +1895,7 @@ elif page == "🔍 Search Qualities":
 
         if selected_label != "-- Select quality --":
             selected_id = label_to_id[selected_label]
-            q = get_quality_by_id(selected_id)
+            q = get_quality(selected_id, prefetched)
 
             if q:
                 st.markdown(f"### {q['quality_name']}")
@@ -1965,7 +1904,7 @@ elif page == "🔍 Search Qualities":
                 # SINGLE radio with explicit key to avoid duplicate id
                 view_mode = st.radio(
                     "View mode",
-                    ["Summary", "Recipe", "Details", "Edit"],
+                    ["Summary", "Recipe", "Details", "Similar", "Edit"],
                     horizontal=True,
                     key="quality_view_mode"
                 )
@@ -2114,6 +2053,11 @@ elif page == "🔍 Search Qualities":
                         st.write(f"RFD cost / m: {rfd_cost_per_m:.2f} ₹/m")
                         st.write(f"RFD sale / m: {rfd_sale_per_m:.2f} ₹/m")
 
+                # ---------- SIMILAR ----------
+                elif view_mode == "Similar":
+                    st.subheader("Closest saved constructions")
+                    render_similar_qualities(q, exclude_id=selected_id)
+
                 # ---------- EDIT ----------
                 elif view_mode == "Edit":
                     st.subheader("Edit Quality (overwrite)")
@@ -2466,13 +2410,15 @@ elif page == "🔍 Search Qualities":
                                 "wefts_json": json.dumps(valid_wefts),
                             }
 
+                            ensure_writable()
                             try:
                                 update_quality(selected_id, upd)
-                                st.cache_data.clear()
+                                similarity_index().upsert(selected_id, upd)
+                                invalidate_caches()
                             except Exception as e:
                                 st.error("Update failed")
                                 st.exception(e)
-                                st.stop()
+                                stop_page()
                             st.session_state["quality_updated"] = True
                             st.success("Quality updated (overwritten).")
                             
@@ -2482,8 +2428,10 @@ elif page == "🔍 Search Qualities":
                         "🗑 Delete this quality",
                         key=f"delete_quality_{selected_id}"
                     ):
+                        ensure_writable()
                         delete_quality(selected_id)
-                        st.cache_data.clear()
+                        similarity_index().remove(selected_id)
+                        invalidate_caches()
                         st.success(f"Quality '{q['quality_name']}' deleted.")
 
 # ---------------------------
@@ -2492,31 +2440,14 @@ elif page == "🔍 Search Qualities":
 elif page == "📄 Pricing Sheet":
     st.header("📄 Pricing Sheet")
 
-    qualities = list_all_qualities_full()
+    qualities = list_qualities(PRICING_SHEET_COLUMNS)
     if not qualities:
         st.info("No qualities saved yet.")
     else:
         import pandas as pd
 
-        rows = []
-        for q in qualities:
-            q_name = q["quality_name"]
-
-            # 🔥 dynamic recalc using latest yarn prices + multi-weft
-            cost = compute_dynamic_cost(q)
-
-            warp_w_100 = cost["warp_weight_100"]
-            weft_w_100 = cost["weft_weight_100"]
-
-            # your preferred single weight column:
-            fabric_weight_cost = warp_w_100 * 1.09 + weft_w_100
-
-            rows.append({
-                "Quality": q_name,
-                "Weight": round(fabric_weight_cost, 3),
-                "Grey Sale (₹/m)": round(cost["grey_sale_per_m"], 2),
-                "RFD Sale (₹/m)": round(cost["rfd_sale_per_m"], 2),
-            })
+        # 🔥 dynamic recalc using latest yarn prices + multi-weft
+        rows = [pricing_sheet_row(q, compute_dynamic_cost(q)) for q in qualities]
 
         if not rows:
             st.info("No qualities found.")
@@ -2524,67 +2455,496 @@ elif page == "📄 Pricing Sheet":
             df = pd.DataFrame(rows)
             st.dataframe(df, use_container_width=True)
 
-            csv = df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "Download as CSV",
-                data=csv,
-                file_name="pricing_sheet.csv",
-                mime="text/csv"
+            # the export is costed and written chunk by chunk from the quality rows, not from this table
+            render_sheet_download(
+                "pricing_sheet",
+                lambda: export.sheet_rows(qualities, get_latest_yarn_price_map(), pricing_sheet_row),
             )
 
+        render_pricing_snapshots()
+
 # ---------------------------
 # Page: Costing Sheet
 # ---------------------------
 elif page == "📊 Costing Sheet":
     st.header("📊 Costing Sheet")
 
-    qualities = list_all_qualities_full()
+    qualities = list_qualities(COSTING_SHEET_COLUMNS)
     if not qualities:
         st.info("No qualities saved yet.")
     else:
         import pandas as pd
 
-        rows = []
+        # ---- Filters & sorting (applied BEFORE costing / rendering) ----
+        with st.expander("🔎 Filter & sort", expanded=True):
+            f1, f2, f3 = st.columns(3)
+            with f1:
+                name_query = st.text_input("Quality name contains", key="cs_name_query")
+                markup_label = st.radio(
+                    "Margin band on", ["Grey markup %", "RFD markup %"],
+                    horizontal=True, key="cs_markup_field"
+                )
+                mk1, mk2 = st.columns(2)
+                with mk1:
+                    markup_min = st.number_input("Margin % from", min_value=0.0, step=0.5, key="cs_markup_min")
+                with mk2:
+                    markup_max = st.number_input("Margin % to (0 = any)", min_value=0.0, step=0.5, key="cs_markup_max")
+            with f2:
+                wt1, wt2 = st.columns(2)
+                with wt1:
+                    weight_min = st.number_input("Weight from", min_value=0.0, step=0.1, key="cs_weight_min")
+                with wt2:
+                    weight_max = st.number_input("Weight to (0 = any)", min_value=0.0, step=0.1, key="cs_weight_max")
+                rd1, rd2 = st.columns(2)
+                with rd1:
+                    reed_min = st.number_input("Reed from", min_value=0.0, step=1.0, key="cs_reed_min")
+                with rd2:
+                    reed_max = st.number_input("Reed to (0 = any)", min_value=0.0, step=1.0, key="cs_reed_max")
+                pk1, pk2 = st.columns(2)
+                with pk1:
+                    picks_min = st.number_input("Picks from", min_value=0.0, step=1.0, key="cs_picks_min")
+                with pk2:
+                    picks_max = st.number_input("Picks to (0 = any)", min_value=0.0, step=1.0, key="cs_picks_max")
+            with f3:
+                sort_by = st.selectbox(
+                    "Sort by",
+                    list(COSTING_SHEET_RECIPE_SORTS) + COSTING_SHEET_COST_SORTS,
+                    key="cs_sort_by"
+                )
+                sort_desc = st.checkbox("Descending", key="cs_sort_desc")
+                page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1, key="cs_page_size")
+                show_totals = st.checkbox("Show summary for all matches", key="cs_show_totals")
+
+        def _rng(lo, hi):
+            return (lo or None, hi or None)
+
+        matches = filter_qualities(
+            qualities,
+            name_query=name_query,
+            reed_range=_rng(reed_min, reed_max),
+            picks_range=_rng(picks_min, picks_max),
+            markup_field="grey_markup_percent" if markup_label.startswith("Grey") else "rfd_markup_percent",
+            markup_range=_rng(markup_min, markup_max),
+        )
 
-        for q in qualities:
-            q_name = q["quality_name"]
+        weight_range = _rng(weight_min, weight_max)
+        weight_filter_on = weight_range != (None, None)
 
-            # 🔥 Dynamic recompute (latest yarn prices + multi-weft)
-            cost = compute_dynamic_cost(q)
+        if sort_by in COSTING_SHEET_RECIPE_SORTS:
+            matches.sort(key=COSTING_SHEET_RECIPE_SORTS[sort_by], reverse=sort_desc)
 
-            warp_w_100 = cost["warp_weight_100"]
-            weft_w_100 = cost["weft_weight_100"]
+        # Cost-dependent filter / sort needs every match costed (memoized per data version)
+        costed_rows = None
+        if weight_filter_on or sort_by in COSTING_SHEET_COST_SORTS:
+            costed_rows = [costing_sheet_row(q, cached_dynamic_cost(q)) for q in matches]
+            if weight_filter_on:
+                costed_rows = [r for r in costed_rows if in_range(r["Weight"], *weight_range)]
+            if sort_by in COSTING_SHEET_COST_SORTS:
+                costed_rows.sort(key=lambda r: r[sort_by], reverse=sort_desc)
 
-            # SAME weight logic as pricing sheet
-            fabric_weight_costing = warp_w_100 * 1.09 + weft_w_100
+        total_matches = len(costed_rows) if costed_rows is not None else len(matches)
 
-            # 🔑 Picks: use dynamic total picks if present
-            total_picks = cost.get("_dynamic_total_picks", q.get("picks"))
+        if total_matches == 0:
+            st.info("No qualities found.")
+        else:
+            num_pages = max(1, -(-total_matches // page_size))
+            # filters may have shrunk the result: keep the page number in range
+            if st.session_state.get("cs_page_no", 1) > num_pages:
+                st.session_state["cs_page_no"] = num_pages
+
+            pg1, pg2 = st.columns([1, 3])
+            with pg1:
+                page_no = st.number_input(
+                    "Page", min_value=1, max_value=num_pages, step=1, key="cs_page_no"
+                )
+            with pg2:
+                st.caption(f"{total_matches} of {len(qualities)} qualities match · page {page_no} of {num_pages}")
 
-            rows.append({
-                "Quality": q_name,
-                "Weight": round(fabric_weight_costing, 3),
-                "Grey Cost (₹/m)": round(cost["grey_cost_per_m"], 2),
-                "Grey Sale (₹/m)": round(cost["grey_sale_per_m"], 2),
-                "RFD Cost (₹/m)": round(cost["rfd_cost_per_m"], 2),
-                "RFD Sale (₹/m)": round(cost["rfd_sale_per_m"], 2),
-                "Reed": q.get("reed"),
-                "Picks": round(total_picks, 1) if total_picks is not None else None,
-            })
+            start = (int(page_no) - 1) * page_size
+            end = start + page_size
 
-        if not rows:
-            st.info("No qualities found.")
+            # Only the visible slice is costed (when not already) and shipped to the browser
+            if costed_rows is not None:
+                page_rows = costed_rows[start:end]
+            else:
+                page_rows = [costing_sheet_row(q, cached_dynamic_cost(q)) for q in matches[start:end]]
+
+            st.dataframe(pd.DataFrame(page_rows), use_container_width=True, hide_index=True)
+
+            if show_totals:
+                # every match costed in one kernel evaluation – arrays, not a row dict per quality
+                cost = kernel.RecipeBatch.from_qualities(matches, get_latest_yarn_price_map()).evaluate()
+                tdf = pd.DataFrame({
+                    "Weight": sheet_weight(cost),
+                    "Grey Cost (₹/m)": cost["grey_cost_per_m"],
+                    "Grey Sale (₹/m)": cost["grey_sale_per_m"],
+                    "RFD Cost (₹/m)": cost["rfd_cost_per_m"],
+                    "RFD Sale (₹/m)": cost["rfd_sale_per_m"],
+                })
+                if weight_filter_on:
+                    lo, hi = weight_range
+                    # same test as the sheet rows (weight rounded to 3 places)
+                    tdf = tdf[tdf["Weight"].round(3).between(
+                        float("-inf") if lo is None else lo, float("inf") if hi is None else hi
+                    )]
+                agg = tdf.agg(["mean", "min", "max"])
+                st.markdown("**Summary of all matches**")
+                t1, t2, t3, t4 = st.columns(4)
+                t1.metric("Qualities", f"{len(tdf)}")
+                t2.metric("Avg weight", f"{agg.loc['mean', 'Weight']:.3f}")
+                t3.metric("Avg grey cost / m (₹)", f"{agg.loc['mean', 'Grey Cost (₹/m)']:.2f}")
+                t4.metric("Avg RFD sale / m (₹)", f"{agg.loc['mean', 'RFD Sale (₹/m)']:.2f}")
+                st.dataframe(agg.round(3), use_container_width=True)
+
+            filter_variant = repr((
+                name_query, markup_label, markup_min, markup_max, weight_min, weight_max,
+                reed_min, reed_max, picks_min, picks_max, sort_by, sort_desc,
+            ))
+            def _export_rows():
+                if costed_rows is not None:
+                    return costed_rows
+                # costed chunk by chunk while writing, not through the per-quality memo
+                return export.sheet_rows(matches, get_latest_yarn_price_map(), costing_sheet_row)
+
+            render_sheet_download("costing_sheet", _export_rows, variant=filter_variant)
+
+# ---------------------------
+# Page: Bulk Edit Charges
+# ---------------------------
+elif page == "✏️ Bulk Edit Charges":
+    import pandas as pd
+
+    st.header("✏️ Bulk Edit Charges")
+    st.caption(
+        "Set or scale the charges of every matching quality at once. The preview is costed with the "
+        "latest yarn prices; Apply writes all rows in one transaction (stored costs included)."
+    )
+
+    if "be_applied" in st.session_state:
+        n_updated, n_skipped, apply_s = st.session_state.pop("be_applied")
+        st.success(f"Updated {n_updated:,} qualities in one transaction ({apply_s * 1000:.0f} ms).")
+        if n_skipped:
+            st.warning(f"{n_skipped} were edited by someone else meanwhile and were left alone – review and apply again.")
+
+    qualities = list_qualities(COSTING_SHEET_COLUMNS)
+    if not qualities:
+        st.info("No qualities saved yet.")
+        stop_page()
+
+    bf1, bf2, bf3 = st.columns(3)
+    with bf1:
+        be_name = st.text_input("Quality name contains", key="be_name_query")
+    with bf2:
+        br1, br2 = st.columns(2)
+        with br1:
+            be_reed_min = st.number_input("Reed from", min_value=0.0, step=1.0, key="be_reed_min")
+        with br2:
+            be_reed_max = st.number_input("Reed to (0 = any)", min_value=0.0, step=1.0, key="be_reed_max")
+    with bf3:
+        bp1, bp2 = st.columns(2)
+        with bp1:
+            be_picks_min = st.number_input("Picks from", min_value=0.0, step=1.0, key="be_picks_min")
+        with bp2:
+            be_picks_max = st.number_input("Picks to (0 = any)", min_value=0.0, step=1.0, key="be_picks_max")
+
+    matches = filter_qualities(
+        qualities,
+        name_query=be_name,
+        reed_range=(be_reed_min or None, be_reed_max or None),
+        picks_range=(be_picks_min or None, be_picks_max or None),
+    )
+    if not matches:
+        st.info("No qualities match.")
+        stop_page()
+
+    charge_labels = {
+        "weaving_rate_per_pick": "Weaving rate (₹/pick/m)",
+        "grey_markup_percent": "Grey markup %",
+        "rfd_charge_per_m": "RFD charge (₹/m)",
+        "rfd_shortage_percent": "RFD shortage %",
+        "rfd_markup_percent": "RFD markup %",
+    }
+    st.markdown("#### Changes")
+    changes = {}
+    for col in db.CHARGE_COLUMNS:
+        cc1, cc2, cc3 = st.columns([2, 2, 2])
+        with cc1:
+            st.markdown(f"**{charge_labels[col]}**")
+        with cc2:
+            how = st.radio(col, ["Keep", "Set to", "Change by %"], horizontal=True,
+                           key=f"be_op_{col}", label_visibility="collapsed")
+        with cc3:
+            if how == "Set to":
+                val = st.number_input("New value", min_value=0.0, step=0.01, format="%.4f",
+                                      key=f"be_set_{col}", label_visibility="collapsed")
+                changes[col] = ("set", val)
+            elif how == "Change by %":
+                pct = st.number_input("Change %", step=0.5, value=0.0, key=f"be_pct_{col}",
+                                      label_visibility="collapsed")
+                changes[col] = ("scale", 1.0 + pct / 100.0)
+
+    if not changes:
+        st.caption(f"{len(matches):,} qualities match – choose a charge to change.")
+        stop_page()
+
+    # costed from the very rows apply_edit checks and writes (not the shared batch, which reloads separately)
+    sub = kernel.RecipeBatch.from_qualities(matches, get_latest_yarn_price_map())
+    try:
+        plan = bulk_edit.plan_edit(sub, changes)
+    except ValueError as e:
+        st.error(str(e))
+        stop_page()
+
+    before, after = plan["before"], plan["after"]
+    preview = {"ID": sub.ids, "Quality": [q["quality_name"] for q in matches]}
+    for col in plan["columns"]:
+        preview[f"{charge_labels[col]} now"] = np.round(plan["old"][col], 4)
+        preview[f"{charge_labels[col]} new"] = np.round(plan["new"][col], 4)
+    for out, label in (("grey_sale_per_m", "Grey sale / m"), ("rfd_sale_per_m", "RFD sale / m")):
+        preview[f"{label} now"] = np.round(before[out], 2)
+        preview[f"{label} new"] = np.round(after[out], 2)
+    preview["RFD sale Δ"] = np.round(after["rfd_sale_per_m"] - before["rfd_sale_per_m"], 2)
+
+    pm1, pm2, pm3 = st.columns(3)
+    pm1.metric("Qualities", f"{len(matches):,}")
+    pm2.metric("Avg grey sale change", f"₹{np.mean(after['grey_sale_per_m'] - before['grey_sale_per_m']):+.2f}/m")
+    pm3.metric("Avg RFD sale change", f"₹{np.mean(after['rfd_sale_per_m'] - before['rfd_sale_per_m']):+.2f}/m")
+    st.dataframe(pd.DataFrame(preview), hide_index=True, use_container_width=True)
+
+    if st.button(f"✅ Apply to {len(matches):,} qualities", key="be_apply"):
+        ensure_writable()
+        t0 = time.perf_counter()
+        updated = bulk_edit.apply_edit(plan, matches)
+        invalidate_caches()
+        st.session_state["be_applied"] = (len(updated), len(matches) - len(updated), time.perf_counter() - t0)
+        # back to "Keep" everywhere, so a second click can't apply a % change twice
+        for col in db.CHARGE_COLUMNS:
+            st.session_state.pop(f"be_op_{col}", None)
+        st.rerun()
+
+# ---------------------------
+# Page: Target Price Solver
+# ---------------------------
+elif page == "🎯 Target Price Solver":
+    st.header("🎯 Target Price Solver")
+    st.caption(
+        "What would the picks, a yarn price, the weaving rate or the markup have to be "
+        "to hit a target price? Everything else in the recipe stays as saved."
+    )
+
+    solver_targets = {
+        "RFD sale / m": "rfd_sale",
+        "RFD cost / m": "rfd_cost",
+        "Grey sale / m": "grey_sale",
+        "Grey cost / m": "grey_cost",
+    }
+    solver_variables = {
+        "Picks": "picks",
+        "Weft yarn price (₹/kg)": "weft_price",
+        "Warp yarn price (₹/kg)": "warp_price",
+        "Weaving rate (₹/pick/m)": "weaving_rate",
+        "Markup %": "markup",
+    }
+
+    scope = st.radio("Solve for", ["One quality", "Many qualities"], horizontal=True, key="solver_scope")
+    tc1, tc2 = st.columns(2)
+    with tc1:
+        target_label = st.selectbox("Target", list(solver_targets), key="solver_target")
+    with tc2:
+        variable_label = st.selectbox("Change", list(solver_variables), key="solver_variable")
+    target = solver_targets[target_label]
+    variable = solver_variables[variable_label]
+    try:
+        solver.solve_input(target, variable)
+    except ValueError as e:
+        st.info(str(e))
+        stop_page()
+
+    qualities, batch = priced_qualities()
+    if not qualities:
+        st.info("No qualities saved yet.")
+        stop_page()
+    out_col = solver.TARGETS[target]
+
+    # ---------- ONE QUALITY ----------
+    if scope == "One quality":
+        label_to_pos = {f"{q['quality_name']} (ID {q['id']})": i for i, q in enumerate(qualities)}
+        selected_label = st.selectbox("Quality", list(label_to_pos), key="solver_quality")
+        pos = label_to_pos[selected_label]
+        one = batch.take([pos])
+        current_price = float(one.evaluate()[out_col][0])
+
+        target_value = st.number_input(
+            f"Target {target_label} (₹)",
+            min_value=0.0,
+            step=0.1,
+            value=round(current_price, 2),
+            key=f"solver_value_{qualities[pos]['id']}_{target}",
+        )
+        sol = solver.solve(one, target, target_value, variable)
+        current, required = float(sol["current"][0]), float(sol["required"][0])
+
+        sc1, sc2, sc3 = st.columns(3)
+        sc1.metric(f"Current {target_label}", f"₹{current_price:.2f}")
+        sc2.metric(f"Current {variable_label}", f"{current:.3f}")
+        if required != required:  # NaN
+            sc3.metric(f"Required {variable_label}", "–")
+            st.warning(f"₹{target_value:.2f}/m can't be reached by changing {variable_label.lower()} alone.")
         else:
-            df = pd.DataFrame(rows)
-            st.dataframe(df, use_container_width=True)
+            delta = f"{(required / current - 1) * 100:+.1f}%" if current else None
+            sc3.metric(f"Required {variable_label}", f"{required:.3f}", delta=delta, delta_color="off")
+            if variable == "picks":
+                st.caption("Picks: every weft is scaled by the same factor, so the weft mix stays the same.")
+            elif variable == "weft_price":
+                st.caption("Weft price: the effective (weight-weighted) price over all wefts.")
+
+    # ---------- MANY QUALITIES ----------
+    else:
+        import pandas as pd
+
+        mc1, mc2 = st.columns(2)
+        with mc1:
+            name_filter = st.text_input("Quality name contains", key="solver_name_filter")
+        with mc2:
+            how = st.radio("Target", ["Same price for all", "Current price ± %"], horizontal=True,
+                           key="solver_batch_mode")
+        if how == "Same price for all":
+            target_value = st.number_input(f"Target {target_label} (₹)", min_value=0.0, step=0.1, value=50.0,
+                                           key="solver_batch_value")
+        else:
+            change_pct = st.number_input("Change current price by (%)", step=0.5, value=-5.0,
+                                         key="solver_batch_pct")
+
+        needle = name_filter.strip().lower()
+        mask = np.fromiter(
+            (needle in (q["quality_name"] or "").lower() for q in qualities), dtype=bool, count=len(qualities)
+        )
+        if not mask.any():
+            st.info("No qualities match.")
+            stop_page()
+        sub = batch.take(mask)
+        if how == "Same price for all":
+            values = target_value
+        else:
+            values = sub.evaluate()[out_col] * (1 + change_pct / 100.0)
+
+        t0 = time.perf_counter()
+        sol = solver.solve(sub, target, values, variable)
+        solve_ms = (time.perf_counter() - t0) * 1000.0
+
+        required = sol["required"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (required / sol["current"] - 1) * 100.0
+        names = [q["quality_name"] for q, keep in zip(qualities, mask) if keep]
+        df = pd.DataFrame({
+            "ID": sub.ids,
+            "Quality": names,
+            f"{target_label} now": np.round(sol["current_target"], 2),
+            "Target": np.round(np.broadcast_to(values, len(sub)), 2),
+            f"{variable_label} now": np.round(sol["current"], 3),
+            f"{variable_label} required": np.round(required, 3),
+            "Change %": np.round(change, 1),
+        })
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        unreachable = int(np.isnan(required).sum())
+        st.caption(
+            f"Solved {len(sub):,} qualities in {solve_ms:.1f} ms"
+            + (f" – {unreachable} can't reach the target this way (blank)." if unreachable else ".")
+        )
 
-            csv = df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "Download as CSV",
-                data=csv,
-                file_name="costing_sheet.csv",
-                mime="text/csv"
-            )
+
+# ---------------------------
+# Page: Weft Mix Optimizer
+# ---------------------------
+elif page == "🧵 Weft Mix Optimizer":
+    import pandas as pd
+
+    st.header("🧵 Weft Mix Optimizer")
+    st.caption(
+        "Cheapest weft yarns and pick split for a target fabric weight. Warp, RS and charges "
+        "stay as in the base quality; wefts come from the latest yarn prices."
+    )
+
+    qualities, batch = priced_qualities()
+    if not qualities:
+        st.info("No qualities saved yet.")
+        stop_page()
+
+    label_to_pos = {f"{q['quality_name']} (ID {q['id']})": i for i, q in enumerate(qualities)}
+    selected_label = st.selectbox("Base quality", list(label_to_pos), key="weft_mix_quality")
+    pos = label_to_pos[selected_label]
+    one = batch.take([pos])
+    base = {name: float(one[name][0]) for name in kernel.INPUTS}
+    now = {k: float(v[0]) for k, v in one.evaluate().items()}
+    q_id = qualities[pos]["id"]
+
+    wc1, wc2, wc3 = st.columns(3)
+    with wc1:
+        target_weight = st.number_input(
+            "Target fabric weight (kg / 100 m)", min_value=0.0, step=0.05,
+            value=round(now["fabric_weight_100"], 3), format="%.3f", key=f"weft_mix_weight_{q_id}",
+        )
+    with wc2:
+        picks_min = st.number_input("Min picks", min_value=0.0, step=1.0,
+                                    value=float(round(base["picks"] * 0.85)), key=f"weft_mix_pmin_{q_id}")
+    with wc3:
+        picks_max = st.number_input("Max picks", min_value=0.0, step=1.0,
+                                    value=float(round(base["picks"] * 1.15)), key=f"weft_mix_pmax_{q_id}")
+    wc4, wc5, wc6, wc7 = st.columns(4)
+    with wc4:
+        denier_min = st.number_input("Min weft denier", min_value=0.0, step=10.0, value=0.0, key="weft_mix_dmin")
+    with wc5:
+        denier_max = st.number_input("Max weft denier (0 = any)", min_value=0.0, step=10.0, value=0.0,
+                                     key="weft_mix_dmax")
+    with wc6:
+        max_wefts = st.radio("Wefts", [1, 2], index=1, horizontal=True, key="weft_mix_max_wefts")
+    with wc7:
+        top_n = st.number_input("Show", min_value=1, max_value=100, step=1, value=10, key="weft_mix_top")
+
+    if picks_max < picks_min:
+        st.warning("Max picks is below min picks.")
+        stop_page()
+
+    t0 = time.perf_counter()
+    candidates = weft_mix.weft_candidates(
+        get_latest_yarn_price_map(), min_denier=denier_min or None, max_denier=denier_max or None,
+    )
+    result = weft_mix.cheapest_mixes(
+        base, target_weight, (picks_min, picks_max), candidates, max_wefts=max_wefts, top=int(top_n),
+    )
+    solve_ms = (time.perf_counter() - t0) * 1000.0
+
+    if not result["mixes"]:
+        if result["weft_denier_picks"] <= 0:
+            st.warning("The warp alone already weighs that much – raise the target weight.")
+        else:
+            st.warning("No weft mix reaches that weight within the picks and denier limits.")
+        st.caption(f"Searched {result['candidates']:,} weft yarns in {solve_ms:.1f} ms.")
+        stop_page()
+
+    def _weft_label(w):
+        spec = f"{w['count']:g}s" if w["mode"] == "count" else f"{w['denier']:g}D"
+        return f"{w['yarn_name']} ({spec}, ₹{w['price']:.2f}) × {w['picks']:.2f}"
+
+    rows = []
+    for rank, m in enumerate(result["mixes"], start=1):
+        wefts = m["wefts"] + [None] * (2 - len(m["wefts"]))
+        rows.append({
+            "#": rank,
+            "Weft 1": _weft_label(wefts[0]),
+            "Weft 2": _weft_label(wefts[1]) if wefts[1] else "",
+            "Picks": round(m["picks"], 2),
+            "Weight / 100 m": round(m["fabric_weight_100"], 3),
+            "Grey cost / m": round(m["grey_cost_per_m"], 2),
+            "vs base": round(m["grey_cost_per_m"] - now["grey_cost_per_m"], 2),
+            "Grey sale / m": round(m["grey_sale_per_m"], 2),
+            "RFD sale / m": round(m["rfd_sale_per_m"], 2),
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    st.caption(
+        f"Base quality: grey cost ₹{now['grey_cost_per_m']:.2f}/m at {now['fabric_weight_100']:.3f} kg / 100 m. "
+        f"Searched {result['candidates']:,} weft yarns ({result['pairs_checked']:,} pairs) in {solve_ms:.1f} ms."
+    )
 
 # -----------------------------
 # Page: Deal Margin Calculator
@@ -2593,20 +2953,20 @@ elif page == "📊 Costing Sheet":
 elif page == "💰 Deal Margin Calculator":
     st.header("💰 Deal Margin Calculator")
 
-    qualities = list_all_qualities()
+    qualities, prefetched = load_quality_page("deal_margin_quality")
     if not qualities:
         st.info("No qualities available.")
-        st.stop()
+        stop_page()
 
     label_to_id = {f"{q[1]} (ID {q[0]})": q[0] for q in qualities}
     labels = ["-- Select quality --"] + list(label_to_id.keys())
 
-    selected_label = st.selectbox("Select quality", labels)
+    selected_label = st.selectbox("Select quality", labels, key="deal_margin_quality")
 
     if selected_label == "-- Select quality --":
-        st.stop()
+        stop_page()
 
-    q = get_quality_by_id(label_to_id[selected_label])
+    q = get_quality(label_to_id[selected_label], prefetched)
     cost = compute_dynamic_cost(q)
 
     # ---- Sale type ----
@@ -2766,4 +3126,9 @@ elif page == "💰 Deal Margin Calculator":
                 "• Discounted payment still incurs ~2% interest\n"
                 "• Only half the interest is actually saved\n"
                 "• Final margin reflects real cash profit"
-            )
\ No newline at end of file
+            )
+
+# ---------------------------
+# End of rerun: performance panel
+# ---------------------------
+end_perf_run()
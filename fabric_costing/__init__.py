@@ -0,0 +1,23 @@
+"""
+Headless core of the Fabric Costing App.
+
+Nothing in this package imports Streamlit, and the DB layer
+(fabric_costing.db) is only imported when you ask for it, so
+`import fabric_costing` is cheap enough for scripts, tests,
+batch jobs and process pools.
+"""
+from fabric_costing.costing import (
+    build_yarn_price_map,
+    calculate_costing,
+    calculate_costing_multi_weft,
+    calculate_deal_margin,
+    compute_dynamic_cost,
+)
+
+__all__ = [
+    "build_yarn_price_map",
+    "calculate_costing",
+    "calculate_costing_multi_weft",
+    "calculate_deal_margin",
+    "compute_dynamic_cost",
+]
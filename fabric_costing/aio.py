@@ -0,0 +1,116 @@
+"""
+asyncio data access + a sync facade for Streamlit.
+
+Independent reads for a page (quality list, one quality, yarn price map, ...)
+each cost a full Supabase round trip. Run them concurrently and the page
+waits roughly one round trip instead of their sum.
+
+The DB driver (psycopg2) is blocking, so each read runs on a worker thread
+via asyncio.to_thread – with its own connection – and the event loop only
+coordinates. ContextVars (e.g. the perf run) are copied into the workers.
+
+    from fabric_costing import aio
+
+    # async code
+    qualities, q = await asyncio.gather(aio.list_all_qualities(), aio.get_quality_by_id(7))
+
+    # sync code (Streamlit)
+    res = aio.run_concurrently({
+        "qualities": (db.list_all_qualities,),
+        "quality": (db.get_quality_by_id, 7),
+    })
+"""
+import asyncio
+import threading
+
+from fabric_costing import db
+
+
+async def call(fn, *args, **kwargs):
+    """Run any blocking helper without blocking the event loop."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+# ---------------------------
+# Async versions of the read helpers
+# ---------------------------
+
+async def list_all_qualities():
+    return await call(db.list_all_qualities)
+
+
+async def list_all_qualities_full():
+    return await call(db.list_all_qualities_full)
+
+
+async def list_qualities(columns=None):
+    return await call(db.list_qualities, columns)
+
+
+async def get_quality_by_id(q_id):
+    return await call(db.get_quality_by_id, q_id)
+
+
+async def list_latest_yarn_prices():
+    return await call(db.list_latest_yarn_prices)
+
+
+async def get_latest_yarn_price_map():
+    return await call(db.get_latest_yarn_price_map)
+
+
+async def get_latest_yarn_price(name, yarn_type=None):
+    return await call(db.get_latest_yarn_price, name, yarn_type)
+
+
+async def list_yarn_names(yarn_type=None):
+    return await call(db.list_yarn_names, yarn_type)
+
+
+# ---------------------------
+# Sync facade
+# ---------------------------
+
+async def gather_calls(calls):
+    """
+    calls: {name: (fn, *args)} – entries that are None are skipped.
+    Returns {name: result}. The first exception is re-raised.
+    """
+    names = [name for name, spec in calls.items() if spec is not None]
+    results = await asyncio.gather(*(call(spec[0], *spec[1:]) for spec in (calls[n] for n in names)))
+    return dict(zip(names, results))
+
+
+def run_concurrently(calls):
+    """
+    Blocking entry point for sync code: run `calls` (see gather_calls)
+    concurrently and return {name: result}. None entries come back as None.
+    """
+    out = dict.fromkeys(calls)
+    try:
+        asyncio.get_running_loop()
+        loop_running = True
+    except RuntimeError:
+        loop_running = False
+
+    if not loop_running:
+        out.update(asyncio.run(gather_calls(calls)))
+        return out
+
+    # Called from inside a running loop (notebooks, async servers):
+    # run our own loop on a helper thread instead of nesting.
+    box = {}
+
+    def _worker():
+        try:
+            box["result"] = asyncio.run(gather_calls(calls))
+        except BaseException as e:  # re-raised in the caller's thread
+            box["error"] = e
+
+    t = threading.Thread(target=_worker, name="fabric-aio")
+    t.start()
+    t.join()
+    if "error" in box:
+        raise box["error"]
+    out.update(box["result"])
+    return out
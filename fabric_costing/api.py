@@ -0,0 +1,428 @@
+"""
+Local JSON/HTTP pricing API (runs beside the Streamlit UI).
+
+    python -m fabric_costing.api --port 8765            # Postgres via SUPABASE_URI
+    python -m fabric_costing.api --port 8765 --demo     # in-memory demo catalog
+
+Endpoints (all JSON):
+    GET  /health
+    GET  /catalog                       qualities + latest yarn prices (ETag / 304)
+    GET  /price?ids=1,2,3               price stored qualities (ETag / 304)
+    POST /price   {"ids": [...]} and/or {"qualities": [recipe, ...]}
+    POST /cost    {"recipes": [recipe, ...]}
+    POST /deal    {"deals": [deal, ...]}
+    GET  /sheet/pricing.csv?name=poly   Pricing / Costing Sheet, streamed (pricing | costing,
+                                        csv | xlsx; optional name filter; ETag / 304)
+    GET  /metrics                       OpenMetrics (DB query latency)
+
+Every request is answered from ONE catalog snapshot (qualities + yarn price
+map), so a batch never mixes prices from two reloads. The snapshot is
+reloaded in the background shortly before --ttl runs out and swapped in,
+so no request waits on a reload. Its ETag changes only when the catalog
+content changes.
+
+A recipe has the same fields as a qualities row (ends, rs, warp_denier,
+warp_yarn_name / warp_yarn_price, weaving_rate_per_pick, markups, ...) and
+lists its wefts under "wefts": [{"picks", "denier" | "count", "mode",
+"price", "yarn_name"}] – the wefts_json format.
+"""
+import argparse
+import hashlib
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from fabric_costing import export, tracing
+from fabric_costing.catalog import RefreshAhead
+from fabric_costing.costing import (
+    calculate_costing_multi_weft,
+    calculate_deal_margin,
+    compute_dynamic_cost,
+    resolve_warp,
+    resolve_weft,
+)
+from fabric_costing.sheets import costing_sheet_row, filter_qualities, pricing_sheet_row
+from fabric_costing.yarn_table import YarnTable
+
+# /sheet/<name>.<ext> -> row builder
+SHEETS = {"pricing": pricing_sheet_row, "costing": costing_sheet_row}
+
+
+# ---------------------------
+# Catalog sources & snapshot
+# ---------------------------
+
+class PostgresSource:
+    """Loads the catalog through fabric_costing.db (SUPABASE_URI)."""
+
+    def load(self):
+        from fabric_costing import db
+
+        return db.list_all_qualities_full(), db.list_latest_yarn_prices()
+
+
+class MemorySource:
+    """Fixed in-memory catalog – for local testing and --demo."""
+
+    def __init__(self, qualities, yarn_rows):
+        self.qualities = [dict(q) for q in qualities]
+        self.yarn_rows = [dict(r) for r in yarn_rows]
+
+    def load(self):
+        return self.qualities, self.yarn_rows
+
+
+class CatalogSnapshot:
+    def __init__(self, qualities, yarn_rows):
+        self.qualities = [dict(q) for q in qualities]
+        self.yarn_rows = [dict(r) for r in yarn_rows]
+        self.by_id = {q["id"]: q for q in self.qualities if "id" in q}
+        self.yarn_price_map = YarnTable.from_rows(self.yarn_rows)
+        self.loaded_at = time.time()
+
+        payload = json.dumps([self.qualities, self.yarn_rows], sort_keys=True, default=str)
+        self.etag = '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16] + '"'
+
+
+class PricingService:
+    """
+    Holds the current snapshot; a background reload from the source replaces
+    it every `ttl` seconds (catalog.RefreshAhead). Requests grab snapshot()
+    once and use it throughout.
+    """
+
+    def __init__(self, source, ttl=60):
+        self.source = source
+        self.ttl = ttl
+        self._catalog = RefreshAhead("api catalog", lambda: CatalogSnapshot(*self.source.load()), ttl=ttl)
+
+    def snapshot(self):
+        return self._catalog.get()
+
+    def refresh(self):
+        return self._catalog.refresh()
+
+    # ---------- batch evaluations ----------
+
+    def price_qualities(self, snap, ids=(), recipes=()):
+        results = []
+        for q_id in ids:
+            q = snap.by_id.get(q_id)
+            if q is None:
+                results.append({"id": q_id, "error": "quality not found"})
+                continue
+            results.append(_with_error(lambda: {
+                "id": q_id,
+                "quality_name": q.get("quality_name"),
+                **price_summary(compute_dynamic_cost(q, snap.yarn_price_map)),
+            }))
+        for recipe in recipes:
+            results.append(_with_error(lambda: {
+                "quality_name": recipe.get("quality_name"),
+                **price_summary(compute_dynamic_cost(_recipe_as_quality(recipe), snap.yarn_price_map)),
+            }))
+        return results
+
+    def cost_recipes(self, snap, recipes):
+        return [_with_error(lambda: cost_recipe(recipe, snap.yarn_price_map)) for recipe in recipes]
+
+    def evaluate_deals(self, snap, deals):
+        return [_with_error(lambda: evaluate_deal(deal, snap)) for deal in deals]
+
+
+def _with_error(fn):
+    try:
+        return fn()
+    except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def price_summary(cost):
+    """Pricing Sheet view of a costing result (per meter, weight per 100 m)."""
+    return {
+        "weight": round(cost["warp_weight_100"] * 1.09 + cost["weft_weight_100"], 3),
+        "grey_cost_per_m": round(cost["grey_cost_per_m"], 4),
+        "grey_sale_per_m": round(cost["grey_sale_per_m"], 4),
+        "rfd_cost_per_m": round(cost["rfd_cost_per_m"], 4),
+        "rfd_sale_per_m": round(cost["rfd_sale_per_m"], 4),
+        "interest_per_m": round(cost["interest_on_yarn_100"] / 100.0, 4),
+    }
+
+
+def _recipe_as_quality(recipe):
+    """A POSTed recipe -> qualities-row shape understood by compute_dynamic_cost."""
+    q = dict(recipe)
+    wefts = q.pop("wefts", None)
+    if wefts is not None:
+        q["wefts_json"] = json.dumps(wefts)
+    for key in ("warp_yarn_price", "picks", "weft_denier", "weft_yarn_price",
+                "grey_markup_percent", "rfd_charge_per_m", "rfd_shortage_percent", "rfd_markup_percent"):
+        q.setdefault(key, 0.0)
+    q.setdefault("include_interest", True)
+    return q
+
+
+def cost_recipe(recipe, yarn_price_map):
+    """Full costing of one recipe via calculate_costing_multi_weft."""
+    q = _recipe_as_quality(recipe)
+    warp_denier, warp_price = resolve_warp(q, yarn_price_map)
+    rs = float(q["rs"])
+
+    weft_list = []
+    for wf in recipe.get("wefts") or []:
+        p, d, price, mode, cnt, yarn_name = resolve_weft(wf, yarn_price_map)
+        if mode == "count" and d <= 0 and cnt and float(cnt) > 0:
+            d = 5315.0 / float(cnt)
+        if p > 0 and d > 0:
+            weft_list.append({"picks": p, "weft_denier": d, "weft_yarn_price": price})
+    if not weft_list:
+        raise ValueError("recipe needs at least one weft with picks and denier > 0")
+
+    cost = calculate_costing_multi_weft(
+        ends=float(q["ends"]),
+        warp_denier=float(warp_denier),
+        rs=rs,
+        warp_yarn_price=float(warp_price),
+        weft_list=weft_list,
+        weaving_rate_per_pick=float(q["weaving_rate_per_pick"]),
+        grey_markup_percent=float(q.get("grey_markup_percent", 0.0)),
+        rfd_charge_per_m=float(q.get("rfd_charge_per_m", 0.0)),
+        rfd_shortage_percent=float(q.get("rfd_shortage_percent", 0.0)),
+        rfd_markup_percent=float(q.get("rfd_markup_percent", 0.0)),
+        include_interest=bool(q.get("include_interest", True)),
+    )
+    cost["resolved_wefts"] = weft_list
+    return cost
+
+
+def evaluate_deal(deal, snap):
+    """
+    Deal terms against either a stored quality ("quality_id" + "sale_type":
+    grey | rfd) or explicit "cost_with_interest_per_m" / "interest_per_m".
+    """
+    if "quality_id" in deal:
+        q = snap.by_id.get(deal["quality_id"])
+        if q is None:
+            raise KeyError(f"quality {deal['quality_id']} not found")
+        cost = compute_dynamic_cost(q, snap.yarn_price_map)
+        rfd = str(deal.get("sale_type", "grey")).lower() == "rfd"
+        base_cost = cost["rfd_cost_per_m"] if rfd else cost["grey_cost_per_m"]
+        interest_per_m = cost["interest_on_yarn_100"] / 100.0
+        reference_price = cost["rfd_sale_per_m"] if rfd else cost["grey_sale_per_m"]
+    else:
+        base_cost = float(deal["cost_with_interest_per_m"])
+        interest_per_m = float(deal.get("interest_per_m", 0.0))
+        reference_price = None
+
+    result = calculate_deal_margin(
+        cost_with_interest_per_m=base_cost,
+        interest_per_m=interest_per_m,
+        deal_price_per_m=float(deal.get("deal_price_per_m", reference_price or 0.0)),
+        payment_mode=deal.get("payment_mode", "net"),
+        discount_percent=float(deal.get("discount_percent", 0.0)),
+        brokerage_percent=float(deal.get("brokerage_percent", 0.0)),
+        quantity_m=float(deal.get("quantity_m", 0.0)),
+    )
+    if "quality_id" in deal:
+        result["quality_id"] = deal["quality_id"]
+    return result
+
+
+# ---------------------------
+# HTTP layer
+# ---------------------------
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "FabricCostingAPI/1.0"
+
+        # ---------- helpers ----------
+        def _send_json(self, status, obj, etag=None):
+            body = json.dumps(obj, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _not_modified(self, etag):
+            if etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return True
+            return False
+
+        def _send_sheet(self, snap, url):
+            sheet, _, ext = url.path[len("/sheet/"):].partition(".")
+            row_fn = SHEETS.get(sheet)
+            if row_fn is None or ext not in export.FORMATS:
+                self._send_json(404, {"error": "not found"})
+                return
+            name_query = parse_qs(url.query).get("name", [""])[0]
+            etag = snap.etag[:-1] + "-" + hashlib.sha1(f"{sheet}.{ext}?{name_query}".encode()).hexdigest()[:8] + '"'
+            if self._not_modified(etag):
+                return
+
+            qualities = filter_qualities(snap.qualities, name_query=name_query)
+            self.send_response(200)
+            self.send_header("Content-Type", export.FORMATS[ext])
+            self.send_header("Content-Disposition", f'attachment; filename="{sheet}_sheet.{ext}"')
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            # No Content-Length: rows are costed and written chunk by chunk, the
+            # response ends when the connection closes (HTTP/1.0).
+            rows = export.sheet_rows(qualities, snap.yarn_price_map, row_fn)
+            for chunk in export.iter_export(ext, rows, sheet_name=f"{sheet}_sheet"):
+                self.wfile.write(chunk)
+
+        def _snapshot(self):
+            """The current snapshot, or None after answering 503 (catalog can't be loaded)."""
+            try:
+                return service.snapshot()
+            except Exception as e:
+                self._send_json(503, {"error": f"catalog unavailable: {type(e).__name__}: {e}"})
+                return None
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+            return json.loads(raw.decode("utf-8") or "{}")
+
+        def log_message(self, *args):
+            pass
+
+        # ---------- GET ----------
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                self._send_json(200, {"ok": True})
+                return
+            if url.path == "/metrics":
+                body = tracing.render_openmetrics().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", tracing.OPENMETRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            snap = self._snapshot()
+            if snap is None:
+                return
+            if url.path == "/catalog":
+                if self._not_modified(snap.etag):
+                    return
+                self._send_json(200, {
+                    "etag": snap.etag,
+                    "qualities": snap.qualities,
+                    "yarn_prices": snap.yarn_rows,
+                }, etag=snap.etag)
+                return
+            if url.path.startswith("/sheet/"):
+                self._send_sheet(snap, url)
+                return
+            if url.path == "/price":
+                raw_ids = parse_qs(url.query).get("ids", [""])[0]
+                try:
+                    ids = [int(x) for x in raw_ids.split(",") if x.strip()]
+                except ValueError:
+                    self._send_json(400, {"error": "ids must be integers"})
+                    return
+                # Same catalog + same ids -> same answer
+                etag = snap.etag[:-1] + "-" + hashlib.sha1(raw_ids.encode()).hexdigest()[:8] + '"'
+                if self._not_modified(etag):
+                    return
+                self._send_json(200, {
+                    "catalog_etag": snap.etag,
+                    "results": service.price_qualities(snap, ids=ids),
+                }, etag=etag)
+                return
+            self._send_json(404, {"error": "not found"})
+
+        # ---------- POST ----------
+        def do_POST(self):
+            url = urlparse(self.path)
+            try:
+                body = self._read_json()
+            except (ValueError, UnicodeDecodeError):
+                self._send_json(400, {"error": "invalid JSON body"})
+                return
+            if not isinstance(body, dict):
+                self._send_json(400, {"error": "body must be a JSON object"})
+                return
+
+            snap = self._snapshot()
+            if snap is None:
+                return
+            if url.path == "/price":
+                results = service.price_qualities(
+                    snap, ids=body.get("ids") or [], recipes=body.get("qualities") or []
+                )
+            elif url.path == "/cost":
+                results = service.cost_recipes(snap, body.get("recipes") or [])
+            elif url.path == "/deal":
+                results = service.evaluate_deals(snap, body.get("deals") or [])
+            else:
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, {"catalog_etag": snap.etag, "results": results})
+
+    return Handler
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+# ---------------------------
+# Demo catalog / entry point
+# ---------------------------
+
+def demo_source():
+    yarn_rows = [
+        {"name": "80D Poly", "yarn_type": "warp", "price_per_kg": 180.0, "denier": 80.0, "count": None},
+        {"name": "75D Weft", "yarn_type": "weft", "price_per_kg": 220.0, "denier": 75.0, "count": None},
+        {"name": "30s Cotton", "yarn_type": "both", "price_per_kg": 300.0, "denier": None, "count": 30.0},
+    ]
+    qualities = [{
+        "id": 1, "quality_name": "Demo 80D x 75D", "ends": 4200.0, "rs": 58.0, "reed": 72.0,
+        "warp_denier": 80.0, "warp_yarn_name": "80D Poly", "warp_yarn_price": 180.0,
+        "picks": 56.0, "weft_denier": 75.0, "weft_yarn_price": 220.0,
+        "weaving_rate_per_pick": 0.16, "grey_markup_percent": 8.0,
+        "rfd_charge_per_m": 1.7, "rfd_shortage_percent": 5.5, "rfd_markup_percent": 10.0,
+        "include_interest": True,
+        "wefts_json": json.dumps([{"picks": 56.0, "denier": 75.0, "price": 220.0, "mode": "denier", "yarn_name": "75D Weft"}]),
+    }]
+    return MemorySource(qualities, yarn_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fabric costing JSON/HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttl", type=float, default=60.0, help="catalog snapshot reload interval (s)")
+    parser.add_argument("--demo", action="store_true", help="serve a small in-memory catalog")
+    args = parser.parse_args(argv)
+
+    source = demo_source() if args.demo else PostgresSource()
+    service = PricingService(source, ttl=args.ttl)
+    service.refresh()  # fail fast on a bad DB config, and never serve a cold first request
+
+    server = make_server(service, args.host, args.port)
+    print(f"Fabric costing API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
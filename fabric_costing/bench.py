@@ -0,0 +1,280 @@
+"""
+Benchmark suite for the costing hot paths, on the seeded synthetic catalog.
+
+    python -m fabric_costing.bench                          # small scale, compare to the baseline
+    python -m fabric_costing.bench --scale full --db        # + DB helpers (SUPABASE_URI, after synth --load)
+    python -m fabric_costing.bench --save-baseline          # record the current numbers
+    python -m fabric_costing.bench --only sheet --json out.json
+
+Each case runs `repeat` times; the median (and min) wall time is reported.
+A case regresses when its median is more than `threshold` (fraction) slower
+than the baseline median. Exit status 1 on any regression, so CI can gate on it.
+Baselines are per scale, per machine – re-record after changing hardware.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from fabric_costing import export, impact, similar, solver, synth, weft_mix
+from fabric_costing.costing import build_yarn_price_map, calculate_deal_margin, compute_dynamic_cost
+from fabric_costing.kernel import RecipeBatch
+from fabric_costing.sheets import (
+    COSTING_SHEET_RECIPE_SORTS,
+    PRICING_SHEET_COLUMNS,
+    costing_sheet_row,
+    filter_qualities,
+    pricing_sheet_row,
+)
+from fabric_costing.yarn_table import YarnTable
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+DB_THRESHOLD = 0.50  # network / server noise
+NOISE_FLOOR_MS = 0.5  # never flag differences smaller than this
+
+SCALES = {
+    "small": {"n_qualities": 2000, "n_yarns": 200, "n_price_rows": 20000},
+    "full": {"n_qualities": synth.DEFAULT_QUALITIES, "n_yarns": synth.DEFAULT_YARNS,
+             "n_price_rows": synth.DEFAULT_PRICE_ROWS},
+}
+
+
+class Case:
+    __slots__ = ("name", "fn", "repeat", "threshold")
+
+    def __init__(self, name, fn, repeat=5, threshold=DEFAULT_THRESHOLD):
+        self.name = name
+        self.fn = fn
+        self.repeat = repeat
+        self.threshold = threshold
+
+
+def run_case(case):
+    case.fn()  # warm-up (imports, first-touch allocations)
+    times = []
+    for _ in range(case.repeat):
+        t0 = time.perf_counter()
+        case.fn()
+        times.append(time.perf_counter() - t0)
+    return {
+        "median_ms": round(statistics.median(times) * 1000.0, 3),
+        "min_ms": round(min(times) * 1000.0, 3),
+        "repeat": case.repeat,
+        "threshold": case.threshold,
+    }
+
+
+# ---------------------------
+# Cases
+# ---------------------------
+
+def memory_cases(qualities, yarn_rows):
+    latest = synth.latest_yarn_rows(yarn_rows)
+    price_map = YarnTable.from_rows(latest)  # what db.get_latest_yarn_price_map() returns
+    deals = [
+        (cost * 1.04, cost * 0.04, cost * 1.12, "discount" if i % 2 else "net", 2.0, 1.0, 5000.0)
+        for i, cost in enumerate(q["final_grey_cost_100"] / 100.0 for q in qualities)
+    ]
+
+    with_ids, _ = synth.with_ids(qualities, [])
+    index = similar.SimilarityIndex.build(with_ids)
+    probes = with_ids[:: max(1, len(with_ids) // 100)]
+    batch = RecipeBatch.from_qualities(with_ids, price_map)
+    base = {name: float(arr[0]) for name, arr in batch.inputs.items()}
+    base_weight = float(batch.take([0]).evaluate()["fabric_weight_100"][0])
+
+    usage = impact.yarn_usage(with_ids)
+    busiest = max(usage, key=lambda name: len(usage[name]))
+    new_row = {"name": busiest, "yarn_type": "both", "price_per_kg": 250.0, "denier": None, "count": None}
+
+    def weft_mixes():
+        cands = weft_mix.weft_candidates(price_map)
+        return weft_mix.cheapest_mixes(base, base_weight, (base["picks"] * 0.85, base["picks"] * 1.15), cands)
+
+    def pricing_sheet():
+        import pandas as pd
+
+        return pd.DataFrame([pricing_sheet_row(q, compute_dynamic_cost(q, price_map)) for q in qualities])
+
+    def costing_sheet():
+        import pandas as pd
+
+        rows = filter_qualities(qualities, reed_range=(56, 88), markup_range=(None, 12))
+        rows = sorted(rows, key=COSTING_SHEET_RECIPE_SORTS["Quality"])
+        return pd.DataFrame([costing_sheet_row(q, compute_dynamic_cost(q, price_map)) for q in rows])
+
+    def export_csv():
+        return sum(len(chunk) for chunk in export.iter_csv(export.sheet_rows(with_ids, price_map, costing_sheet_row)))
+
+    return [
+        Case("build_yarn_price_map", lambda: build_yarn_price_map(latest), repeat=20),
+        Case("YarnTable.from_rows", lambda: YarnTable.from_rows(latest), repeat=20),
+        Case("compute_dynamic_cost", lambda: [compute_dynamic_cost(q, price_map) for q in qualities]),
+        Case("pricing_sheet", pricing_sheet),
+        Case("costing_sheet", costing_sheet),
+        Case("costing sheet csv (streamed)", export_csv),
+        Case("calculate_deal_margin", lambda: [calculate_deal_margin(*d) for d in deals], repeat=10),
+        Case("RecipeBatch.from_qualities", lambda: RecipeBatch.from_qualities(with_ids, price_map)),
+        Case("kernel evaluate", batch.evaluate, repeat=20),
+        Case("solve rfd_sale: picks", lambda: solver.solve(batch, "rfd_sale", 50.0, "picks"), repeat=20),
+        Case("solve rfd_sale: markup", lambda: solver.solve(batch, "rfd_sale", 50.0, "markup"), repeat=10),
+        Case("weft mix top 10", weft_mixes, repeat=20),
+        Case("yarn usage index", lambda: impact.yarn_usage(with_ids)),
+        Case("price change impact", lambda: impact.price_change_impact(with_ids, price_map, usage, new_row),
+             repeat=20),
+        Case("similarity index build", lambda: similar.SimilarityIndex.build(with_ids)),
+        Case("nearest 10 x100", lambda: [index.nearest(q, 10, exclude_id=q["id"]) for q in probes]),
+    ]
+
+
+def _prepare_mode(enabled, fn):
+    """fn run with FABRIC_DB_PREPARE on / off (plain SQL text)."""
+    def run():
+        old = os.environ.get("FABRIC_DB_PREPARE")
+        os.environ["FABRIC_DB_PREPARE"] = "1" if enabled else "0"
+        try:
+            return fn()
+        finally:
+            if old is None:
+                del os.environ["FABRIC_DB_PREPARE"]
+            else:
+                os.environ["FABRIC_DB_PREPARE"] = old
+    return run
+
+
+def db_cases(qualities):
+    from fabric_costing import db
+
+    ids = [i for i in range(1, len(qualities) + 1, max(1, len(qualities) // 50))]
+    names = sorted({q["warp_yarn_name"] for q in qualities if q["warp_yarn_name"]})[:50]
+
+    # Prepared vs plain text for the hot reads, on the same pooled connections
+    micro = []
+    for label, fn in [
+        ("latest price x50", lambda: [db.get_latest_yarn_price(n, "warp") for n in names]),
+        ("quality by id x200", lambda: [db.get_quality_by_id(i) for i in ids * 4]),
+        ("yarn names x20", lambda: [db.list_yarn_names("weft") for _ in range(20)]),
+    ]:
+        for enabled, mode in ((False, "text"), (True, "prepared")):
+            micro.append(Case(f"db.{mode}: {label}", _prepare_mode(enabled, fn), repeat=5, threshold=DB_THRESHOLD))
+
+    return micro + [
+        Case("db.list_all_qualities_full", db.list_all_qualities_full, threshold=DB_THRESHOLD),
+        Case("db.list_qualities(pricing)", lambda: db.list_qualities(PRICING_SHEET_COLUMNS),
+             threshold=DB_THRESHOLD),
+        Case("db.list_all_qualities", db.list_all_qualities, threshold=DB_THRESHOLD),
+        Case("db.list_latest_yarn_prices", db.list_latest_yarn_prices, threshold=DB_THRESHOLD),
+        Case("db.get_latest_yarn_price_map", db.get_latest_yarn_price_map, threshold=DB_THRESHOLD),
+        Case("db.list_yarn_names", db.list_yarn_names, threshold=DB_THRESHOLD),
+        Case("db.list_yarn_prices", db.list_yarn_prices, repeat=3, threshold=DB_THRESHOLD),
+        Case("db.get_quality_by_id x50", lambda: [db.get_quality_by_id(i) for i in ids],
+             repeat=3, threshold=DB_THRESHOLD),
+        Case("db.get_latest_yarn_price x50", lambda: [db.get_latest_yarn_price(n, "warp") for n in names],
+             repeat=3, threshold=DB_THRESHOLD),
+    ]
+
+
+# ---------------------------
+# Baselines
+# ---------------------------
+
+def load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, scale, results):
+    """Merge `results` into the baseline for `scale` (cases not re-run are kept)."""
+    data = load_baseline(path)
+    entry = data.setdefault(scale, {"cases": {}})
+    entry["recorded"] = time.strftime("%Y-%m-%d")
+    entry["machine"] = f"{platform.system()} {platform.machine()} / Python {platform.python_version()}"
+    entry["cases"].update(results)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baseline_cases):
+    """[(name, median_ms, baseline_ms, ratio, regressed)] – baseline/ratio None for new cases."""
+    out = []
+    for name, res in results.items():
+        base = baseline_cases.get(name)
+        if not base:
+            out.append((name, res["median_ms"], None, None, False))
+            continue
+        ratio = res["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        threshold = base.get("threshold", res["threshold"])
+        regressed = ratio > 1.0 + threshold and res["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS
+        out.append((name, res["median_ms"], base["median_ms"], ratio, regressed))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark costing hot paths on synthetic data")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", action="store_true", help="also benchmark DB helpers against SUPABASE_URI")
+    parser.add_argument("--load", action="store_true", help="with --db: (re)load the synthetic catalog first")
+    parser.add_argument("--only", help="run only cases whose name contains this")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    # benchmark queries are expected to be slow-ish; keep them out of the slow log
+    os.environ.setdefault("FABRIC_SLOW_QUERY_LOG", "")
+
+    t0 = time.perf_counter()
+    qualities, yarn_rows = synth.generate(seed=args.seed, **SCALES[args.scale])
+    print(f"Synthetic catalog ({args.scale}): {len(qualities)} qualities, "
+          f"{len(yarn_rows)} yarn price rows – {time.perf_counter() - t0:.1f}s")
+
+    cases = memory_cases(qualities, yarn_rows)
+    if args.db:
+        if args.load:
+            synth.load(qualities, yarn_rows, reset=True)
+        cases += db_cases(qualities)
+    if args.only:
+        cases = [c for c in cases if args.only in c.name]
+
+    results = {}
+    for case in cases:
+        results[case.name] = run_case(case)
+
+    baseline = load_baseline(args.baseline).get(args.scale, {}).get("cases", {})
+    rows = compare(results, baseline)
+
+    print(f"\n{'case':<32} {'median ms':>11} {'baseline':>11} {'ratio':>7}")
+    for name, median_ms, base_ms, ratio, regressed in rows:
+        base_txt = f"{base_ms:11.2f}" if base_ms is not None else f"{'-':>11}"
+        ratio_txt = f"{ratio:7.2f}" if ratio is not None else f"{'-':>7}"
+        flag = "  ❌ REGRESSION" if regressed else ""
+        print(f"{name:<32} {median_ms:11.2f} {base_txt} {ratio_txt}{flag}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "seed": args.seed, "cases": results}, f, indent=2)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, args.scale, results)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = [r[0] for r in rows if r[4]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
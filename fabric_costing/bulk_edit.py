@@ -0,0 +1,160 @@
+"""
+Bulk edit of the charges on many qualities at once.
+
+    changes = {"weaving_rate_per_pick": ("scale", 1.05), "rfd_charge_per_m": ("set", 9.0)}
+    plan = plan_edit(RecipeBatch.from_qualities(rows, yarn_price_map), changes)
+    plan["after"]["rfd_sale_per_m"] - plan["before"]["rfd_sale_per_m"]     # preview, arrays
+    apply_edit(plan, rows)                                                  # one UPDATE, one transaction
+
+The preview is the costing kernel over the selected recipes with the new
+charge arrays – no per-quality work beyond one array evaluation. Applying
+writes the new charges, the stored *_100 costs (latest yarn prices, as
+recompute would) and the recipe hashes – charges are part of the recipe –
+in a single UPDATE ... FROM (VALUES ...). Rows edited by someone else since
+the preview are skipped.
+
+    python -m fabric_costing.bulk_edit --name poly --scale weaving_rate_per_pick=1.05        # preview
+    python -m fabric_costing.bulk_edit --name poly --set rfd_charge_per_m=9 --apply
+"""
+import argparse
+import sys
+
+import numpy as np
+
+OPERATIONS = ("set", "scale")   # scale: multiply by a factor
+MARKUP_COLUMNS = ("grey_markup_percent", "rfd_markup_percent")
+
+
+def _charge_columns():
+    from fabric_costing.db import CHARGE_COLUMNS
+
+    return CHARGE_COLUMNS
+
+
+def new_values(current, op, value):
+    """The charge array after one operation."""
+    if op == "set":
+        return np.full(len(current), float(value))
+    if op == "scale":
+        return current * float(value)
+    raise ValueError(f"Unknown operation: {op} (one of {', '.join(OPERATIONS)})")
+
+
+def plan_edit(batch, changes):
+    """
+    Preview `changes` ({charge column: (op, value)}) over a RecipeBatch.
+    Returns {"ids", "columns", "old", "new", "before", "after"} – old / new
+    charge arrays per column, costing arrays before / after.
+    ValueError for unknown columns or operations, negative charges, markups of 100% or more.
+    """
+    charge_columns = _charge_columns()
+    unknown = set(changes).difference(charge_columns)
+    if unknown:
+        raise ValueError(f"Not a charge column: {', '.join(sorted(unknown))} (one of {', '.join(charge_columns)})")
+    columns = tuple(c for c in charge_columns if c in changes)  # table order
+
+    new = {c: new_values(batch[c], *changes[c]) for c in columns}
+    for c, vals in new.items():
+        if (vals < 0).any():
+            raise ValueError(f"{c} would become negative")
+        if c in MARKUP_COLUMNS and (vals >= 100).any():
+            raise ValueError(f"{c} would reach 100% or more")
+
+    return {
+        "ids": batch.ids,
+        "columns": columns,
+        "old": {c: batch[c].copy() for c in columns},
+        "new": new,
+        "before": batch.evaluate(),
+        "after": batch.evaluate(**new),
+    }
+
+
+def apply_edit(plan, qualities):
+    """
+    Write a plan. qualities: the rows the batch was built from (id, reed and
+    costing.RECIPE_COLUMNS – e.g. sheets.COSTING_SHEET_COLUMNS), for the
+    recipe hashes and the "unchanged since preview" check.
+    Returns the ids updated.
+    """
+    from fabric_costing import db
+    from fabric_costing.dedupe import recipe_hashes
+
+    by_id = {q["id"]: q for q in qualities}
+    columns = plan["columns"]
+    updates = []
+    for n, q_id in enumerate(plan["ids"].tolist()):
+        q = by_id[q_id]
+        new = {c: float(plan["new"][c][n]) for c in columns}
+        new.update({c: float(plan["after"][c][n]) for c in db.STORED_COST_COLUMNS})
+        new.update(zip(db.HASH_COLUMNS, recipe_hashes(dict(q, **new))))
+        updates.append((q_id, {c: q[c] for c in columns}, new))
+    return db.bulk_update_charges(updates, columns)
+
+
+def _parse_changes(parser, sets, scales):
+    changes = {}
+    for op, items in (("set", sets), ("scale", scales)):
+        for item in items or ():
+            col, _, val = item.partition("=")
+            try:
+                changes[col.strip()] = (op, float(val))
+            except ValueError:
+                parser.error(f"--{op} needs column=number, got {item!r}")
+    if not changes:
+        parser.error("nothing to change: give --set and / or --scale")
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Set or scale charges on many qualities at once")
+    parser.add_argument("--set", action="append", metavar="COLUMN=VALUE", help="new value (repeatable)")
+    parser.add_argument("--scale", action="append", metavar="COLUMN=FACTOR", help="multiply by (repeatable)")
+    parser.add_argument("--ids", help="comma-separated quality ids")
+    parser.add_argument("--name", help="only qualities whose name contains this (case-insensitive)")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: preview only)")
+    parser.add_argument("--limit", type=int, default=20, help="max rows to print (0 = all)")
+    args = parser.parse_args(argv)
+    changes = _parse_changes(parser, args.set, args.scale)
+
+    from fabric_costing import db
+    from fabric_costing.kernel import RecipeBatch
+    from fabric_costing.sheets import COSTING_SHEET_COLUMNS, filter_qualities
+
+    qualities = db.list_qualities(COSTING_SHEET_COLUMNS)
+    if args.ids:
+        wanted = {int(x) for x in args.ids.split(",") if x.strip()}
+        qualities = [q for q in qualities if q["id"] in wanted]
+    qualities = filter_qualities(qualities, name_query=args.name)
+    if not qualities:
+        print("No qualities match.")
+        return 1
+
+    try:
+        plan = plan_edit(RecipeBatch.from_qualities(qualities, db.get_latest_yarn_price_map()), changes)
+    except ValueError as e:
+        parser.error(str(e))
+
+    before, after = plan["before"]["rfd_sale_per_m"], plan["after"]["rfd_sale_per_m"]
+    shown = len(qualities) if not args.limit else min(args.limit, len(qualities))
+    print(f"{'id':>7}  {'quality':<32} {'RFD sale':>9} {'->':>9} {'change':>8}")
+    for n in range(shown):
+        q = qualities[n]
+        print(f"{q['id']:>7}  {q['quality_name'][:32]:<32} {before[n]:9.2f} {after[n]:9.2f} {after[n] - before[n]:+8.2f}")
+    if len(qualities) > shown:
+        print(f"... and {len(qualities) - shown} more")
+    print(f"{len(qualities)} qualities, RFD sale {np.mean(after - before):+.2f} ₹/m on average")
+
+    if not args.apply:
+        print("Preview only: run with --apply to write.")
+        return 0
+    ids = apply_edit(plan, qualities)
+    print(f"Updated {len(ids)} qualities in one transaction.")
+    skipped = len(qualities) - len(ids)
+    if skipped:
+        print(f"{skipped} changed since they were read and were left alone – run again to include them.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
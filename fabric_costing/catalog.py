@@ -0,0 +1,268 @@
+"""
+Immutable catalog structures, shared process-wide.
+
+st.cache_data pickles a value on store and unpickles a fresh copy on every
+hit – for thousands of quality rows that is real time on every rerun.
+Frozen rows are safe to hand to every session and thread as-is (nobody
+can mutate them), so the app caches them with st.cache_resource and a hit
+is just a reference.
+
+    rows = freeze_rows(db.list_qualities(PRICING_SHEET_COLUMNS))   # tuple of FrozenRow
+    register("qualities (20 cols)", rows)                           # memory_report() shows its size
+
+(The yarn price map is already compact and read-only: see yarn_table.)
+
+RefreshAhead keeps such a value fresh without making a reader wait: it
+reloads in a background thread shortly before the value expires and swaps
+the new one in (stale-while-revalidate).
+
+    prices = RefreshAhead("yarn_price_map", db.get_latest_yarn_price_map, ttl=300)
+    prices.warm()                      # start-up: load in the background now
+    prices.get()                       # current value; only the very first load is waited for
+"""
+import sys
+import threading
+import time
+import weakref
+from collections.abc import Mapping
+from types import MappingProxyType
+
+# Strings up to this length are interned (yarn names, modes, ...), so equal
+# values across thousands of rows are stored once.
+_INTERN_MAX_LEN = 64
+
+
+class FrozenRow(Mapping):
+    """
+    Read-only row: a tuple of values plus a field -> index map shared by
+    every row of the same query. Reads like a dict (row["x"], row.get("x"),
+    dict(row)); cannot be modified.
+    """
+    __slots__ = ("_fields", "_values")
+
+    def __init__(self, fields, values):
+        object.__setattr__(self, "_fields", fields)
+        object.__setattr__(self, "_values", values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenRow is read-only")
+
+    def __getitem__(self, key):
+        return self._values[self._fields[key]]
+
+    def get(self, key, default=None):
+        i = self._fields.get(key)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f"FrozenRow({dict(self)!r})"
+
+    def __reduce__(self):
+        return (FrozenRow, (self._fields, self._values))
+
+
+def _freeze_value(val):
+    if isinstance(val, str) and len(val) <= _INTERN_MAX_LEN:
+        return sys.intern(val)
+    return val
+
+
+def freeze_rows(rows):
+    """Tuple of FrozenRow from dict-like rows (e.g. RealDictRow)."""
+    field_maps = {}
+    out = []
+    for r in rows:
+        keys = tuple(r.keys())
+        fields = field_maps.get(keys)
+        if fields is None:
+            fields = field_maps[keys] = {k: i for i, k in enumerate(keys)}
+        out.append(FrozenRow(fields, tuple(_freeze_value(r[k]) for k in keys)))
+    return tuple(out)
+
+
+# ---------------------------
+# Memory accounting
+# ---------------------------
+
+def deep_sizeof(obj):
+    """
+    Approximate bytes held by obj, counting every distinct object once
+    (shared strings / field maps are not double counted).
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, (dict, MappingProxyType)):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (tuple, list, set, frozenset)):
+            stack.extend(o)
+        else:
+            # __slots__ records (FrozenRow, YarnTable, ...)
+            for cls in type(o).__mro__:
+                stack.extend(getattr(o, s) for s in getattr(cls, "__slots__", ()) if hasattr(o, s))
+    return total
+
+
+_lock = threading.Lock()
+_registry = {}   # name -> {"rows", "bytes", "built_at"}
+
+
+def register(name, value, rows=None):
+    """Record the size of a freshly built cache entry; returns value unchanged."""
+    entry = {"rows": len(value) if rows is None else rows, "bytes": deep_sizeof(value), "built_at": time.time()}
+    with _lock:
+        _registry[name] = entry
+    return value
+
+
+def memory_report():
+    """[{cache, rows, MB, age s}] for every registered catalog cache."""
+    now = time.time()
+    with _lock:
+        items = sorted(_registry.items())
+    return [
+        {
+            "cache": name,
+            "rows": e["rows"],
+            "MB": round(e["bytes"] / 1048576.0, 2),
+            "age s": round(now - e["built_at"]),
+        }
+        for name, e in items
+    ]
+
+
+# ---------------------------
+# Refresh-ahead values
+# ---------------------------
+
+REFRESH_AHEAD = 0.2   # reload in the background once this fraction of the ttl is left
+RETRY_SECONDS = 15.0  # after a failed background reload, wait this long before the next try
+
+
+class RefreshAhead:
+    """
+    A shared value reloaded before it goes stale. `ahead` seconds before
+    `ttl` runs out a daemon thread runs `load` (scheduled after each load,
+    and on get() as a fallback) and the result replaces the value in a
+    single reference swap; get() keeps returning the current value
+    meanwhile. A failed reload keeps the old value (last_error says why)
+    and is retried after RETRY_SECONDS. get() only waits for the first
+    load, or when the value is more than `max_stale` seconds past its ttl
+    (reloads have been failing that long).
+    ttl=None: never expires by age – for values derived from `depends`,
+    rebuilt in the background on the first get() after one of them swaps.
+    The schedule stops once the holder itself is garbage collected.
+    """
+
+    def __init__(self, name, load, ttl=300.0, ahead=None, max_stale=None, depends=()):
+        self.name = name
+        self.load = load
+        self.ttl = ttl
+        self.ahead = (ttl or 0.0) * REFRESH_AHEAD if ahead is None else ahead
+        self.max_stale = (ttl or 0.0) if max_stale is None else max_stale
+        self.depends = tuple(depends)
+        self.version = 0          # bumped on every swap (dependents compare it)
+        self.last_error = None
+        self._current = None      # (value, loaded_at, dependency versions) – replaced, never mutated
+        self._lock = threading.Lock()        # held while loading: one load at a time
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._failed_at = 0.0
+
+    def get(self):
+        current = self._current
+        if current is None:
+            return self.refresh()
+        if self.ttl is not None:
+            age = time.time() - current[1]
+            if age >= self.ttl + self.max_stale:
+                return self.refresh()
+            if age >= self.ttl - self.ahead:
+                self._start()
+                return current[0]
+        if any(d.version != v for d, v in zip(self.depends, current[2])):
+            self._start()
+        return current[0]
+
+    def refresh(self):
+        """Load now and return the new value (waits for a load already running instead of repeating it)."""
+        seen = self._current
+        with self._lock:
+            if self._current is not seen:
+                return self._current[0]
+            return self._load()
+
+    def warm(self):
+        """Start loading in the background if nothing is loaded yet."""
+        if self._current is None:
+            self._start(force=True)
+
+    def age(self):
+        """Seconds since the current value was loaded (None before the first load)."""
+        current = self._current
+        return None if current is None else time.time() - current[1]
+
+    def _load(self):
+        # caller holds self._lock
+        versions = tuple(d.version for d in self.depends)
+        try:
+            value = self.load()
+        except Exception as e:
+            self.last_error = e
+            self._failed_at = time.time()
+            raise
+        self._current = (value, time.time(), versions)
+        self.version += 1
+        self.last_error = None
+        if self.ttl is not None:
+            self._schedule(max(self.ttl - self.ahead, 0.0))
+        return value
+
+    def _schedule(self, delay):
+        ref = weakref.ref(self)  # a pending timer must not keep a retired holder alive
+
+        def fire():
+            holder = ref()
+            if holder is not None:
+                holder._start(force=True)
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+
+    def _start(self, force=False):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if not force and time.time() - self._failed_at < RETRY_SECONDS:
+                return
+            self._thread = threading.Thread(target=self._background, name=f"refresh:{self.name}", daemon=True)
+            self._thread.start()
+
+    def _background(self):
+        if not self._lock.acquire(blocking=False):
+            return  # a foreground load is running
+        try:
+            self._load()
+        except Exception:
+            # keep serving the current value; last_error has the reason
+            if self.ttl is not None and self._current is not None:
+                self._schedule(RETRY_SECONDS)
+        finally:
+            self._lock.release()
@@ -0,0 +1,456 @@
+"""
+Pure costing math – no Streamlit, no DB.
+Safe to import from scripts, tests, workers and process pools.
+"""
+import json
+
+from fabric_costing.yarn_table import YarnTable
+
+# qualities columns read by compute_dynamic_cost (loaders can fetch just these)
+RECIPE_COLUMNS = (
+    "ends", "rs", "warp_denier", "warp_yarn_name", "warp_yarn_price",
+    "picks", "weft_denier_mode", "weft_denier", "weft_count",
+    "weft_yarn_name", "weft_yarn_price",
+    "weaving_rate_per_pick", "grey_markup_percent",
+    "rfd_charge_per_m", "rfd_shortage_percent", "rfd_markup_percent",
+    "include_interest", "wefts_json",
+)
+
+
+def build_yarn_price_map(rows):
+    """
+    Build the lookup used by compute_dynamic_cost from the latest
+    yarn_prices rows (dict-like, one per (name, yarn_type)).
+    Key: (name, yarn_type)
+    Value: row with price_per_kg, denier, count
+    """
+    price_map = {}
+
+    for r in rows:
+        # exact type
+        price_map[(r["name"], r["yarn_type"])] = r
+
+        # fallback: treat "both" as warp + weft
+        if r["yarn_type"] == "both":
+            price_map[(r["name"], "warp")] = r
+            price_map[(r["name"], "weft")] = r
+
+    return price_map
+
+
+def lookup_yarn(yarn_price_map, name, yarn_type):
+    """
+    (price_per_kg, denier, count) of the latest row for (name, yarn_type),
+    or None. yarn_price_map: a YarnTable or a build_yarn_price_map() dict.
+    """
+    if isinstance(yarn_price_map, YarnTable):
+        return yarn_price_map.lookup(name, yarn_type)
+    row = yarn_price_map.get((name, yarn_type))
+    if not row:
+        return None
+    return row["price_per_kg"], row["denier"], row["count"]
+
+
+def resolve_warp(q, yarn_price_map):
+    """
+    (warp_denier, warp_price) for a recipe: stored values,
+    overridden by the latest yarn row if warp_yarn_name is linked.
+    """
+    warp_denier = float(q["warp_denier"]) if q["warp_denier"] is not None else 0.0
+    warp_price = float(q["warp_yarn_price"]) if q["warp_yarn_price"] is not None else 0.0
+
+    if q.get("warp_yarn_name"):
+        yarn = lookup_yarn(yarn_price_map, q["warp_yarn_name"], "warp")
+        if yarn:
+            row_price, row_denier, _ = yarn
+            if row_price is not None:
+                warp_price = row_price
+            if row_denier is not None:
+                warp_denier = row_denier  # if you want denier to follow yarn table
+
+    return warp_denier, warp_price
+
+
+def resolve_weft(wf, yarn_price_map):
+    """
+    One wefts_json entry -> (picks, denier, price, mode, count, yarn_name),
+    with price / denier / count taken from the yarn table when linked.
+    """
+    p = float(wf.get("picks", 0.0) or 0.0)
+    d = float(wf.get("denier", 0.0) or 0.0)
+    price = float(wf.get("price", 0.0) or 0.0)
+    mode = wf.get("mode", "denier")
+    cnt = wf.get("count", 0.0) or 0.0
+    yarn_name = wf.get("yarn_name")
+
+    # Override from yarn table if yarn_name is linked
+    if yarn_name and yarn_name != "(manual price)":
+        yarn = lookup_yarn(yarn_price_map, yarn_name, "weft")
+        if yarn:
+            row_price, row_denier, row_count = yarn
+            if row_price is not None:
+                price = row_price
+
+            if mode == "denier" and row_denier:
+                d = row_denier
+
+            if mode == "count":
+                cnt = row_count
+                if cnt and cnt > 0:
+                    d = 5315.0 / cnt
+
+    return p, d, price, mode, cnt, yarn_name
+
+
+def compute_dynamic_cost(q, yarn_price_map):
+    
+    """
+    Recompute costing using the recipe + latest yarn prices.
+    - Uses wefts_json if present (multi-weft).
+    - Falls back to single-weft fields if not.
+    yarn_price_map: see build_yarn_price_map()
+    """
+    inputs, weft_details = resolve_recipe(q, yarn_price_map)
+
+    # 🔥 Use your existing costing function
+    cost = calculate_costing(**inputs)
+
+    # Also return the aggregated weft info in case UI wants it
+    cost["_dynamic_total_picks"] = inputs["picks"]
+    cost["_dynamic_eff_weft_denier"] = inputs["weft_denier"]
+    cost["_dynamic_eff_weft_price"] = inputs["weft_yarn_price"]
+    cost["_weft_breakdown"] = weft_details
+
+    return cost
+
+
+def resolve_recipe(q, yarn_price_map):
+    """
+    A stored recipe reduced to calculate_costing() keyword arguments, with
+    the latest yarn prices applied and the wefts aggregated to one
+    effective weft (total picks, pick-weighted denier, weight-weighted price).
+    Returns (inputs, weft_details) – weft_details is the per-weft breakdown.
+    """
+
+    # --- Warp: dynamic price & optional denier from yarn table ---
+    warp_denier, warp_price = resolve_warp(q, yarn_price_map)
+
+    ends = float(q["ends"])
+    rs = float(q["rs"])
+
+    # --- Build weft list ---
+    # --- Build weft list ---
+    weft_entries = []
+    weft_details = []   # 👈 for per-weft breakdown
+
+    if q.get("wefts_json"):
+        # Multi-weft case
+        try:
+            stored_wefts = json.loads(q["wefts_json"])
+        except Exception:
+            stored_wefts = []
+
+        for wf in stored_wefts:
+            p, d, price, mode, cnt, yarn_name = resolve_weft(wf, yarn_price_map)
+
+            # per-weft technical weight / 100 m (no shortage)
+            if p > 0 and d > 0:
+                weight_100 = (p * d * rs) / 90000.0
+            else:
+                weight_100 = 0.0
+
+            if p > 0 and d > 0 and price > 0:
+                weft_entries.append({"picks": p, "denier": d, "price": price})
+
+            if p > 0 and d > 0:
+                weft_details.append({
+                    "label": f"Weft {len(weft_details) + 1}",
+                    "picks": p,
+                    "denier": d,
+                    "price": price,
+                    "weight_100": weight_100,
+                    "mode": mode,
+                    "count": cnt,
+                    "yarn_name": yarn_name,
+                })
+    else:
+        # Old single-weft records (no wefts_json)
+        p = float(q["picks"])
+        d = float(q["weft_denier"])
+        price = float(q["weft_yarn_price"])
+        mode = q.get("weft_denier_mode", "denier")
+        cnt = q.get("weft_count")
+        yarn_name = q.get("weft_yarn_name")
+
+        if yarn_name:
+            yarn = lookup_yarn(yarn_price_map, yarn_name, "weft")
+            if yarn:
+                row_price, row_denier, row_count = yarn
+                if row_price is not None:
+                    price = row_price
+                if mode == "denier" and row_denier:
+                    d = row_denier
+                if mode == "count":
+                    cnt = row_count
+                    if cnt and cnt > 0:
+                        d = 5315.0 / cnt
+
+        if p > 0 and d > 0 and price > 0:
+            weft_entries.append({"picks": p, "denier": d, "price": price})
+
+        if p > 0 and d > 0:
+            weight_100 = (p * d * rs) / 90000.0
+            weft_details.append({
+                "label": "Weft 1",
+                "picks": p,
+                "denier": d,
+                "price": price,
+                "weight_100": weight_100,
+                "mode": mode,
+                "count": cnt,
+                "yarn_name": yarn_name,
+            })
+
+    # --- Aggregate wefts to effective denier & price ---
+    total_picks = sum(w["picks"] for w in weft_entries)
+    num_for_den = sum(w["picks"] * w["denier"] for w in weft_entries)
+    num_for_price = sum(w["picks"] * w["denier"] * w["price"] for w in weft_entries)
+
+    if total_picks <= 0 or num_for_den <= 0:
+        # Fallback to stored single-weft values if something's off
+        total_picks = float(q["picks"])
+        eff_weft_denier = float(q["weft_denier"])
+        eff_weft_price = float(q["weft_yarn_price"])
+    else:
+        eff_weft_denier = num_for_den / total_picks
+        eff_weft_price = num_for_price / num_for_den
+
+    weaving_rate = float(q["weaving_rate_per_pick"])
+    grey_markup = float(q["grey_markup_percent"])
+    rfd_charge = float(q["rfd_charge_per_m"])
+    rfd_short = float(q["rfd_shortage_percent"])
+    rfd_markup = float(q["rfd_markup_percent"])
+
+    inputs = {
+        "ends": ends,
+        "warp_denier": warp_denier,
+        "picks": total_picks,
+        "weft_denier": eff_weft_denier,
+        "rs": rs,
+        "warp_yarn_price": warp_price,
+        "weft_yarn_price": eff_weft_price,
+        "weaving_rate_per_pick": weaving_rate,
+        "grey_markup_percent": grey_markup,
+        "rfd_charge_per_m": rfd_charge,
+        "rfd_shortage_percent": rfd_short,
+        "rfd_markup_percent": rfd_markup,
+        "include_interest": bool(q.get("include_interest", True)),
+    }
+    return inputs, weft_details
+
+def _flag(val):
+    """include_interest as a multiplier: bool -> 1.0 / 0.0, numpy arrays as they are."""
+    return val if hasattr(val, "dtype") else (1.0 if val else 0.0)
+
+
+def calculate_costing(
+    ends, warp_denier, picks, weft_denier, rs,
+    warp_yarn_price, weft_yarn_price,
+    weaving_rate_per_pick, grey_markup_percent,
+    rfd_charge_per_m, rfd_shortage_percent, rfd_markup_percent,
+    include_interest=True,       # 👈 NEW
+):
+    """
+    Single-weft costing. Written without branches on the inputs, so it also
+    runs on numpy arrays (one element per recipe) – see kernel.py.
+    """
+
+    # Base weights (NO shortage)
+    warp_weight_100 = (ends * warp_denier) / 90000.0
+    weft_weight_100 = (picks * weft_denier * rs) / 90000.0
+
+    # With shortage (for costing)
+    warp_weight_100_short = warp_weight_100 * 1.09
+    weft_weight_100_short = weft_weight_100 * 1.03
+
+    warp_cost_100 = warp_weight_100_short * warp_yarn_price
+    weft_cost_100 = weft_weight_100_short * weft_yarn_price
+
+    fabric_weight_100 = warp_weight_100 + weft_weight_100  # technical, no shortage
+
+    # Weaving (per meter, then per 100 m)
+    weaving_per_m = weaving_rate_per_pick * picks
+    weaving_charge_100 = weaving_per_m * 100.0
+
+    # 🔹 Interest on yarn – now optional
+    interest_on_yarn_100_full = (warp_cost_100 + weft_cost_100) * 0.04
+    interest_on_yarn_100 = interest_on_yarn_100_full * _flag(include_interest)
+
+    # Grey cost
+    final_grey_cost_100 = warp_cost_100 + weft_cost_100 + weaving_charge_100 + interest_on_yarn_100
+    grey_cost_per_m = final_grey_cost_100 / 100.0
+
+    # Grey sale with markup as margin on selling price (markup 0 -> sale = cost)
+    grey_sale_per_m = grey_cost_per_m / (1 - grey_markup_percent / 100.0)
+    grey_sale_100 = grey_sale_per_m * 100.0
+
+    # RFD cost: (grey + RFD charge) * (1 + shortage%)
+    base_for_rfd = grey_cost_per_m + rfd_charge_per_m
+    rfd_cost_per_m = base_for_rfd * (1 + rfd_shortage_percent / 100.0)
+
+    # RFD sale with markup as margin on selling price (markup 0 -> sale = cost)
+    rfd_sale_per_m = rfd_cost_per_m / (1 - rfd_markup_percent / 100.0)
+    rfd_cost_100 = rfd_cost_per_m * 100.0
+    rfd_sale_100 = rfd_sale_per_m * 100.0
+
+    return {
+        "warp_weight_100": warp_weight_100,
+        "weft_weight_100": weft_weight_100,
+        "fabric_weight_100": fabric_weight_100,
+        "warp_cost_100": warp_cost_100,
+        "weft_cost_100": weft_cost_100,
+        "weaving_charge_100": weaving_charge_100,
+        "interest_on_yarn_100": interest_on_yarn_100,
+        "final_grey_cost_100": final_grey_cost_100,
+        "grey_cost_per_m": grey_cost_per_m,
+        "grey_sale_per_m": grey_sale_per_m,
+        "grey_sale_100": grey_sale_100,
+        "rfd_cost_per_m": rfd_cost_per_m,
+        "rfd_sale_per_m": rfd_sale_per_m,
+        "rfd_cost_100": rfd_cost_100,
+        "rfd_sale_100": rfd_sale_100,
+    }
+
+def calculate_costing_multi_weft(
+    ends, warp_denier, rs,
+    warp_yarn_price,
+    weft_list,
+    weaving_rate_per_pick, grey_markup_percent,
+    rfd_charge_per_m, rfd_shortage_percent, rfd_markup_percent,
+    include_interest=True,
+):
+    
+    """
+    Multi-weft version of calculate_costing.
+    weft_list = [
+        {"picks": ..., "weft_denier": ..., "weft_yarn_price": ...},
+        ...
+    ]
+    """
+    # ---- Warp (same logic as before) ----
+    warp_weight_100 = (ends * warp_denier) / 90000.0
+    warp_weight_100_short = warp_weight_100 * 1.09
+    warp_cost_100 = warp_weight_100_short * warp_yarn_price
+
+    # ---- Sum over all wefts ----
+    total_weft_weight_100 = 0.0          # technical (no shortage)
+    total_weft_weight_100_short = 0.0    # with shortage
+    total_weft_cost_100 = 0.0
+    total_picks = 0.0
+
+    for w in weft_list:
+        picks = w["picks"]
+        weft_den = w["weft_denier"]
+        price = w["weft_yarn_price"]
+
+        weft_weight_100 = (picks * weft_den * rs) / 90000.0
+        weft_weight_100_short = weft_weight_100 * 1.03
+        weft_cost_100 = weft_weight_100_short * price
+
+        total_weft_weight_100 += weft_weight_100
+        total_weft_weight_100_short += weft_weight_100_short
+        total_weft_cost_100 += weft_cost_100
+        total_picks += picks
+
+    # ---- Fabric weight (technical) ----
+    fabric_weight_100 = warp_weight_100 + total_weft_weight_100
+
+    # ---- Weaving ----
+    weaving_per_m = weaving_rate_per_pick * total_picks
+    weaving_charge_100 = weaving_per_m * 100.0
+
+    # ---- Interest on yarn (respect toggle) ----
+    if include_interest:
+        interest_on_yarn_100 = (warp_cost_100 + total_weft_cost_100) * 0.04
+    else:
+        interest_on_yarn_100 = 0.0
+
+    # ---- Grey cost ----
+    final_grey_cost_100 = warp_cost_100 + total_weft_cost_100 + weaving_charge_100 + interest_on_yarn_100
+    grey_cost_per_m = final_grey_cost_100 / 100.0
+
+    # Grey sale with markup as margin on selling price
+    if grey_markup_percent == 0:
+        grey_sale_per_m = grey_cost_per_m
+    else:
+        grey_sale_per_m = grey_cost_per_m / (1 - grey_markup_percent / 100.0)
+    grey_sale_100 = grey_sale_per_m * 100.0
+
+    # RFD cost: (grey + RFD charge) * (1 + shortage%)
+    base_for_rfd = grey_cost_per_m + rfd_charge_per_m
+    rfd_cost_per_m = base_for_rfd * (1 + rfd_shortage_percent / 100.0)
+
+    # RFD sale with markup as margin on selling price
+    if rfd_markup_percent == 0:
+        rfd_sale_per_m = rfd_cost_per_m
+    else:
+        rfd_sale_per_m = rfd_cost_per_m / (1 - rfd_markup_percent / 100.0)
+    rfd_cost_100 = rfd_cost_per_m * 100.0
+    rfd_sale_100 = rfd_sale_per_m * 100.0
+
+    return {
+        "warp_weight_100": warp_weight_100,
+        "weft_weight_100": total_weft_weight_100,
+        "fabric_weight_100": fabric_weight_100,
+        "warp_cost_100": warp_cost_100,
+        "weft_cost_100": total_weft_cost_100,
+        "weaving_charge_100": weaving_charge_100,
+        "interest_on_yarn_100": interest_on_yarn_100,
+        "final_grey_cost_100": final_grey_cost_100,
+        "grey_cost_per_m": grey_cost_per_m,
+        "grey_sale_per_m": grey_sale_per_m,
+        "grey_sale_100": grey_sale_100,
+        "rfd_cost_per_m": rfd_cost_per_m,
+        "rfd_sale_per_m": rfd_sale_per_m,
+        "rfd_cost_100": rfd_cost_100,
+        "rfd_sale_100": rfd_sale_100,
+    }
+
+def calculate_deal_margin(
+    cost_with_interest_per_m,
+    interest_per_m,
+    deal_price_per_m,
+    payment_mode,        # "net" or "discount"
+    discount_percent,
+    brokerage_percent,
+    quantity_m,
+):
+    # ---- Discount ----
+    discount_amt = deal_price_per_m * (discount_percent / 100.0)
+    price_after_discount = deal_price_per_m - discount_amt
+
+    # ---- Brokerage (after discount) ----
+    brokerage_amt = price_after_discount * (brokerage_percent / 100.0)
+    realised_price = price_after_discount - brokerage_amt
+
+    # ---- Interest logic (ONLY CHANGE HERE) ----
+    # Full interest is 4%, but even discounted deals carry ~2%
+    if payment_mode == "discount":
+        actual_cost = cost_with_interest_per_m - (interest_per_m / 2.0)
+        interest_gain = interest_per_m / 2.0
+    else:
+        actual_cost = cost_with_interest_per_m
+        interest_gain = 0.0
+
+    profit_per_m = realised_price - actual_cost
+    total_profit = profit_per_m * quantity_m
+
+    return {
+        "realised_price": realised_price,
+        "discount_amt": discount_amt,
+        "brokerage_amt": brokerage_amt,
+        "actual_cost": actual_cost,
+        "interest_gain": interest_gain,
+        "profit_per_m": profit_per_m,
+        "total_profit": total_profit,
+    }
@@ -0,0 +1,1031 @@
+"""
+Postgres (Supabase) data access – no Streamlit.
+
+psycopg2 is imported lazily on first connection, so importing this module
+is cheap. The connection string comes from a provider callable; by default
+the SUPABASE_URI environment variable. The Streamlit app installs a
+provider that reads st.secrets instead.
+
+Connections come from a per-process pool; conn.close() hands them back.
+The hottest reads run as server-side prepared statements, PREPAREd once
+per pooled connection and then only EXECUTEd, so Postgres plans them once.
+
+    FABRIC_DB_POOL=0          open a fresh connection per call (no pool)
+    FABRIC_DB_POOL_SIZE=5     idle connections kept per process
+    FABRIC_DB_POOL_MAX=20     max connections checked out at once (then: unpooled)
+    FABRIC_DB_PREPARE=0       plain SQL text – needed behind PgBouncer /
+                              the Supabase pooler in transaction mode
+
+With FABRIC_REPLICA set, the read helpers are served from a local SQLite
+replica and writes are copied into it after they commit (see replica.py).
+"""
+import functools
+import json
+import os
+import threading
+
+from fabric_costing import perf, replica, tracing
+from fabric_costing.dedupe import recipe_hashes
+from fabric_costing.yarn_table import YarnTable
+
+_conn_str_provider = None
+
+
+def set_conn_str_provider(provider):
+    """provider: zero-arg callable returning the Postgres connection string."""
+    global _conn_str_provider
+    _conn_str_provider = provider
+
+
+def get_conn_str():
+    if _conn_str_provider is not None:
+        return _conn_str_provider()
+    conn_str = os.getenv("SUPABASE_URI")
+    if not conn_str:
+        raise RuntimeError("No database configured: set SUPABASE_URI.")
+    return conn_str
+
+
+# ---------------------------
+# Connection pool
+# ---------------------------
+
+_pool_lock = threading.Lock()
+_pool = None                # (pid, conn_str, ThreadedConnectionPool)
+_connection_class = None
+
+
+def _preparing_connection_class():
+    """psycopg2 connection subclass that remembers its PREPAREd statements."""
+    global _connection_class
+    if _connection_class is None:
+        import psycopg2.extensions
+
+        class PreparingConnection(psycopg2.extensions.connection):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.prepared_statements = set()
+
+        _connection_class = PreparingConnection
+    return _connection_class
+
+
+def _get_pool(conn_str):
+    global _pool
+    with _pool_lock:
+        pid = os.getpid()
+        if _pool is None or _pool[0] != pid or _pool[1] != conn_str:
+            from psycopg2.pool import ThreadedConnectionPool
+
+            # A forked child must not touch the parent's sockets: just forget them.
+            if _pool is not None and _pool[0] == pid:
+                _pool[2].closeall()
+            _pool = (pid, conn_str, ThreadedConnectionPool(
+                int(os.getenv("FABRIC_DB_POOL_SIZE", "5")),
+                int(os.getenv("FABRIC_DB_POOL_MAX", "20")),
+                conn_str,
+                connection_factory=_preparing_connection_class(),
+            ))
+        return _pool[2]
+
+
+def close_pool():
+    """Close every pooled connection of this process (e.g. before exit)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[0] == os.getpid():
+            _pool[2].closeall()
+        _pool = None
+
+
+class PooledConnection:
+    """A checked-out connection; close() rolls back and returns it to the pool."""
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._pool is None:
+            conn.close()
+            return
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        try:
+            self._pool.putconn(conn, close=broken)
+        except Exception:  # pool closed / replaced meanwhile
+            conn.close()
+
+    def __del__(self):
+        # a helper that raised before close() still gives its connection back
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _checkout():
+    import psycopg2
+    from psycopg2.pool import PoolError
+
+    conn_str = get_conn_str()
+    if os.getenv("FABRIC_DB_POOL", "1") == "0":
+        return PooledConnection(psycopg2.connect(conn_str, connection_factory=_preparing_connection_class()), None)
+    pool = _get_pool(conn_str)
+    try:
+        conn = pool.getconn()
+    except PoolError:
+        # pool exhausted: don't block the page, use a one-off connection
+        return PooledConnection(psycopg2.connect(conn_str, connection_factory=_preparing_connection_class()), None)
+    if conn.closed:
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    return PooledConnection(conn, pool)
+
+
+class ReadOnlyError(RuntimeError):
+    """Postgres is unreachable; the local replica still serves reads, writes are refused."""
+
+
+def get_conn():
+    """
+    A connection to Supabase Postgres from the process pool (close() returns it).
+    Wrapped for query tracing (and per-rerun perf stats when active).
+    With a replica, an unreachable database raises ReadOnlyError.
+    """
+    rep = replica.current()
+    try:
+        conn = _checkout()
+    except Exception as e:
+        import psycopg2
+
+        if rep is None or not isinstance(e, psycopg2.OperationalError):
+            raise
+        rep.mark_offline(e)
+        raise ReadOnlyError("Database unreachable – read-only, serving the local replica.") from e
+    return perf.wrap_connection(tracing.wrap_connection(conn))
+
+
+def read_only():
+    """True when a replica is serving reads because Postgres can't be reached."""
+    rep = replica.current()
+    return rep is not None and rep.online is False
+
+
+# ---------------------------
+# Local replica (replica.py)
+# ---------------------------
+
+def _replica_read(fn):
+    """Answer this read from the local replica when one is enabled (same name, same arguments)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        rep = replica.active()
+        if rep is None:
+            return fn(*args, **kwargs)
+        return getattr(rep, fn.__name__)(*args, **kwargs)
+    return wrapper
+
+
+def _replicate(conn, table, ids):
+    """Write-through: after a commit on conn, copy the written rows into the replica."""
+    rep = replica.current()
+    if rep is not None:
+        rep.pull(conn, table, ids)
+
+
+# ---------------------------
+# Prepared statements
+# ---------------------------
+
+# All qualities columns, in table order (see schema.sql)
+QUALITY_COLUMNS = (
+    "id", "created_at", "quality_name",
+    "ends_mode", "ends", "reed", "rs", "borders", "warp_denier",
+    "warp_yarn_name", "warp_yarn_price",
+    "picks", "weft_rs", "weft_denier_mode", "weft_denier", "weft_count",
+    "weft_yarn_name", "weft_yarn_price",
+    "weaving_rate_per_pick", "grey_markup_percent",
+    "rfd_charge_per_m", "rfd_shortage_percent", "rfd_markup_percent",
+    "warp_weight_100", "weft_weight_100", "fabric_weight_100",
+    "warp_cost_100", "weft_cost_100", "weaving_charge_100",
+    "interest_on_yarn_100", "final_grey_cost_100",
+    "grey_sale_100", "rfd_cost_100", "rfd_sale_100",
+    "include_interest", "wefts_json",
+    "recipe_hash", "construction_hash",
+)
+
+# name -> (parameter types, SQL with $n placeholders)
+PREPARED = {
+    "latest_yarn_price": ("text", """
+        SELECT price_per_kg, denier, count
+        FROM yarn_prices
+        WHERE name = $1
+        ORDER BY valid_from DESC, id DESC
+        LIMIT 1
+    """),
+    "latest_yarn_price_typed": ("text, text", """
+        SELECT price_per_kg, denier, count
+        FROM yarn_prices
+        WHERE name = $1 AND (yarn_type = $2 OR yarn_type = 'both')
+        ORDER BY valid_from DESC, id DESC
+        LIMIT 1
+    """),
+    "latest_yarn_row": ("text", """
+        SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
+        FROM yarn_prices
+        WHERE name = $1
+        ORDER BY valid_from DESC, id DESC
+        LIMIT 1
+    """),
+    "latest_yarn_row_typed": ("text, text", """
+        SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
+        FROM yarn_prices
+        WHERE name = $1 AND (yarn_type = $2 OR yarn_type = 'both')
+        ORDER BY valid_from DESC, id DESC
+        LIMIT 1
+    """),
+    # explicit columns: a prepared SELECT * fails ("cached plan must not change
+    # result type") once a column is added to the table
+    "quality_by_id": ("integer", f"""
+        SELECT {", ".join(QUALITY_COLUMNS)}
+        FROM qualities
+        WHERE id = $1
+    """),
+    "yarn_names": ("", """
+        SELECT DISTINCT name FROM yarn_prices
+        ORDER BY name
+    """),
+    "yarn_names_typed": ("text", """
+        SELECT DISTINCT name FROM yarn_prices
+        WHERE yarn_type = $1 OR yarn_type = 'both'
+        ORDER BY name
+    """),
+}
+
+
+def prepare_enabled():
+    return os.getenv("FABRIC_DB_PREPARE", "1") != "0"
+
+
+def _plain_sql(name):
+    """The statement as ordinary psycopg2 SQL ($n -> %s)."""
+    types, sql = PREPARED[name]
+    for i in range(len([t for t in types.split(",") if t.strip()]), 0, -1):
+        sql = sql.replace(f"${i}", "%s")
+    return sql
+
+
+def execute_prepared(conn, cur, name, params=()):
+    """
+    Run PREPARED[name] on cur: PREPARE once per physical connection, then
+    EXECUTE. Falls back to plain SQL when FABRIC_DB_PREPARE=0.
+    """
+    if not prepare_enabled():
+        cur.execute(_plain_sql(name), params)
+        return
+    prepared = conn.prepared_statements
+    if name not in prepared:
+        types, sql = PREPARED[name]
+        cur.execute(f"PREPARE {name} ({types}) AS {sql}" if types else f"PREPARE {name} AS {sql}")
+        prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema.sql")
+
+
+def apply_schema():
+    """Create the app tables if missing (local / dev databases)."""
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        ddl = f.read()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(ddl)
+    conn.commit()
+    conn.close()
+
+
+def _dict_cursor():
+    from psycopg2.extras import RealDictCursor
+
+    return RealDictCursor
+
+
+@_replica_read
+def list_yarn_prices():
+    """All yarn price rows, latest first (Yarn Prices page table)."""
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute("""
+        SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
+        FROM yarn_prices
+        ORDER BY date(valid_from) DESC, id DESC
+    """)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def normalize_json(val):
+    if val is None:
+        return None
+    if isinstance(val, (dict, list)):
+        return json.dumps(val)
+    if isinstance(val, str):
+        return val
+    return None
+
+@_replica_read
+def list_all_qualities_full():
+    """
+    Fetch ALL qualities with all QUALITY_COLUMNS in one query.
+    Returns: list of dicts (same shape as get_quality_by_id)
+    """
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+
+    cur.execute(f"""
+        SELECT {", ".join(QUALITY_COLUMNS)}
+        FROM qualities
+        ORDER BY quality_name
+    """)
+
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def quality_columns(columns):
+    """
+    Canonical column tuple for a narrow load: known columns only, "id"
+    always included, table order, no duplicates – so equal requests make
+    equal cache keys. None means all columns.
+    """
+    if columns is None:
+        return None
+    wanted = set(columns) | {"id"}
+    unknown = wanted.difference(QUALITY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown qualities column(s): {', '.join(sorted(unknown))}")
+    return tuple(c for c in QUALITY_COLUMNS if c in wanted)
+
+
+@_replica_read
+def list_qualities(columns=None):
+    """
+    ALL qualities, but only `columns` (plus id) – e.g. sheets.PRICING_SHEET_COLUMNS.
+    columns=None is list_all_qualities_full().
+    Returns: list of dicts, ordered by quality_name.
+    """
+    columns = quality_columns(columns)
+    if columns is None:
+        return list_all_qualities_full()
+
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    # columns are checked against QUALITY_COLUMNS, so they are safe to inline
+    cur.execute(f"""
+        SELECT {", ".join(columns)}
+        FROM qualities
+        ORDER BY quality_name
+    """)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_replica_read
+def list_latest_yarn_prices():
+    """Latest yarn_prices row per (name, yarn_type): name, yarn_type, price_per_kg, denier, count."""
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+
+    cur.execute("""
+        SELECT DISTINCT ON (name, yarn_type)
+            name, yarn_type, price_per_kg, denier, count
+        FROM yarn_prices
+        ORDER BY name, yarn_type, valid_from DESC, id DESC
+    """)
+
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def get_latest_yarn_price_map():
+    """
+    Fetch latest yarn prices (one row per name + yarn_type) as a columnar
+    YarnTable – a read-only mapping:
+    Key: (name, yarn_type)
+    Value: row with price_per_kg, denier, count
+    """
+    return YarnTable.from_rows(list_latest_yarn_prices())
+
+@_replica_read
+def get_latest_yarn_price(name, yarn_type=None):
+    """
+    Returns (price_per_kg, denier, count) for the most recent record of this yarn.
+    Optionally filter by yarn_type.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    if yarn_type:
+        execute_prepared(conn, cur, "latest_yarn_price_typed", (name, yarn_type))
+    else:
+        execute_prepared(conn, cur, "latest_yarn_price", (name,))
+    row = cur.fetchone()
+    conn.close()
+    if row:
+        return row[0], row[1], row[2]
+    return None, None, None
+
+@_replica_read
+def list_yarn_names(yarn_type=None):
+    conn = get_conn()
+    cur = conn.cursor()
+    if yarn_type:
+        execute_prepared(conn, cur, "yarn_names_typed", (yarn_type,))
+    else:
+        execute_prepared(conn, cur, "yarn_names")
+    names = [r[0] for r in cur.fetchall()]
+    conn.close()
+    return names
+
+
+def save_yarn_price(name, yarn_type, count, denier, price_per_kg, valid_from):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO yarn_prices (name, yarn_type, count, denier, price_per_kg, valid_from)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        RETURNING id
+    """, (name, yarn_type, count, denier, price_per_kg, valid_from))
+    row_id = cur.fetchone()[0]
+    conn.commit()
+    _replicate(conn, "yarn_prices", [row_id])
+    conn.close()
+
+
+@_replica_read
+def get_latest_yarn_row(name, yarn_type=None):
+    """
+    Return latest full row for this yarn:
+    {id, name, yarn_type, count, denier, price_per_kg, valid_from}
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    if yarn_type:
+        execute_prepared(conn, cur, "latest_yarn_row_typed", (name, yarn_type))
+    else:
+        execute_prepared(conn, cur, "latest_yarn_row", (name,))
+    row = cur.fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "name": row[1],
+        "yarn_type": row[2],
+        "count": row[3],
+        "denier": row[4],
+        "price_per_kg": row[5],
+        "valid_from": row[6],
+    }
+
+
+def update_yarn_row(row_id, name, yarn_type, count, denier, price_per_kg, valid_from):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE yarn_prices
+        SET name = %s, yarn_type = %s, count = %s, denier = %s, price_per_kg = %s, valid_from = %s
+        WHERE id = %s
+    """, (name, yarn_type, count, denier, price_per_kg, valid_from, row_id))
+    conn.commit()
+    _replicate(conn, "yarn_prices", [row_id])
+    conn.close()
+
+
+def delete_yarn_completely(name):
+    """
+    Delete ALL rows for this yarn name.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM yarn_prices WHERE name = %s", (name,))
+    conn.commit()
+    conn.close()
+    rep = replica.current()
+    if rep is not None:
+        rep.drop_yarn(name)
+
+@_replica_read
+def list_all_qualities():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, quality_name, created_at
+        FROM qualities
+        ORDER BY quality_name
+    """)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+@_replica_read
+def get_quality_by_id(q_id):
+    conn = get_conn()
+    cur = conn.cursor()
+
+    execute_prepared(conn, cur, "quality_by_id", (q_id,))
+    row = cur.fetchone()
+    # Column names straight from the result (no information_schema round trip)
+    cols = [d[0] for d in cur.description]
+    conn.close()
+    if row:
+        return dict(zip(cols, row))
+    return None
+
+
+@_replica_read
+def get_qualities_by_ids(ids):
+    """Full rows for the given ids, in one round trip (order not guaranteed)."""
+    if not ids:
+        return []
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute(f"SELECT {', '.join(QUALITY_COLUMNS)} FROM qualities WHERE id = ANY(%s)", (list(ids),))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def save_quality(data):
+    """Insert a quality; returns its new id."""
+    conn = get_conn()
+    cur = conn.cursor()
+
+    cur.execute("""
+        INSERT INTO qualities (
+            created_at, quality_name,
+            ends_mode, ends, reed, rs, borders, warp_denier,
+            warp_yarn_name, warp_yarn_price,
+            picks, weft_rs, weft_denier_mode, weft_denier, weft_count,
+            weft_yarn_name, weft_yarn_price,
+            weaving_rate_per_pick, grey_markup_percent,
+            rfd_charge_per_m, rfd_shortage_percent, rfd_markup_percent,
+            warp_weight_100, weft_weight_100, fabric_weight_100,
+            warp_cost_100, weft_cost_100, weaving_charge_100,
+            interest_on_yarn_100, final_grey_cost_100,
+            grey_sale_100, rfd_cost_100, rfd_sale_100,
+            include_interest,
+            wefts_json,
+            recipe_hash, construction_hash
+        )
+        VALUES (
+            %s, %s,
+            %s, %s, %s, %s, %s, %s,
+            %s, %s,
+            %s, %s, %s, %s, %s,
+            %s, %s,
+            %s, %s,
+            %s, %s, %s,
+            %s, %s, %s,
+            %s, %s, %s,
+            %s, %s,
+            %s, %s, %s,
+            %s, %s,
+            %s, %s
+        )
+        RETURNING id
+    """, (
+        data["created_at"], data["quality_name"],
+        data["ends_mode"], data["ends"], data["reed"], data["rs"], data["borders"], data["warp_denier"],
+        data["warp_yarn_name"], data["warp_yarn_price"],
+        data["picks"], data["weft_rs"], data["weft_denier_mode"], data["weft_denier"], data["weft_count"],
+        data["weft_yarn_name"], data["weft_yarn_price"],
+        data["weaving_rate_per_pick"], data["grey_markup_percent"],
+        data["rfd_charge_per_m"], data["rfd_shortage_percent"], data["rfd_markup_percent"],
+        data["warp_weight_100"], data["weft_weight_100"], data["fabric_weight_100"],
+        data["warp_cost_100"], data["weft_cost_100"], data["weaving_charge_100"],
+        data["interest_on_yarn_100"], data["final_grey_cost_100"],
+        data["grey_sale_100"], data["rfd_cost_100"], data["rfd_sale_100"],
+        bool(data.get("include_interest", True)),
+        normalize_json(data.get("wefts_json")),
+        *recipe_hashes(data),
+    ))
+    q_id = cur.fetchone()[0]
+
+    conn.commit()
+    _replicate(conn, "qualities", [q_id])
+    conn.close()
+    return q_id
+
+
+def update_quality(q_id, data):
+    conn = get_conn()
+    cur = conn.cursor()
+
+    cur.execute("""
+        UPDATE qualities SET
+            created_at = %s,
+            quality_name = %s,
+
+            ends_mode = %s,
+            ends = %s,
+            reed = %s,
+            rs = %s,
+            borders = %s,
+            warp_denier = %s,
+
+            warp_yarn_name = %s,
+            warp_yarn_price = %s,
+
+            picks = %s,
+            weft_rs = %s,
+            weft_denier_mode = %s,
+            weft_denier = %s,
+            weft_count = %s,
+
+            weft_yarn_name = %s,
+            weft_yarn_price = %s,
+
+            weaving_rate_per_pick = %s,
+            grey_markup_percent = %s,
+
+            rfd_charge_per_m = %s,
+            rfd_shortage_percent = %s,
+            rfd_markup_percent = %s,
+
+            warp_weight_100 = %s,
+            weft_weight_100 = %s,
+            fabric_weight_100 = %s,
+
+            warp_cost_100 = %s,
+            weft_cost_100 = %s,
+            weaving_charge_100 = %s,
+
+            interest_on_yarn_100 = %s,
+            final_grey_cost_100 = %s,
+            grey_sale_100 = %s,
+            rfd_cost_100 = %s,
+            rfd_sale_100 = %s,
+
+            wefts_json = %s,
+            include_interest = %s,
+
+            recipe_hash = %s,
+            construction_hash = %s
+        WHERE id = %s
+    """, (
+        data["created_at"],
+        data["quality_name"],
+
+        data["ends_mode"],
+        data["ends"],
+        data["reed"],
+        data["rs"],
+        data["borders"],
+        data["warp_denier"],
+
+        data["warp_yarn_name"],
+        data["warp_yarn_price"],
+
+        data["picks"],
+        data["weft_rs"],
+        data["weft_denier_mode"],
+        data["weft_denier"],
+        data["weft_count"],
+
+        data["weft_yarn_name"],
+        data["weft_yarn_price"],
+
+        data["weaving_rate_per_pick"],
+        data["grey_markup_percent"],
+
+        data["rfd_charge_per_m"],
+        data["rfd_shortage_percent"],
+        data["rfd_markup_percent"],
+
+        data["warp_weight_100"],
+        data["weft_weight_100"],
+        data["fabric_weight_100"],
+
+        data["warp_cost_100"],
+        data["weft_cost_100"],
+        data["weaving_charge_100"],
+
+        data["interest_on_yarn_100"],
+        data["final_grey_cost_100"],
+        data["grey_sale_100"],
+        data["rfd_cost_100"],
+        data["rfd_sale_100"],
+
+        normalize_json(data.get("wefts_json")),
+        bool(data["include_interest"]),
+
+        *recipe_hashes(data),
+        q_id
+    ))
+
+    conn.commit()
+    _replicate(conn, "qualities", [q_id])
+    conn.close()
+
+
+def delete_quality(q_id):
+    """Delete a quality by id."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM qualities WHERE id = %s", (q_id,))
+    conn.commit()
+    conn.close()
+    rep = replica.current()
+    if rep is not None:
+        rep.drop("qualities", [q_id])
+
+
+# Stored costing results on qualities (written by save/update, refreshed by recompute)
+STORED_COST_COLUMNS = (
+    "warp_weight_100", "weft_weight_100", "fabric_weight_100",
+    "warp_cost_100", "weft_cost_100", "weaving_charge_100",
+    "interest_on_yarn_100", "final_grey_cost_100",
+    "grey_sale_100", "rfd_cost_100", "rfd_sale_100",
+)
+
+
+def update_quality_costs(updates, chunk_size=500, on_chunk=None):
+    """
+    Write stored cost columns for many qualities.
+    updates: list of (quality_id, {column: value}) – columns from STORED_COST_COLUMNS.
+    One batched UPDATE ... FROM (VALUES ...) per chunk, each chunk in its own
+    transaction. on_chunk(done, total) is called after every commit.
+    """
+    return _update_quality_columns(updates, STORED_COST_COLUMNS, "double precision", chunk_size, on_chunk)
+
+
+def _update_quality_columns(updates, cols, sql_type, chunk_size, on_chunk):
+    from psycopg2.extras import execute_values
+
+    set_clause = ", ".join(f"{c} = v.{c}" for c in cols)
+    sql = f"""
+        UPDATE qualities AS q SET {set_clause}
+        FROM (VALUES %s) AS v(id, {", ".join(cols)})
+        WHERE q.id = v.id
+    """
+    template = "(%s" + f", %s::{sql_type}" * len(cols) + ")"
+
+    total = len(updates)
+    done = 0
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        for start in range(0, total, chunk_size):
+            chunk = updates[start:start + chunk_size]
+            execute_values(
+                cur, sql,
+                [(q_id, *(values[c] for c in cols)) for q_id, values in chunk],
+                template=template,
+                page_size=len(chunk),
+            )
+            conn.commit()
+            _replicate(conn, "qualities", [q_id for q_id, _ in chunk])
+            done += len(chunk)
+            if on_chunk:
+                on_chunk(done, total)
+    finally:
+        conn.close()
+    return done
+
+
+# Charges a bulk edit may change (see bulk_edit.py)
+CHARGE_COLUMNS = (
+    "weaving_rate_per_pick", "grey_markup_percent",
+    "rfd_charge_per_m", "rfd_shortage_percent", "rfd_markup_percent",
+)
+
+
+def bulk_update_charges(updates, columns):
+    """
+    Write new charges (plus the stored costs and recipe hashes they imply)
+    for many qualities in ONE set-based UPDATE and one transaction.
+    updates: [(quality_id, {column: old value}, {column: new value})] –
+    old values for `columns` (from CHARGE_COLUMNS), new values for `columns`
+    + STORED_COST_COLUMNS + HASH_COLUMNS.
+    A row whose charges no longer equal the old values (edited meanwhile)
+    is left alone. Returns the ids actually updated.
+    """
+    from psycopg2.extras import execute_values
+
+    unknown = set(columns).difference(CHARGE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Not a charge column: {', '.join(sorted(unknown))}")
+    if not updates:
+        return []
+    columns = tuple(columns)
+    set_cols = columns + STORED_COST_COLUMNS + HASH_COLUMNS
+    old_cols = tuple(f"old_{c}" for c in columns)
+
+    set_clause = ", ".join(f"{c} = v.{c}" for c in set_cols)
+    unchanged = " AND ".join(f"q.{c} IS NOT DISTINCT FROM v.old_{c}" for c in columns)
+    sql = f"""
+        UPDATE qualities AS q SET {set_clause}
+        FROM (VALUES %s) AS v(id, {", ".join(old_cols + set_cols)})
+        WHERE q.id = v.id AND {unchanged}
+        RETURNING q.id
+    """
+    n_float = len(old_cols) + len(columns) + len(STORED_COST_COLUMNS)
+    template = "(%s" + ", %s::double precision" * n_float + ", %s::text" * len(HASH_COLUMNS) + ")"
+    values = [
+        (q_id, *(old[c] for c in columns), *(new[c] for c in set_cols))
+        for q_id, old, new in updates
+    ]
+
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        rows = execute_values(cur, sql, values, template=template, page_size=len(values), fetch=True)
+        conn.commit()
+        ids = [r[0] for r in rows]
+        _replicate(conn, "qualities", ids)
+    finally:
+        conn.close()
+    return ids
+
+
+# ---------------------------
+# Duplicate recipes (see dedupe.py)
+# ---------------------------
+
+HASH_COLUMNS = ("recipe_hash", "construction_hash")
+
+
+def update_quality_hashes(updates, chunk_size=500, on_chunk=None):
+    """Write recipe hashes for many qualities: [(quality_id, {column: value})], columns from HASH_COLUMNS."""
+    return _update_quality_columns(updates, HASH_COLUMNS, "text", chunk_size, on_chunk)
+
+
+@_replica_read
+def find_recipe_matches(recipe_hash, construction_hash, exclude_id=None, limit=10):
+    """
+    Saved qualities with the same construction (indexed lookup), identical
+    recipes first: [{id, quality_name, exact}].
+    """
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute("""
+        SELECT id, quality_name, recipe_hash = %s AS exact
+        FROM qualities
+        WHERE construction_hash = %s AND id IS DISTINCT FROM %s
+        ORDER BY exact DESC, id
+        LIMIT %s
+    """, (recipe_hash, construction_hash, exclude_id, limit))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+@_replica_read
+def list_duplicate_groups(exact=False):
+    """
+    Every group of 2+ qualities sharing a construction (or, with exact=True,
+    an identical recipe), largest first – one GROUP BY pass over the table.
+    [{ids, names, exact}], exact = all recipes in the group are identical.
+    """
+    key = "recipe_hash" if exact else "construction_hash"
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute(f"""
+        SELECT array_agg(id ORDER BY id) AS ids,
+               array_agg(quality_name ORDER BY id) AS names,
+               count(DISTINCT recipe_hash) = 1 AS exact
+        FROM qualities
+        WHERE {key} IS NOT NULL
+        GROUP BY {key}
+        HAVING count(*) > 1
+        ORDER BY count(*) DESC, min(id)
+    """)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+# ---------------------------
+# Pricing snapshots (see snapshots.py)
+# ---------------------------
+
+SNAPSHOT_VALUE_COLUMNS = ("weight", "grey_cost", "grey_sale", "rfd_cost", "rfd_sale")
+
+
+def create_pricing_snapshot(rows, label=None):
+    """
+    Store a snapshot: rows = [(quality_id, weight, grey_cost, grey_sale, rfd_cost, rfd_sale)].
+    Header + rows in one transaction; returns the snapshot id.
+    """
+    from psycopg2.extras import execute_values
+
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO pricing_snapshots (label, n_rows) VALUES (%s, %s) RETURNING id",
+            (label or None, len(rows)),
+        )
+        snapshot_id = cur.fetchone()[0]
+        execute_values(
+            cur,
+            f"INSERT INTO pricing_snapshot_rows (snapshot_id, quality_id, {', '.join(SNAPSHOT_VALUE_COLUMNS)}) "
+            "VALUES %s",
+            [(snapshot_id, *r) for r in rows],
+            page_size=5000,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return snapshot_id
+
+
+def list_pricing_snapshots():
+    """[{id, taken_at, label, n_rows}], newest first."""
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute("SELECT id, taken_at, label, n_rows FROM pricing_snapshots ORDER BY taken_at DESC, id DESC")
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def get_pricing_snapshot(snapshot_id):
+    """
+    One snapshot's rows (primary-key range scan), with today's quality name
+    (None once a quality is deleted): [{quality_id, quality_name, weight, ...}].
+    """
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute(f"""
+        SELECT r.quality_id, q.quality_name, {", ".join(f"r.{c}" for c in SNAPSHOT_VALUE_COLUMNS)}
+        FROM pricing_snapshot_rows AS r
+        LEFT JOIN qualities AS q ON q.id = r.quality_id
+        WHERE r.snapshot_id = %s
+        ORDER BY q.quality_name, r.quality_id
+    """, (snapshot_id,))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def diff_pricing_snapshots(old_id, new_id, min_change=0.005):
+    """
+    What moved between two snapshots, as one join on the snapshot rows:
+    [{quality_id, quality_name, status, old_<col>, new_<col> ...}] for qualities
+    added, removed, or with any value changed by more than min_change;
+    biggest RFD sale move first. status: "added" | "removed" | "changed".
+    """
+    cols = SNAPSHOT_VALUE_COLUMNS
+    moved = " OR ".join(f"abs(n.{c} - o.{c}) > %(eps)s OR (n.{c} IS NULL) <> (o.{c} IS NULL)" for c in cols)
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=_dict_cursor())
+    cur.execute(f"""
+        SELECT coalesce(n.quality_id, o.quality_id) AS quality_id,
+               q.quality_name,
+               CASE WHEN o.quality_id IS NULL THEN 'added'
+                    WHEN n.quality_id IS NULL THEN 'removed'
+                    ELSE 'changed' END AS status,
+               {", ".join(f"o.{c} AS old_{c}, n.{c} AS new_{c}" for c in cols)}
+        FROM (SELECT * FROM pricing_snapshot_rows WHERE snapshot_id = %(new)s) AS n
+        FULL JOIN (SELECT * FROM pricing_snapshot_rows WHERE snapshot_id = %(old)s) AS o
+            ON o.quality_id = n.quality_id
+        LEFT JOIN qualities AS q ON q.id = coalesce(n.quality_id, o.quality_id)
+        WHERE o.quality_id IS NULL OR n.quality_id IS NULL OR {moved}
+        ORDER BY abs(coalesce(n.rfd_sale, 0) - coalesce(o.rfd_sale, 0)) DESC, 1
+    """, {"old": old_id, "new": new_id, "eps": min_change})
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def delete_pricing_snapshot(snapshot_id):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM pricing_snapshots WHERE id = %s", (snapshot_id,))
+    conn.commit()
+    conn.close()
@@ -0,0 +1,180 @@
+"""
+Duplicate-recipe detection.
+
+Every quality gets two hashes of its canonical recipe, stored (and
+indexed) on the qualities row:
+
+    recipe_hash        warp spec + wefts + charges – identical recipes
+    construction_hash  ends, RS, warp denier + weft deniers / picks only –
+                       near-identical (same cloth, other yarns, prices or charges)
+
+The canonical form ignores what doesn't change the recipe: weft order,
+wefts split over several rows (equal wefts are merged), yarn-name case and
+spacing, float noise, and the stored prices of yarns picked from the list
+(those are re-read from yarn_prices anyway).
+
+    python -m fabric_costing.dedupe                  # duplicate groups, one pass over the table
+    python -m fabric_costing.dedupe --exact          # identical recipes only
+    python -m fabric_costing.dedupe --backfill       # (re)compute the hashes of every quality
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+MANUAL_PRICE = "(manual price)"
+
+
+def _r(val, places):
+    try:
+        val = float(val)
+    except (TypeError, ValueError):
+        return 0.0
+    return round(val, places) + 0.0  # + 0.0 turns -0.0 into 0.0
+
+
+def _yarn(name):
+    if not name or name == MANUAL_PRICE:
+        return ""
+    return " ".join(str(name).split()).casefold()
+
+
+def _wefts(q):
+    """wefts_json (str or list) as dicts; legacy single-weft rows from the main fields."""
+    wefts = q.get("wefts_json")
+    if isinstance(wefts, str):
+        try:
+            wefts = json.loads(wefts)
+        except ValueError:
+            wefts = None
+    if wefts:
+        return wefts
+    return [{
+        "picks": q.get("picks"),
+        "denier": q.get("weft_denier"),
+        "yarn_name": q.get("weft_yarn_name"),
+        "price": q.get("weft_yarn_price"),
+    }]
+
+
+def canonical_recipe(q):
+    """
+    Canonical recipe of a quality row (or a New Costing `data` dict):
+    {"warp": [...], "wefts": [[yarn, denier, picks, manual price], ...], "charges": [...]}.
+    """
+    warp_yarn = _yarn(q.get("warp_yarn_name"))
+    warp = [
+        _r(q.get("ends"), 0), _r(q.get("reed"), 1), _r(q.get("rs"), 2), _r(q.get("warp_denier"), 1),
+        warp_yarn, 0.0 if warp_yarn else _r(q.get("warp_yarn_price"), 2),
+    ]
+
+    merged = {}
+    for wf in _wefts(q):
+        picks = _r(wf.get("picks"), 2)
+        if picks <= 0:
+            continue
+        yarn = _yarn(wf.get("yarn_name"))
+        key = (yarn, _r(wf.get("denier"), 1), 0.0 if yarn else _r(wf.get("price"), 2))
+        merged[key] = merged.get(key, 0.0) + picks
+    wefts = sorted([yarn, denier, round(picks, 2), price] for (yarn, denier, price), picks in merged.items())
+
+    include_interest = q.get("include_interest")
+    charges = [
+        _r(q.get("weaving_rate_per_pick"), 4),
+        _r(q.get("grey_markup_percent"), 2),
+        _r(q.get("rfd_charge_per_m"), 2),
+        _r(q.get("rfd_shortage_percent"), 2),
+        _r(q.get("rfd_markup_percent"), 2),
+        True if include_interest is None else bool(include_interest),
+    ]
+    return {"warp": warp, "wefts": wefts, "charges": charges}
+
+
+def canonical_construction(recipe):
+    """The cloth only, coarser: ends, RS, warp denier and weft deniers / picks."""
+    ends, _reed, rs, warp_denier, _yarn_name, _price = recipe["warp"]
+    merged = {}
+    for _yarn_name, denier, picks, _price in recipe["wefts"]:
+        key = round(denier)
+        merged[key] = merged.get(key, 0.0) + picks
+    return {
+        "warp": [ends, round(rs, 1), round(warp_denier)],
+        "wefts": sorted([denier, round(picks, 1)] for denier, picks in merged.items()),
+    }
+
+
+def _digest(obj):
+    text = json.dumps(obj, separators=(",", ":"), sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=10).hexdigest()
+
+
+def recipe_hashes(q):
+    """(recipe_hash, construction_hash) for a quality row or `data` dict."""
+    recipe = canonical_recipe(q)
+    return _digest(recipe), _digest(canonical_construction(recipe))
+
+
+# ---------------------------
+# Report / backfill
+# ---------------------------
+
+def backfill(chunk_size=500, only_missing=False):
+    """Compute and store the hashes of every quality (or only those without one)."""
+    from fabric_costing import db
+    from fabric_costing.costing import RECIPE_COLUMNS
+
+    qualities = db.list_qualities(("reed",) + RECIPE_COLUMNS + db.HASH_COLUMNS)
+    updates = []
+    for q in qualities:
+        if only_missing and q["recipe_hash"]:
+            continue
+        new = dict(zip(db.HASH_COLUMNS, recipe_hashes(q)))
+        if any(q[c] != new[c] for c in db.HASH_COLUMNS):
+            updates.append((q["id"], new))
+    if updates:
+        db.update_quality_hashes(updates, chunk_size=chunk_size)
+    return len(qualities), len(updates)
+
+
+def print_report(groups, out=sys.stdout, limit=None):
+    shown = groups if limit is None else groups[:limit]
+    for g in shown:
+        kind = "identical" if g["exact"] else "same construction"
+        print(f"{len(g['ids'])} x {kind}:", file=out)
+        for q_id, name in zip(g["ids"], g["names"]):
+            print(f"    #{q_id:<7} {name}", file=out)
+    if limit is not None and len(groups) > limit:
+        print(f"... and {len(groups) - limit} more groups", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find duplicate and near-duplicate quality recipes")
+    parser.add_argument("--exact", action="store_true", help="identical recipes only")
+    parser.add_argument("--backfill", action="store_true", help="(re)compute stored recipe hashes first")
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per UPDATE / transaction (backfill)")
+    parser.add_argument("--limit", type=int, default=50, help="max groups to print (0 = all)")
+    args = parser.parse_args(argv)
+
+    from fabric_costing import db
+
+    if args.backfill:
+        t0 = time.perf_counter()
+        n, changed = backfill(chunk_size=args.chunk_size)
+        print(f"Hashed {n} qualities in {time.perf_counter() - t0:.2f}s – {changed} updated")
+
+    t0 = time.perf_counter()
+    groups = db.list_duplicate_groups(exact=args.exact)
+    elapsed = time.perf_counter() - t0
+    if not groups:
+        print(f"No duplicates found ({elapsed * 1000:.0f} ms).")
+        return 0
+
+    print_report(groups, limit=args.limit or None)
+    n_extra = sum(len(g["ids"]) - 1 for g in groups)
+    print(f"\n{len(groups)} groups, {n_extra} redundant qualities ({elapsed * 1000:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
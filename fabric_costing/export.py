@@ -0,0 +1,104 @@
+"""
+Streaming sheet exports: rows are costed and serialized chunk by chunk,
+so memory follows the chunk size, not the catalog size.
+
+    rows = sheet_rows(qualities, yarn_price_map, pricing_sheet_row)    # lazy row dicts
+    for chunk in iter_export("csv", rows, sheet_name="pricing_sheet"):  # bytes chunks
+        out.write(chunk)
+
+sheet_rows() costs CHUNK_ROWS qualities at a time with the kernel and
+yields the same display rows as pricing_sheet_row / costing_sheet_row over
+compute_dynamic_cost. The CSV writer emits one bytes chunk per CHUNK_ROWS
+rows (same text as DataFrame.to_csv(index=False)); the XLSX writer uses
+openpyxl's write-only mode (rows go to a temp file, not a cell tree) and
+then streams the finished workbook file in CHUNK_BYTES pieces.
+"""
+import csv
+import io
+import tempfile
+
+from fabric_costing.kernel import RecipeBatch
+
+CHUNK_ROWS = 2000
+CHUNK_BYTES = 1 << 16
+
+FORMATS = {  # ext -> mime type (streamable formats)
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def sheet_rows(qualities, yarn_price_map, row_fn, chunk_rows=CHUNK_ROWS):
+    """
+    row_fn(q, cost) for every quality, costed chunk_rows at a time
+    (RecipeBatch over the chunk). Lazy; qualities is a sequence of rows with
+    "id" and the costing.RECIPE_COLUMNS fields.
+    """
+    for start in range(0, len(qualities), chunk_rows):
+        chunk = qualities[start:start + chunk_rows]
+        batch = RecipeBatch.from_qualities(chunk, yarn_price_map)
+        cost = {k: v.tolist() for k, v in batch.evaluate().items()}
+        cost["_dynamic_total_picks"] = batch["picks"].tolist()
+        for i, q in enumerate(chunk):
+            yield row_fn(q, {k: v[i] for k, v in cost.items()})
+
+
+def _blank_nan(val):
+    return None if isinstance(val, float) and val != val else val
+
+
+def iter_csv(rows, chunk_rows=CHUNK_ROWS):
+    """UTF-8 CSV bytes from row dicts (header from the first row's keys), one chunk per chunk_rows rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for row in rows:
+        if n == 0:
+            writer.writerow(row.keys())
+        writer.writerow(["" if v is None else _blank_nan(v) for v in row.values()])
+        n += 1
+        if n % chunk_rows == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def iter_xlsx(rows, sheet_name="Sheet1", chunk_bytes=CHUNK_BYTES):
+    """XLSX bytes from row dicts (bold header row, like DataFrame.to_excel), in chunk_bytes pieces."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name[:31])
+    bold = Font(bold=True)
+    header = None
+    for row in rows:
+        if header is None:
+            header = []
+            for name in row.keys():
+                cell = WriteOnlyCell(ws, value=name)
+                cell.font = bold
+                header.append(cell)
+            ws.append(header)
+        ws.append([_blank_nan(v) for v in row.values()])
+
+    with tempfile.TemporaryFile() as f:
+        wb.save(f)
+        f.seek(0)
+        while True:
+            piece = f.read(chunk_bytes)
+            if not piece:
+                break
+            yield piece
+
+
+def iter_export(ext, rows, sheet_name="Sheet1"):
+    """Bytes chunks of rows in a FORMATS format (ValueError for others)."""
+    if ext == "csv":
+        return iter_csv(rows)
+    if ext == "xlsx":
+        return iter_xlsx(rows, sheet_name=sheet_name)
+    raise ValueError(f"Unknown export format: {ext} (one of {', '.join(FORMATS)})")
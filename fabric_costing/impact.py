@@ -0,0 +1,69 @@
+"""
+What a yarn price change does to the catalog, before it is saved.
+
+    usage = yarn_usage(qualities)                  # once per catalog version
+    new = {"name": "120D Poly Warp", "yarn_type": "warp", "price_per_kg": 212.0, "denier": None, "count": None}
+    impact = price_change_impact(qualities, yarn_price_map, usage, new)
+    impact["after"]["grey_cost_per_m"] - impact["before"]["grey_cost_per_m"]
+
+Only the qualities that name the yarn (warp, or any weft) are looked at:
+they are resolved against yarn_price_map ("before") and against
+yarn_price_map.with_row(new) – the table as it reads once the row is
+saved ("after") – and costed in one kernel evaluation each. Nothing else
+in the catalog can change, so the catalog-wide delta is the sum over these.
+
+usage must be built from the same `qualities` (positions index into it).
+"""
+import json
+
+import numpy as np
+
+from fabric_costing.kernel import RecipeBatch
+
+MANUAL_PRICE = "(manual price)"  # weft with its own price, no yarn row
+COST_KEYS = ("grey_cost_per_m", "grey_sale_per_m", "rfd_cost_per_m", "rfd_sale_per_m")
+NO_ROWS = np.zeros(0, dtype=np.int64)
+
+
+def _linked_yarns(q):
+    """Yarn names a stored recipe resolves prices from (same fields as resolve_recipe)."""
+    names = {q.get("warp_yarn_name")}
+    wefts = q.get("wefts_json")
+    if wefts:
+        if isinstance(wefts, str):
+            try:
+                wefts = json.loads(wefts)
+            except ValueError:
+                wefts = []
+        names.update(wf.get("yarn_name") for wf in wefts or () if isinstance(wf, dict))
+    else:
+        names.add(q.get("weft_yarn_name"))
+    names.difference_update((None, "", MANUAL_PRICE))
+    return names
+
+
+def yarn_usage(qualities):
+    """{yarn name: int64 array of the positions in `qualities` that link it}."""
+    where = {}
+    for i, q in enumerate(qualities):
+        for name in _linked_yarns(q):
+            where.setdefault(name, []).append(i)
+    return {name: np.asarray(pos, dtype=np.int64) for name, pos in where.items()}
+
+
+def price_change_impact(qualities, yarn_price_map, usage, row):
+    """
+    Costs of the qualities linking row["name"], with the current prices and
+    with `row` (name, yarn_type, price_per_kg, denier, count) as the latest.
+    Returns {"positions", "ids", "before", "after", "changed"} – costing
+    arrays aligned with positions; changed: mask of rows whose costs move.
+    """
+    pos = usage.get(row["name"], NO_ROWS)
+    rows = [qualities[i] for i in pos.tolist()]
+    current = RecipeBatch.from_qualities(rows, yarn_price_map)
+    before = current.evaluate()
+    after = RecipeBatch.from_qualities(rows, yarn_price_map.with_row(row)).evaluate()
+    changed = np.zeros(len(pos), dtype=bool)
+    for k in COST_KEYS:
+        changed |= ~np.isclose(before[k], after[k], rtol=0.0, atol=1e-9, equal_nan=True)
+    return {"positions": pos, "ids": current.ids, "before": before, "after": after, "changed": changed}
@@ -0,0 +1,73 @@
+"""
+Vectorized costing – many recipes at once with numpy.
+
+resolve_recipe() reduces every stored recipe to the calculate_costing()
+inputs once (latest yarn prices applied, wefts aggregated); after that
+the costing of the whole batch is a handful of array operations, and
+what-ifs are just different input arrays:
+
+    batch = RecipeBatch.from_qualities(qualities, yarn_price_map)
+    cost = batch.evaluate()                                   # same keys as calculate_costing, float64 arrays
+    cost = batch.evaluate(weft_yarn_price=batch["weft_yarn_price"] * 1.05)
+
+evaluate() runs calculate_costing itself, so the numbers are the ones
+compute_dynamic_cost gives, not a re-implementation of the formula.
+"""
+import numpy as np
+
+from fabric_costing.costing import calculate_costing, resolve_recipe
+
+# calculate_costing() keyword arguments, in signature order
+INPUTS = (
+    "ends", "warp_denier", "picks", "weft_denier", "rs",
+    "warp_yarn_price", "weft_yarn_price",
+    "weaving_rate_per_pick", "grey_markup_percent",
+    "rfd_charge_per_m", "rfd_shortage_percent", "rfd_markup_percent",
+    "include_interest",
+)
+
+
+class RecipeBatch:
+    """Struct of arrays: ids plus one float64 array per calculate_costing() input."""
+    __slots__ = ("ids", "inputs")
+
+    def __init__(self, ids, inputs):
+        self.ids = np.asarray(ids)
+        self.inputs = inputs
+
+    @classmethod
+    def from_qualities(cls, qualities, yarn_price_map):
+        """Rows need "id" and the costing.RECIPE_COLUMNS fields."""
+        cols = {name: [] for name in INPUTS}
+        for q in qualities:
+            inputs, _ = resolve_recipe(q, yarn_price_map)
+            for name in INPUTS:
+                cols[name].append(inputs[name])
+        ids = [q["id"] for q in qualities]
+        return cls(ids, {name: np.asarray(vals, dtype=np.float64) for name, vals in cols.items()})
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, name):
+        return self.inputs[name]
+
+    def take(self, idx):
+        """Sub-batch of the rows at positions idx (index array or boolean mask)."""
+        return RecipeBatch(self.ids[idx], {name: arr[idx] for name, arr in self.inputs.items()})
+
+    def positions(self, ids):
+        """Row positions of the given quality ids (KeyError for unknown ids)."""
+        where = {q_id: i for i, q_id in enumerate(self.ids.tolist())}
+        return np.fromiter((where[q_id] for q_id in ids), dtype=np.int64, count=len(ids))
+
+    def evaluate(self, **overrides):
+        """calculate_costing over the batch; keyword overrides replace input arrays (or broadcast scalars)."""
+        unknown = set(overrides).difference(INPUTS)
+        if unknown:
+            raise ValueError(f"Unknown costing input(s): {', '.join(sorted(unknown))}")
+        args = dict(self.inputs)
+        for name, val in overrides.items():
+            args[name] = np.broadcast_to(np.asarray(val, dtype=np.float64), len(self.ids))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return calculate_costing(**args)
@@ -0,0 +1,440 @@
+"""
+Concurrent-session load test for the Streamlit app.
+
+Drives N simultaneous browser-like sessions over Streamlit's websocket
+protocol (the same BackMsg / ForwardMsg protobufs the browser sends), so
+reruns go through the real server: shared caches, one process, real DB.
+Each session logs in, then clicks through the sidebar pages.
+
+    # start a server on a free port against SUPABASE_URI, 20 sessions, 3 rounds of every page
+    python -m fabric_costing.loadtest --sessions 20 --rounds 3
+
+    # the "whole sales team opens Pricing Sheet" case, from cold caches
+    python -m fabric_costing.loadtest --sessions 25 --pages "Pricing Sheet" --cold
+
+    # an already running server (memory is reported if you pass its pid)
+    python -m fabric_costing.loadtest --url http://127.0.0.1:8501 --password ... --server-pid 4242
+
+Reports p50 / p95 / p99 rerun latency (overall and per page), DB
+connections (peak concurrent and total opened, from pg_stat_activity /
+pg_stat_database) and the server process' memory (RSS, Linux /proc).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+DEFAULT_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "costing_new.py")
+RERUN_TIMEOUT_S = 180.0
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def latency_summary(seconds):
+    vals = sorted(seconds)
+    return {
+        "count": len(vals),
+        "p50_ms": round(percentile(vals, 50) * 1000.0, 1) if vals else None,
+        "p95_ms": round(percentile(vals, 95) * 1000.0, 1) if vals else None,
+        "p99_ms": round(percentile(vals, 99) * 1000.0, 1) if vals else None,
+        "max_ms": round(vals[-1] * 1000.0, 1) if vals else None,
+    }
+
+
+# ---------------------------
+# Server process
+# ---------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(url, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=2) as r:
+                if r.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Streamlit server at {url} did not become healthy")
+
+
+def start_server(app, dsn, password, port=None):
+    """
+    `streamlit run app` on a free local port with SUPABASE_URI = dsn.
+    Returns (process, url, secrets_dir) – terminate the process and remove the dir when done.
+    """
+    port = port or _free_port()
+    secrets_dir = tempfile.mkdtemp(prefix="fabric-loadtest-")
+    secrets_file = os.path.join(secrets_dir, "secrets.toml")
+    with open(secrets_file, "w", encoding="utf-8") as f:
+        f.write(f"SUPABASE_URI = {json.dumps(dsn)}\n")
+
+    env = dict(os.environ, FABRIC_APP_PASSWORD=password)
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", app,
+            "--server.headless", "true",
+            "--server.port", str(port),
+            "--server.address", "127.0.0.1",
+            "--secrets.files", secrets_file,
+            "--browser.gatherUsageStats", "false",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_healthy(url)
+    except Exception:
+        proc.terminate()
+        raise
+    return proc, url, secrets_dir
+
+
+# ---------------------------
+# Samplers (DB connections, server memory)
+# ---------------------------
+
+def rss_bytes(pid):
+    """Resident set size of a process (Linux /proc), or None."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class Sampler(threading.Thread):
+    """Polls pg_stat_activity and the server's RSS until stopped."""
+
+    def __init__(self, dsn=None, pid=None, interval=0.1):
+        super().__init__(daemon=True, name="fabric-loadtest-sampler")
+        self.dsn = dsn
+        self.pid = pid
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._conn = None
+        self.db_peak = None
+        self.db_sessions_start = None
+        self.db_sessions_end = None
+        self.rss_start = rss_bytes(pid) if pid else None
+        self.rss_peak = self.rss_start
+        self.rss_end = None
+
+    def _db_query(self, sql):
+        cur = self._conn.cursor()
+        cur.execute(sql)
+        return cur.fetchone()[0]
+
+    def _db_connections(self):
+        return self._db_query("""
+            SELECT count(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND pid <> pg_backend_pid()
+        """)
+
+    def _db_sessions_total(self):
+        # pg_stat_database.sessions exists from Postgres 14
+        try:
+            return self._db_query("SELECT sessions FROM pg_stat_database WHERE datname = current_database()")
+        except Exception:
+            self._conn.rollback()
+            return None
+
+    def start(self):
+        if self.dsn:
+            import psycopg2
+
+            self._conn = psycopg2.connect(self.dsn)
+            self._conn.autocommit = True
+            self.db_peak = self._db_connections()
+            self.db_sessions_start = self._db_sessions_total()
+        super().start()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        if self._conn is not None:
+            self.db_peak = max(self.db_peak, self._db_connections())
+        if self.pid:
+            rss = rss_bytes(self.pid)
+            if rss is not None:
+                self.rss_peak = max(self.rss_peak or 0, rss)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+        if self._conn is not None:
+            # stats for just-closed backends can lag slightly
+            time.sleep(0.5)
+            cur = self._conn.cursor()
+            cur.execute("SELECT pg_stat_clear_snapshot()")
+            self.db_sessions_end = self._db_sessions_total()
+            self._conn.close()
+        if self.pid:
+            self.rss_end = rss_bytes(self.pid)
+
+    def report(self):
+        mb = (lambda b: round(b / 1048576.0, 1) if b is not None else None)
+        opened = None
+        if self.db_sessions_start is not None and self.db_sessions_end is not None:
+            opened = self.db_sessions_end - self.db_sessions_start
+        return {
+            "db_connections_peak": self.db_peak,
+            "db_connections_opened": opened,
+            "server_rss_start_mb": mb(self.rss_start),
+            "server_rss_peak_mb": mb(self.rss_peak),
+            "server_rss_end_mb": mb(self.rss_end),
+        }
+
+
+# ---------------------------
+# One simulated browser session
+# ---------------------------
+
+class AppSession:
+    """A websocket session speaking Streamlit's BackMsg / ForwardMsg protocol."""
+
+    def __init__(self, url, name):
+        self.ws_url = url.replace("http://", "ws://").replace("https://", "wss://").rstrip("/") + "/_stcore/stream"
+        self.name = name
+        self.ws = None
+        self.page_radio = None
+
+    async def connect(self):
+        import websockets
+
+        self.ws = await websockets.connect(self.ws_url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def clear_cache(self):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        msg = BackMsg()
+        msg.clear_cache = True
+        await self.ws.send(msg.SerializeToString())
+
+    async def rerun(self, widget_states=()):
+        """
+        Trigger a rerun and wait for it to finish (following st.rerun()).
+        Returns (seconds, [(element_type, element)], [exception messages]).
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(widget_states)
+
+        t0 = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        elements, errors = [], []
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT_S))
+            kind = fwd.WhichOneof("type")
+            if kind == "new_session":
+                elements = []  # a new script run starts (e.g. after st.rerun)
+            elif kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                el_type = fwd.delta.new_element.WhichOneof("type")
+                el = getattr(fwd.delta.new_element, el_type)
+                elements.append((el_type, el))
+                if el_type == "exception":
+                    errors.append(f"{el.type}: {el.message}")
+            elif kind == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                return time.perf_counter() - t0, elements, errors
+
+    def _find(self, elements, el_type, label=None):
+        for t, el in elements:
+            if t == el_type and (label is None or el.label == label):
+                return el
+        return None
+
+    async def login(self, password):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        seconds, elements, errors = await self.rerun()
+        pw = self._find(elements, "text_input", "Password")
+        if pw is not None:
+            button = self._find(elements, "button", "Login")
+            seconds, elements, errors = await self.rerun([
+                WidgetState(id=pw.id, string_value=password),
+                WidgetState(id=button.id, trigger_value=True),
+            ])
+        self.page_radio = self._find(elements, "radio", "Go to")
+        if self.page_radio is None:
+            raise RuntimeError(f"{self.name}: login failed (wrong password?) {errors}")
+        return seconds, errors
+
+    @property
+    def pages(self):
+        return list(self.page_radio.options)
+
+    async def open_page(self, page):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        seconds, elements, errors = await self.rerun([WidgetState(id=self.page_radio.id, string_value=page)])
+        return seconds, errors
+
+
+# ---------------------------
+# Scenario
+# ---------------------------
+
+async def run_sessions(url, password, n_sessions, rounds, page_filter=None, think_s=0.0, ramp_s=0.0, cold=False):
+    """
+    Returns {"latencies": {page: [seconds]}, "errors": [...], "wall_s": float}.
+    All sessions log in first, then start clicking at the same moment.
+    """
+    latencies = {}
+    errors = []
+    sessions = [AppSession(url, f"session-{i + 1}") for i in range(n_sessions)]
+
+    async def _login(i, s):
+        await asyncio.sleep(ramp_s * i / max(1, n_sessions))
+        await s.connect()
+        seconds, errs = await s.login(password)
+        latencies.setdefault("(login)", []).append(seconds)
+        errors.extend(f"{s.name} login: {e}" for e in errs)
+
+    async def _click(s):
+        pages = s.pages
+        if page_filter:
+            pages = [p for p in pages if any(f.lower() in p.lower() for f in page_filter)]
+        for _ in range(rounds):
+            for page in pages:
+                seconds, errs = await s.open_page(page)
+                latencies.setdefault(page, []).append(seconds)
+                errors.extend(f"{s.name} {page}: {e}" for e in errs)
+                if think_s:
+                    await asyncio.sleep(think_s)
+
+    try:
+        await asyncio.gather(*(_login(i, s) for i, s in enumerate(sessions)))
+        if cold:
+            await sessions[0].clear_cache()
+            await asyncio.sleep(0.5)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_click(s) for s in sessions))
+        wall_s = time.perf_counter() - t0
+    finally:
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+    return {"latencies": latencies, "errors": errors, "wall_s": wall_s}
+
+
+def build_report(result, sampler, args):
+    page_lat = {p: v for p, v in result["latencies"].items() if p != "(login)"}
+    all_reruns = [x for v in page_lat.values() for x in v]
+    return {
+        "sessions": args.sessions,
+        "rounds": args.rounds,
+        "wall_s": round(result["wall_s"], 2),
+        "reruns_per_s": round(len(all_reruns) / result["wall_s"], 2) if result["wall_s"] else None,
+        "overall": latency_summary(all_reruns),
+        "pages": {p: latency_summary(v) for p, v in result["latencies"].items()},
+        "errors": result["errors"],
+        **sampler.report(),
+    }
+
+
+def print_report(report):
+    o = report["overall"]
+    print(f"\n{report['sessions']} sessions x {report['rounds']} rounds: {o['count']} reruns "
+          f"in {report['wall_s']}s ({report['reruns_per_s']} reruns/s)")
+    print(f"\n{'page':<30} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for page, s in list(report["pages"].items()) + [("ALL PAGES", o)]:
+        print(f"{page:<30} {s['count']:>5} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    print(f"\nDB connections: peak {report['db_connections_peak']}, opened {report['db_connections_opened']}")
+    print(f"Server RSS (MB): start {report['server_rss_start_mb']}, "
+          f"peak {report['server_rss_peak_mb']}, end {report['server_rss_end_mb']}")
+    if report["errors"]:
+        print(f"\n{len(report['errors'])} page error(s), first ones:")
+        for e in report["errors"][:10]:
+            print(f"  {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the Streamlit app")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=2, help="times each session clicks through the pages")
+    parser.add_argument("--pages", action="append", help="only pages containing this text (repeatable)")
+    parser.add_argument("--think", type=float, default=0.0, help="pause between clicks (s)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="spread session logins over this many seconds")
+    parser.add_argument("--cold", action="store_true", help="clear the server's st.cache_* before clicking")
+    parser.add_argument("--url", help="use a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --url: pid to report memory for")
+    parser.add_argument("--app", default=DEFAULT_APP)
+    parser.add_argument("--dsn", default=os.getenv("SUPABASE_URI"), help="Postgres for the server and DB stats")
+    parser.add_argument("--password", default=os.getenv("FABRIC_APP_PASSWORD", "loadtest"))
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    proc = secrets_dir = None
+    if args.url:
+        url, pid = args.url, args.server_pid
+    else:
+        if not args.dsn:
+            parser.error("--dsn or SUPABASE_URI is required to start a server")
+        proc, url, secrets_dir = start_server(args.app, args.dsn, args.password)
+        pid = proc.pid
+        print(f"Started {os.path.basename(args.app)} at {url} (pid {pid})")
+
+    sampler = Sampler(dsn=args.dsn, pid=pid)
+    sampler.start()
+    try:
+        result = asyncio.run(run_sessions(
+            url, args.password, args.sessions, args.rounds,
+            page_filter=args.pages, think_s=args.think, ramp_s=args.ramp, cold=args.cold,
+        ))
+    finally:
+        sampler.stop()
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        if secrets_dir is not None:
+            import shutil
+
+            shutil.rmtree(secrets_dir, ignore_errors=True)
+
+    report = build_report(result, sampler, args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Catalog-wide costing on a process pool.
+
+compute_dynamic_cost is pure Python and CPU-bound, so one process costs one
+quality at a time no matter how many cores the box has. map_chunks() splits
+the qualities into chunks and runs a chunk function on a pool of worker
+processes:
+
+    from fabric_costing.parallel import map_chunks
+
+    def stored_costs(chunk, yarn_price_map):         # module level (workers import it)
+        return [compute_dynamic_cost(q, yarn_price_map)["rfd_sale_100"] for q in chunk]
+
+    results = map_chunks(stored_costs, qualities, yarn_price_map, workers=8)
+
+The yarn price map is sent once per worker (pool initializer), not with
+every chunk; chunks carry only their quality rows. Results come back in
+input order whatever the scheduling, so the output is the same as the
+serial loop, bit for bit. Small inputs (or workers=1) skip the pool.
+
+FABRIC_WORKERS sets the default worker count (else every core).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+MIN_PARALLEL_ROWS = 5000  # below this, starting the pool costs more than it saves
+CHUNKS_PER_WORKER = 4     # a few chunks each, so a slow chunk doesn't idle the others
+
+_worker_prices = None  # the price map, set once in each worker
+
+
+def default_workers():
+    """FABRIC_WORKERS, else the number of cores."""
+    try:
+        return max(1, int(os.getenv("FABRIC_WORKERS", "")))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(yarn_price_map):
+    global _worker_prices
+    _worker_prices = yarn_price_map
+
+
+def _run_chunk(fn, chunk):
+    return fn(chunk, _worker_prices)
+
+
+def chunked(items, n_chunks):
+    """items split into at most n_chunks contiguous, near-equal slices (in order)."""
+    n = len(items)
+    n_chunks = max(1, min(n_chunks, n))
+    size, extra = divmod(n, n_chunks)
+    out, start = [], 0
+    for i in range(n_chunks):
+        end = start + size + (i < extra)
+        out.append(items[start:end])
+        start = end
+    return out
+
+
+def map_chunks(fn, items, yarn_price_map, workers=None, chunk_size=None):
+    """
+    fn(chunk, yarn_price_map) over contiguous chunks of `items`, on
+    `workers` processes; the per-chunk result lists are concatenated in
+    input order. fn must be a module-level function (it is pickled by name)
+    and return a list. workers=None: default_workers().
+    """
+    items = list(items)
+    workers = default_workers() if workers is None else max(1, workers)
+    if workers == 1 or len(items) < MIN_PARALLEL_ROWS:
+        return list(fn(items, yarn_price_map))
+
+    if chunk_size:
+        n_chunks = -(-len(items) // chunk_size)
+    else:
+        n_chunks = workers * CHUNKS_PER_WORKER
+    chunks = chunked(items, n_chunks)
+    out = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(yarn_price_map,)) as pool:
+        for part in pool.map(_run_chunk, [fn] * len(chunks), chunks):
+            out.extend(part)
+    return out
@@ -0,0 +1,255 @@
+"""
+Per-rerun performance instrumentation (opt-in).
+
+Nothing is recorded unless a run is active for the current context
+(see start_run). A run collects:
+  - wall time of the whole rerun
+  - number of DB connections / queries, rows fetched, time spent in queries
+  - time + call count of named spans (compute_dynamic_cost, ...)
+  - hit / miss counts of cached helpers
+
+The active run lives in a ContextVar, so concurrent Streamlit sessions
+(one script thread each) never mix their numbers, and work handed to
+asyncio.to_thread() still reports into the run that started it.
+"""
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+_current_run = contextvars.ContextVar("fabric_costing_perf_run", default=None)
+
+DEFAULT_LOG_PATH = "perf_log.jsonl"
+
+
+def enabled_by_env():
+    """FABRIC_PERF=1 turns instrumentation on for every rerun."""
+    return os.getenv("FABRIC_PERF", "").lower() not in ("", "0", "false", "no")
+
+
+class RunStats:
+    def __init__(self, label):
+        self.label = label
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._t0 = time.perf_counter()
+        self.wall_s = None
+        self.connections = 0
+        self.queries = 0
+        self.rows = 0
+        self.query_s = 0.0
+        self.spans = {}     # name -> [calls, total seconds]
+        self.cache = {}     # name -> [hits, misses]
+
+    def add_span(self, name, seconds):
+        entry = self.spans.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def to_dict(self):
+        return {
+            "ts": self.started_at,
+            "page": self.label,
+            "wall_ms": round((self.wall_s or 0.0) * 1000.0, 2),
+            "connections": self.connections,
+            "queries": self.queries,
+            "rows": self.rows,
+            "query_ms": round(self.query_s * 1000.0, 2),
+            "spans": {
+                k: {"calls": c, "ms": round(t * 1000.0, 2)} for k, (c, t) in self.spans.items()
+            },
+            "cache": {k: {"hits": h, "misses": m} for k, (h, m) in self.cache.items()},
+        }
+
+
+# ---------------------------
+# Run lifecycle
+# ---------------------------
+
+def start_run(label):
+    stats = RunStats(label)
+    _current_run.set(stats)
+    return stats
+
+
+def current():
+    return _current_run.get()
+
+
+def finish_run(log_path=None):
+    """
+    Close the active run (if any), append it to the JSONL log and return it.
+    Safe to call more than once per rerun – only the first call counts.
+    """
+    stats = _current_run.get()
+    if stats is None:
+        return None
+    _current_run.set(None)
+    stats.wall_s = time.perf_counter() - stats._t0
+
+    log_path = log_path or os.getenv("FABRIC_PERF_LOG", DEFAULT_LOG_PATH)
+    if log_path:
+        try:
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(stats.to_dict()) + "\n")
+        except OSError:
+            pass  # never break a page because the log is not writable
+    return stats
+
+
+# ---------------------------
+# Spans
+# ---------------------------
+
+@contextmanager
+def span(name):
+    stats = _current_run.get()
+    if stats is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_span(name, time.perf_counter() - t0)
+
+
+def timed(name):
+    """Decorator version of span()."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_run.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# ---------------------------
+# Cache hit / miss
+# ---------------------------
+
+def cache_miss(name):
+    """Call at the top of a cached function body – it only runs on a miss."""
+    stats = _current_run.get()
+    if stats is not None:
+        stats.cache.setdefault(name, [0, 0])[1] += 1
+
+
+def cache_hit(name):
+    """For hand-rolled caches: record a hit."""
+    stats = _current_run.get()
+    if stats is not None:
+        stats.cache.setdefault(name, [0, 0])[0] += 1
+
+
+def cache_probe(name):
+    """
+    Wrap a cached function (outside the cache decorator). A call whose body
+    did not report cache_miss() is counted as a hit.
+    """
+    def deco(cached_fn):
+        @wraps(cached_fn)
+        def wrapper(*args, **kwargs):
+            stats = _current_run.get()
+            if stats is None:
+                return cached_fn(*args, **kwargs)
+            entry = stats.cache.setdefault(name, [0, 0])
+            misses_before = entry[1]
+            with span(f"cache:{name}"):
+                result = cached_fn(*args, **kwargs)
+            if entry[1] == misses_before:
+                entry[0] += 1
+            return result
+        return wrapper
+    return deco
+
+
+# ---------------------------
+# DB connection / cursor wrappers
+# ---------------------------
+
+class InstrumentedCursor:
+    """Counts statements, time in execute and rows fetched; delegates the rest."""
+
+    def __init__(self, cur, stats):
+        self._cur = cur
+        self._stats = stats
+
+    def execute(self, query, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.execute(query, *args, **kwargs)
+        finally:
+            self._stats.queries += 1
+            self._stats.query_s += time.perf_counter() - t0
+
+    def executemany(self, query, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.executemany(query, *args, **kwargs)
+        finally:
+            self._stats.queries += 1
+            self._stats.query_s += time.perf_counter() - t0
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cur.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cur:
+            self._stats.rows += 1
+            yield row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def wrap_connection(conn):
+    """Return conn wrapped for the active run, or conn itself when off."""
+    stats = _current_run.get()
+    if stats is None:
+        return conn
+    stats.connections += 1
+    return InstrumentedConnection(conn, stats)
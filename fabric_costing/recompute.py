@@ -0,0 +1,121 @@
+"""
+Recompute the stored *_100 cost columns on qualities with the latest yarn prices.
+
+The stored columns are only written when a quality is saved or edited, so
+after a price change they drift from what Search Qualities shows. This
+re-runs every quality (or a filtered set) through compute_dynamic_cost and
+writes the results back in batched, chunked transactions. Large catalogs
+are costed on a process pool (parallel.py); the plan is the same as the
+serial run's.
+
+    python -m fabric_costing.recompute --dry-run            # show what would change
+    python -m fabric_costing.recompute                      # write everything that drifted
+    python -m fabric_costing.recompute --ids 12,15 --name poly --chunk-size 200
+    python -m fabric_costing.recompute --dry-run --workers 8
+"""
+import argparse
+import sys
+import time
+
+from fabric_costing.costing import RECIPE_COLUMNS, compute_dynamic_cost
+from fabric_costing.parallel import map_chunks
+
+
+def stored_costs(qualities, yarn_price_map):
+    """[{stored cost column: dynamic value}] per quality (a parallel.map_chunks chunk function)."""
+    from fabric_costing.db import STORED_COST_COLUMNS
+
+    out = []
+    for q in qualities:
+        cost = compute_dynamic_cost(q, yarn_price_map)
+        out.append({c: float(cost[c]) for c in STORED_COST_COLUMNS})
+    return out
+
+
+def plan_updates(qualities, yarn_price_map, tolerance=0.005, workers=1):
+    """
+    [(quality, {column: new value}, {column: old value})] for every quality
+    whose stored costs differ from the dynamic ones by more than `tolerance`.
+    workers: processes to cost on (None = parallel.default_workers()).
+    """
+    from fabric_costing.db import STORED_COST_COLUMNS
+
+    plan = []
+    for q, new in zip(qualities, map_chunks(stored_costs, qualities, yarn_price_map, workers=workers)):
+        old = {c: q.get(c) for c in STORED_COST_COLUMNS}
+        if any(old[c] is None or abs(float(old[c]) - new[c]) > tolerance for c in STORED_COST_COLUMNS):
+            plan.append((q, new, old))
+    return plan
+
+
+def _fmt(val):
+    return "NULL" if val is None else f"{float(val):.2f}"
+
+
+def print_diff(plan, out=sys.stdout, limit=None):
+    shown = plan if limit is None else plan[:limit]
+    for q, new, old in shown:
+        print(f"#{q['id']} {q['quality_name']}", file=out)
+        for col in ("final_grey_cost_100", "grey_sale_100", "rfd_cost_100", "rfd_sale_100", "fabric_weight_100"):
+            if old[col] is None or abs(float(old[col]) - new[col]) > 0.005:
+                print(f"    {col:<22} {_fmt(old[col]):>12} -> {_fmt(new[col]):>12}", file=out)
+    if limit is not None and len(plan) > limit:
+        print(f"... and {len(plan) - limit} more", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stored quality costs from the latest yarn prices")
+    parser.add_argument("--dry-run", action="store_true", help="only show the differences")
+    parser.add_argument("--ids", help="comma-separated quality ids")
+    parser.add_argument("--name", help="only qualities whose name contains this (case-insensitive)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per UPDATE / transaction")
+    parser.add_argument("--tolerance", type=float, default=0.005, help="ignore differences up to this (per 100 m)")
+    parser.add_argument("--workers", type=int, help="processes to cost on (default: FABRIC_WORKERS or every core)")
+    parser.add_argument("--diff-limit", type=int, default=50, help="max qualities to print in --dry-run (0 = all)")
+    args = parser.parse_args(argv)
+
+    from fabric_costing import db
+
+    t0 = time.perf_counter()
+    qualities = db.list_qualities(("quality_name",) + RECIPE_COLUMNS + db.STORED_COST_COLUMNS)
+    yarn_price_map = db.get_latest_yarn_price_map()
+    if args.ids:
+        wanted = {int(x) for x in args.ids.split(",") if x.strip()}
+        qualities = [q for q in qualities if q["id"] in wanted]
+    if args.name:
+        needle = args.name.lower()
+        qualities = [q for q in qualities if needle in (q["quality_name"] or "").lower()]
+    t_load = time.perf_counter() - t0
+    print(f"Loaded {len(qualities)} qualities in {t_load:.2f}s")
+
+    t0 = time.perf_counter()
+    plan = plan_updates(qualities, yarn_price_map, tolerance=args.tolerance, workers=args.workers)
+    t_compute = time.perf_counter() - t0
+    rate = len(qualities) / t_compute if t_compute > 0 else float("inf")
+    print(f"Recomputed in {t_compute:.2f}s ({rate:,.0f} qualities/s) – {len(plan)} out of date")
+
+    if args.dry_run:
+        print_diff(plan, limit=args.diff_limit or None)
+        print("Dry run: nothing written.")
+        return 0
+    if not plan:
+        print("Nothing to write.")
+        return 0
+
+    t0 = time.perf_counter()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - t0
+        print(f"  wrote {done}/{total} ({done / elapsed if elapsed > 0 else 0:,.0f} rows/s)")
+
+    db.update_quality_costs(
+        [(q["id"], new) for q, new, _ in plan],
+        chunk_size=args.chunk_size,
+        on_chunk=progress,
+    )
+    print(f"Done in {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""
+Local read replica (SQLite) of yarn_prices and qualities.
+
+Every read in db.py costs a round trip to Supabase. With a replica enabled,
+the read helpers are answered from a local SQLite file instead – same
+arguments, same row shapes – and Postgres only sees writes:
+
+    FABRIC_REPLICA=replica.sqlite     enable (path of the local file; ":memory:" works too)
+    FABRIC_REPLICA_SYNC=60            seconds between reconciliations (0 = only at start)
+
+Writes go to Postgres first; after the commit db.py pulls the written rows
+back into the replica (write-through), so a writer reads its own writes at
+once. Changes made elsewhere (another app instance, recompute jobs, the SQL
+editor) arrive with the periodic reconciliation: it compares (id, xmin) of
+every row – Postgres gives a row a new xmin on every insert / update –
+fetches only the rows whose version changed and drops the deleted ones.
+
+If Postgres can't be reached the replica keeps serving reads, db.read_only()
+turns True and writes raise db.ReadOnlyError, until a reconciliation gets
+through again.
+
+    python -m fabric_costing.replica --path replica.sqlite     # build / reconcile now
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+YARN_PRICE_COLUMNS = ("id", "name", "yarn_type", "count", "denier", "price_per_kg", "valid_from")
+
+# Declared BOOLEAN columns read back as bool (detect_types); 0 / 1 on disk.
+sqlite3.register_converter("BOOLEAN", lambda v: v not in (b"0", b""))
+
+# Above this share of changed rows, reconciliation reads the whole table
+# instead of WHERE id = ANY(...)
+FULL_FETCH_FRACTION = 0.5
+
+
+def _quality_columns():
+    from fabric_costing.db import QUALITY_COLUMNS
+
+    return QUALITY_COLUMNS
+
+
+def _table_columns(table):
+    return YARN_PRICE_COLUMNS if table == "yarn_prices" else _quality_columns()
+
+
+def _quoted(columns):
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+def _ddl(table):
+    cols = []
+    for c in _table_columns(table):
+        if c == "id":
+            cols.append("id INTEGER PRIMARY KEY")
+        elif c == "include_interest":
+            cols.append("include_interest BOOLEAN")
+        else:
+            cols.append(f'"{c}"')
+    return f"CREATE TABLE {table} ({', '.join(cols)}, _xmin TEXT)"
+
+
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS yarn_prices_latest_idx ON yarn_prices (name, yarn_type, valid_from, id)",
+    "CREATE INDEX IF NOT EXISTS qualities_name_idx ON qualities (quality_name COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS qualities_recipe_hash_idx ON qualities (recipe_hash)",
+    "CREATE INDEX IF NOT EXISTS qualities_construction_hash_idx ON qualities (construction_hash)",
+)
+
+
+class Replica:
+    def __init__(self, path, sync_every=60.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.online = None          # None = not tried yet, then True / False
+        self.last_sync = None       # time.time() of the last successful reconciliation
+        self.last_error = None
+        self.generation = 0         # bumped when a reconciliation brings in outside changes
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """Create the tables; a table whose columns no longer match is rebuilt (next sync refills it)."""
+        with self._lock, self._conn:
+            for table in ("yarn_prices", "qualities"):
+                have = [r[1] for r in self._conn.execute(f"PRAGMA table_info({table})")]
+                want = list(_table_columns(table)) + ["_xmin"]
+                if have == want:
+                    continue
+                if have:
+                    self._conn.execute(f"DROP TABLE {table}")
+                self._conn.execute(_ddl(table))
+            for ddl in _INDEXES:
+                self._conn.execute(ddl)
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def _count(self, table):
+        with self._lock:
+            return self._conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+    # ---------------------------
+    # Reads (same names, arguments and row shapes as in db.py)
+    # ---------------------------
+
+    def list_yarn_prices(self):
+        return self._query("""
+            SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from
+            FROM yarn_prices
+            ORDER BY date(valid_from) DESC, id DESC
+        """)
+
+    def list_all_qualities_full(self):
+        return self.list_qualities(_quality_columns())
+
+    def list_qualities(self, columns=None):
+        from fabric_costing.db import quality_columns
+
+        columns = quality_columns(columns) or _quality_columns()
+        return self._query(f"""
+            SELECT {_quoted(columns)}
+            FROM qualities
+            ORDER BY quality_name COLLATE NOCASE, id
+        """)
+
+    def list_latest_yarn_prices(self):
+        return self._query("""
+            SELECT name, yarn_type, price_per_kg, denier, count
+            FROM (
+                SELECT name, yarn_type, price_per_kg, denier, count,
+                       row_number() OVER (PARTITION BY name, yarn_type ORDER BY valid_from DESC, id DESC) AS rn
+                FROM yarn_prices
+            )
+            WHERE rn = 1
+            ORDER BY name, yarn_type
+        """)
+
+    def get_latest_yarn_row(self, name, yarn_type=None):
+        sql = "SELECT id, name, yarn_type, count, denier, price_per_kg, valid_from FROM yarn_prices WHERE name = ?"
+        params = (name,)
+        if yarn_type:
+            sql += " AND (yarn_type = ? OR yarn_type = 'both')"
+            params += (yarn_type,)
+        rows = self._query(sql + " ORDER BY valid_from DESC, id DESC LIMIT 1", params)
+        return rows[0] if rows else None
+
+    def get_latest_yarn_price(self, name, yarn_type=None):
+        row = self.get_latest_yarn_row(name, yarn_type)
+        if row:
+            return row["price_per_kg"], row["denier"], row["count"]
+        return None, None, None
+
+    def list_yarn_names(self, yarn_type=None):
+        if yarn_type:
+            rows = self._query(
+                "SELECT DISTINCT name FROM yarn_prices WHERE yarn_type = ? OR yarn_type = 'both' ORDER BY name",
+                (yarn_type,),
+            )
+        else:
+            rows = self._query("SELECT DISTINCT name FROM yarn_prices ORDER BY name")
+        return [r["name"] for r in rows]
+
+    def list_all_qualities(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, quality_name, created_at FROM qualities ORDER BY quality_name COLLATE NOCASE, id"
+            ).fetchall()
+
+    def get_quality_by_id(self, q_id):
+        rows = self.get_qualities_by_ids([q_id])
+        return rows[0] if rows else None
+
+    def get_qualities_by_ids(self, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        return self._query(
+            f"SELECT {_quoted(_quality_columns())} FROM qualities WHERE id IN (SELECT value FROM json_each(?))",
+            (_json_ids(ids),),
+        )
+
+    def find_recipe_matches(self, recipe_hash, construction_hash, exclude_id=None, limit=10):
+        rows = self._query("""
+            SELECT id, quality_name, recipe_hash = ? AS exact
+            FROM qualities
+            WHERE construction_hash = ? AND id IS NOT ?
+            ORDER BY exact DESC, id
+            LIMIT ?
+        """, (recipe_hash, construction_hash, exclude_id, limit))
+        for r in rows:
+            r["exact"] = bool(r["exact"])
+        return rows
+
+    def list_duplicate_groups(self, exact=False):
+        key = "recipe_hash" if exact else "construction_hash"
+        rows = self._query(f"""
+            SELECT {key} AS k, id, quality_name, recipe_hash
+            FROM qualities
+            WHERE {key} IN (
+                SELECT {key} FROM qualities WHERE {key} IS NOT NULL GROUP BY {key} HAVING count(*) > 1
+            )
+            ORDER BY k, id
+        """)
+        groups = {}
+        for r in rows:
+            groups.setdefault(r["k"], []).append(r)
+        out = [{
+            "ids": [r["id"] for r in g],
+            "names": [r["quality_name"] for r in g],
+            "exact": len({r["recipe_hash"] for r in g}) == 1,
+        } for g in groups.values()]
+        out.sort(key=lambda g: (-len(g["ids"]), g["ids"][0]))
+        return out
+
+    # ---------------------------
+    # Sync with Postgres
+    # ---------------------------
+
+    def _fetch(self, conn, table, ids=None):
+        """Rows (table columns + xmin) from Postgres; all of them, or only `ids`."""
+        from fabric_costing.db import normalize_json
+
+        columns = _table_columns(table)
+        cur = conn.cursor()
+        sql = f"SELECT {', '.join(columns)}, xmin::text FROM {table}"
+        if ids is None:
+            cur.execute(sql)
+        else:
+            cur.execute(sql + " WHERE id = ANY(%s)", (list(ids),))
+        rows = cur.fetchall()
+        if table == "qualities":
+            # jsonb on some databases: stored as text, like the app writes it
+            at = columns.index("wefts_json")
+            rows = [r[:at] + (normalize_json(r[at]),) + r[at + 1:] for r in rows]
+        return rows
+
+    def _apply(self, table, rows, gone=()):
+        cols = _table_columns(table) + ("_xmin",)
+        sql = f"INSERT OR REPLACE INTO {table} ({_quoted(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+            if gone:
+                self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(i,) for i in gone])
+
+    def _reconcile_table(self, conn, table):
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, xmin::text FROM {table}")
+        remote = dict(cur.fetchall())
+        with self._lock:
+            local = dict(self._conn.execute(f"SELECT id, _xmin FROM {table}").fetchall())
+
+        changed = [i for i, version in remote.items() if local.get(i) != version]
+        gone = [i for i in local if i not in remote]
+        if not changed:
+            rows = []
+        elif len(changed) > FULL_FETCH_FRACTION * len(remote):
+            wanted = set(changed)
+            rows = [r for r in self._fetch(conn, table) if r[0] in wanted]
+        else:
+            rows = self._fetch(conn, table, changed)
+        # A write-through landing between the version read and here can be
+        # overwritten by an older copy; its version then differs next round.
+        self._apply(table, rows, gone)
+        return len(rows), len(gone)
+
+    def reconcile(self):
+        """
+        Bring both tables in line with Postgres by row version.
+        Returns {table: (rows fetched, rows dropped)}, or None when Postgres is unreachable.
+        """
+        from fabric_costing import db
+
+        try:
+            conn = db.get_conn()
+            try:
+                counts = {table: self._reconcile_table(conn, table) for table in ("yarn_prices", "qualities")}
+            finally:
+                conn.close()
+        except Exception as e:
+            self.mark_offline(e.__cause__ or e)  # the driver's message, not ReadOnlyError's
+            return None
+        self.online = True
+        self.last_error = None
+        self.last_sync = time.time()
+        if any(fetched or dropped for fetched, dropped in counts.values()):
+            self.generation += 1
+        return counts
+
+    def pull(self, conn, table, ids):
+        """Write-through: copy rows `ids` from Postgres (on conn, after the commit); ids gone there are dropped."""
+        ids = list(ids)
+        if not ids:
+            return
+        rows = self._fetch(conn, table, ids)
+        found = {r[0] for r in rows}
+        self._apply(table, rows, [i for i in ids if i not in found])
+
+    def drop(self, table, ids):
+        """Write-through of a delete by id."""
+        with self._lock, self._conn:
+            self._conn.executemany(f"DELETE FROM {table} WHERE id = ?", [(i,) for i in ids])
+
+    def drop_yarn(self, name):
+        """Write-through of delete_yarn_completely."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM yarn_prices WHERE name = ?", (name,))
+
+    def mark_offline(self, error):
+        self.online = False
+        self.last_error = str(error).strip() or type(error).__name__
+
+    def start(self):
+        """Reconcile every sync_every seconds on a daemon thread."""
+        if self.sync_every > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="fabric-replica-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.sync_every):
+            self.reconcile()
+
+    def status(self):
+        return {
+            "path": self.path,
+            "online": self.online,
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+            "yarn_prices": self._count("yarn_prices"),
+            "qualities": self._count("qualities"),
+        }
+
+
+def _json_ids(ids):
+    return "[" + ",".join(str(int(i)) for i in ids) + "]"
+
+
+# ---------------------------
+# Process-wide replica
+# ---------------------------
+
+_lock = threading.Lock()
+_replica = None     # (pid, path, Replica)
+
+
+def current():
+    """The open replica of this process, or None (never opens one)."""
+    rep = _replica
+    return rep[2] if rep is not None and rep[0] == os.getpid() else None
+
+
+def active():
+    """
+    The replica to read from, or None when FABRIC_REPLICA is unset.
+    Opened (and reconciled once) on first use, then kept in sync by a
+    background thread.
+    """
+    global _replica
+    path = os.getenv("FABRIC_REPLICA")
+    if not path:
+        return None
+    rep = _replica
+    if rep is not None and rep[0] == os.getpid() and rep[1] == path:
+        return rep[2]
+    with _lock:
+        rep = _replica
+        if rep is None or rep[0] != os.getpid() or rep[1] != path:
+            # A forked child gets its own SQLite connection: never share the parent's.
+            if rep is not None and rep[0] == os.getpid():
+                rep[2].close()
+            replica = Replica(path, float(os.getenv("FABRIC_REPLICA_SYNC", "60")))
+            replica.reconcile()
+            replica.start()
+            _replica = rep = (os.getpid(), path, replica)
+        return rep[2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or reconcile the local read replica")
+    parser.add_argument("--path", default=os.getenv("FABRIC_REPLICA") or "replica.sqlite",
+                        help="SQLite file (default: $FABRIC_REPLICA or replica.sqlite)")
+    args = parser.parse_args(argv)
+
+    rep = Replica(args.path, sync_every=0)
+    t0 = time.perf_counter()
+    counts = rep.reconcile()
+    elapsed = time.perf_counter() - t0
+    if counts is None:
+        print(f"Postgres unreachable: {rep.last_error}")
+        return 1
+    for table, (fetched, dropped) in counts.items():
+        print(f"{table:<12} {rep._count(table):>8} rows   {fetched} fetched, {dropped} dropped")
+    print(f"Reconciled {args.path} in {elapsed:.2f}s")
+    rep.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
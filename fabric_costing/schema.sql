@@ -0,0 +1,88 @@
+-- Tables used by the app (same columns as the Supabase project).
+-- For local development databases, synthetic data and benchmarks:
+--     python -m fabric_costing.synth --load --reset
+
+CREATE TABLE IF NOT EXISTS yarn_prices (
+    id            serial PRIMARY KEY,
+    name          text NOT NULL,
+    yarn_type     text NOT NULL,          -- 'warp' | 'weft' | 'both'
+    count         double precision,
+    denier        double precision,
+    price_per_kg  double precision NOT NULL,
+    valid_from    text                    -- ISO date
+);
+
+CREATE TABLE IF NOT EXISTS qualities (
+    id                     serial PRIMARY KEY,
+    created_at             text,
+    quality_name           text NOT NULL,
+
+    ends_mode              text,
+    ends                   double precision,
+    reed                   double precision,
+    rs                     double precision,
+    borders                double precision,
+    warp_denier            double precision,
+    warp_yarn_name         text,
+    warp_yarn_price        double precision,
+
+    picks                  double precision,
+    weft_rs                double precision,
+    weft_denier_mode       text,
+    weft_denier            double precision,
+    weft_count             double precision,
+    weft_yarn_name         text,
+    weft_yarn_price        double precision,
+
+    weaving_rate_per_pick  double precision,
+    grey_markup_percent    double precision,
+    rfd_charge_per_m       double precision,
+    rfd_shortage_percent   double precision,
+    rfd_markup_percent     double precision,
+
+    warp_weight_100        double precision,
+    weft_weight_100        double precision,
+    fabric_weight_100      double precision,
+    warp_cost_100          double precision,
+    weft_cost_100          double precision,
+    weaving_charge_100     double precision,
+    interest_on_yarn_100   double precision,
+    final_grey_cost_100    double precision,
+    grey_sale_100          double precision,
+    rfd_cost_100           double precision,
+    rfd_sale_100           double precision,
+
+    include_interest       boolean DEFAULT true,
+    wefts_json             text,
+
+    recipe_hash            text,           -- see fabric_costing/dedupe.py
+    construction_hash      text
+);
+
+-- Added later: run on existing databases too (Supabase SQL editor), then
+--     python -m fabric_costing.dedupe --backfill
+ALTER TABLE qualities ADD COLUMN IF NOT EXISTS recipe_hash text;
+ALTER TABLE qualities ADD COLUMN IF NOT EXISTS construction_hash text;
+CREATE INDEX IF NOT EXISTS qualities_recipe_hash_idx ON qualities (recipe_hash);
+CREATE INDEX IF NOT EXISTS qualities_construction_hash_idx ON qualities (construction_hash);
+
+-- Dated Pricing Sheet snapshots (see fabric_costing/snapshots.py).
+-- One narrow row per quality per snapshot; the primary key makes reading
+-- a snapshot an index range scan and a diff a merge join.
+CREATE TABLE IF NOT EXISTS pricing_snapshots (
+    id           serial PRIMARY KEY,
+    taken_at     timestamptz NOT NULL DEFAULT now(),
+    label        text,
+    n_rows       integer NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS pricing_snapshot_rows (
+    snapshot_id  integer NOT NULL REFERENCES pricing_snapshots (id) ON DELETE CASCADE,
+    quality_id   integer NOT NULL,
+    weight       real,                    -- sheet weight (kg / 100 m)
+    grey_cost    real,                    -- ₹ / m
+    grey_sale    real,
+    rfd_cost     real,
+    rfd_sale     real,
+    PRIMARY KEY (snapshot_id, quality_id)
+);
@@ -0,0 +1,90 @@
+"""
+Sheet rows and recipe-level filters (Pricing Sheet / Costing Sheet).
+Pure Python – shared by the UI, exports and benchmarks.
+"""
+from fabric_costing.costing import RECIPE_COLUMNS
+
+# qualities columns each sheet needs (dynamic costing inputs + what it shows / filters on)
+PRICING_SHEET_COLUMNS = ("id", "quality_name") + RECIPE_COLUMNS
+COSTING_SHEET_COLUMNS = ("id", "quality_name", "reed") + RECIPE_COLUMNS
+
+
+def sheet_weight(cost):
+    """The sheets' single weight column: warp with shortage + weft (scalars or arrays)."""
+    return cost["warp_weight_100"] * 1.09 + cost["weft_weight_100"]
+
+
+def pricing_sheet_row(q, cost):
+    """One Pricing Sheet row (display values, rounded)."""
+    # your preferred single weight column:
+    fabric_weight_cost = sheet_weight(cost)
+
+    return {
+        "Quality": q["quality_name"],
+        "Weight": round(fabric_weight_cost, 3),
+        "Grey Sale (₹/m)": round(cost["grey_sale_per_m"], 2),
+        "RFD Sale (₹/m)": round(cost["rfd_sale_per_m"], 2),
+    }
+
+
+def in_range(val, lo, hi):
+    """lo / hi of None mean 'no limit'."""
+    if lo is None and hi is None:
+        return True
+    if val is None:
+        return False
+    val = float(val)
+    return (lo is None or val >= lo) and (hi is None or val <= hi)
+
+
+def filter_qualities(qualities, name_query="", reed_range=(None, None),
+                     picks_range=(None, None), markup_field="grey_markup_percent",
+                     markup_range=(None, None)):
+    """
+    Recipe-level filters – these only look at stored inputs,
+    so they run BEFORE any costing.
+    """
+    needle = (name_query or "").strip().lower()
+    out = []
+    for q in qualities:
+        if needle and needle not in (q["quality_name"] or "").lower():
+            continue
+        if not in_range(q.get("reed"), *reed_range):
+            continue
+        if not in_range(q.get("picks"), *picks_range):
+            continue
+        if not in_range(q.get(markup_field), *markup_range):
+            continue
+        out.append(q)
+    return out
+
+
+def costing_sheet_row(q, cost):
+    """One Costing Sheet row (display values, rounded)."""
+    # SAME weight logic as pricing sheet
+    fabric_weight_costing = sheet_weight(cost)
+
+    # 🔑 Picks: use dynamic total picks if present
+    total_picks = cost.get("_dynamic_total_picks", q.get("picks"))
+
+    return {
+        "Quality": q["quality_name"],
+        "Weight": round(fabric_weight_costing, 3),
+        "Grey Cost (₹/m)": round(cost["grey_cost_per_m"], 2),
+        "Grey Sale (₹/m)": round(cost["grey_sale_per_m"], 2),
+        "RFD Cost (₹/m)": round(cost["rfd_cost_per_m"], 2),
+        "RFD Sale (₹/m)": round(cost["rfd_sale_per_m"], 2),
+        "Reed": q.get("reed"),
+        "Picks": round(total_picks, 1) if total_picks is not None else None,
+    }
+
+
+# Sort keys that only need stored recipe fields (no costing required)
+COSTING_SHEET_RECIPE_SORTS = {
+    "Quality": lambda q: (q["quality_name"] or "").lower(),
+    "Reed": lambda q: float(q.get("reed") or 0.0),
+    "Picks": lambda q: float(q.get("picks") or 0.0),
+}
+COSTING_SHEET_COST_SORTS = [
+    "Weight", "Grey Cost (₹/m)", "Grey Sale (₹/m)", "RFD Cost (₹/m)", "RFD Sale (₹/m)",
+]
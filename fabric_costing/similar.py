@@ -0,0 +1,253 @@
+"""
+Nearest-construction search over saved qualities.
+
+Every recipe becomes a small feature vector (ends, reed, RS, warp denier,
+picks, mean / finest / coarsest weft denier). Features are log-scaled –
+a 10% difference counts the same for 40D and 400D, for 2400 and 9000
+ends – then standardized, and indexed in a KD-tree:
+
+    index = SimilarityIndex.build(db.list_qualities(SIMILARITY_COLUMNS))
+    index.nearest(recipe, k=10)        # [(quality id, distance)], closest first
+    index.upsert(q_id, recipe)         # after save_quality / update_quality
+    index.remove(q_id)                 # after delete_quality
+
+Updates don't touch the tree: new / changed recipes go to a small pending
+set that is scanned directly, replaced ones are hidden from the tree.
+Once the pending set passes REBUILD_FRACTION of the index, the tree is
+rebuilt (with fresh scaling).
+"""
+import heapq
+import json
+import math
+import threading
+import warnings
+
+import numpy as np
+
+FEATURES = (
+    "ends", "reed", "rs", "warp_denier", "picks",
+    "weft_denier", "weft_denier_min", "weft_denier_max",
+)
+
+# Columns build() needs from the qualities table
+SIMILARITY_COLUMNS = ("id", "ends", "reed", "rs", "warp_denier", "picks", "weft_denier", "wefts_json")
+
+LEAF_SIZE = 128  # leaves are scanned with numpy, so wide leaves are cheap
+REBUILD_FRACTION = 0.05
+REBUILD_MIN = 64
+
+
+def _num(val):
+    try:
+        val = float(val)
+    except (TypeError, ValueError):
+        return None
+    return val if val > 0 and not math.isinf(val) else None
+
+
+def _weft_deniers(q):
+    """[(picks, denier)] from wefts_json (str or list); falls back to the main weft fields."""
+    wefts = q.get("wefts_json")
+    if isinstance(wefts, str):
+        try:
+            wefts = json.loads(wefts)
+        except ValueError:
+            wefts = None
+    out = []
+    for wf in wefts or ():
+        p, d = _num(wf.get("picks")), _num(wf.get("denier"))
+        if p and d:
+            out.append((p, d))
+    if not out:
+        p, d = _num(q.get("picks")), _num(q.get("weft_denier"))
+        if d:
+            out.append((p or 1.0, d))
+    return out
+
+
+def recipe_features(q):
+    """
+    Raw feature tuple (FEATURES order) for a quality row or any recipe dict
+    with the same keys. Missing values are NaN; reed falls back to ends / RS.
+    """
+    ends, rs = _num(q.get("ends")), _num(q.get("rs"))
+    reed = _num(q.get("reed"))
+    if reed is None and ends and rs:
+        reed = ends / rs
+
+    wefts = _weft_deniers(q)
+    picks = _num(q.get("picks")) or (sum(p for p, _ in wefts) if wefts else None)
+    if wefts:
+        total = sum(p for p, _ in wefts)
+        weft_mean = sum(p * d for p, d in wefts) / total
+        weft_min = min(d for _, d in wefts)
+        weft_max = max(d for _, d in wefts)
+    else:
+        weft_mean = weft_min = weft_max = None
+
+    vals = (ends, reed, rs, _num(q.get("warp_denier")), picks, weft_mean, weft_min, weft_max)
+    return tuple(math.nan if v is None else v for v in vals)
+
+
+# ---------------------------
+# KD-tree
+# ---------------------------
+
+class _KDTree:
+    """
+    Static KD-tree over the rows of `points` (n x d). Nodes split on the
+    dimension with the widest spread, at the median; leaves hold up to
+    LEAF_SIZE points and are scanned with numpy.
+    """
+    __slots__ = ("points", "order", "nodes")
+
+    def __init__(self, points):
+        self.points = points
+        self.order = np.arange(len(points))
+        # node: (dim, split value, left, right) or (-1, start, end, None) for a leaf
+        self.nodes = []
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start, end):
+        node_id = len(self.nodes)
+        self.nodes.append(None)
+        idx = self.order[start:end]
+        if end - start <= LEAF_SIZE:
+            self.nodes[node_id] = (-1, start, end, None)
+            return node_id
+        pts = self.points[idx]
+        dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        mid = (end - start) // 2
+        part = np.argpartition(pts[:, dim], mid)
+        self.order[start:end] = idx[part]
+        split = float(self.points[self.order[start + mid], dim])
+        left = self._build(start, start + mid)
+        right = self._build(start + mid, end)
+        self.nodes[node_id] = (dim, split, left, right)
+        return node_id
+
+    def query(self, x, k, skip=()):
+        """[(squared distance, row)] of the k closest rows not in `skip`, closest first."""
+        if not self.nodes:
+            return []
+        best = []  # max-heap of (-dist², row)
+        stack = [(0, 0.0)]
+        while stack:
+            node_id, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            dim, a, b, c = self.nodes[node_id]
+            if dim < 0:
+                rows = self.order[a:b]
+                d2 = ((self.points[rows] - x) ** 2).sum(axis=1)
+                if len(best) == k:
+                    close = d2 < -best[0][0]
+                    rows, d2 = rows[close], d2[close]
+                for dist, row in zip(d2.tolist(), rows.tolist()):
+                    if row in skip:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-dist, row))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, row))
+                continue
+            diff = x[dim] - a
+            near, far = (b, c) if diff < 0 else (c, b)
+            # far side first on the stack, so the near side is explored first
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return sorted((-d, row) for d, row in best)
+
+
+# ---------------------------
+# Index
+# ---------------------------
+
+class SimilarityIndex:
+    def __init__(self, ids, raw):
+        self._lock = threading.Lock()
+        self._reset(ids, raw)
+
+    @classmethod
+    def build(cls, qualities):
+        """Index rows with an "id" and the SIMILARITY_COLUMNS recipe fields."""
+        ids = [q["id"] for q in qualities]
+        raw = np.array([recipe_features(q) for q in qualities], dtype=np.float64).reshape(-1, len(FEATURES))
+        return cls(ids, raw)
+
+    def _reset(self, ids, raw):
+        logged = np.log(raw)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NULL feature columns
+            center = np.nanmean(logged, axis=0) if len(raw) else np.zeros(len(FEATURES))
+            scale = np.nanstd(logged, axis=0) if len(raw) else np.ones(len(FEATURES))
+        self._center = np.nan_to_num(center)
+        self._scale = np.where(np.isfinite(scale) & (scale > 1e-9), scale, 1.0)
+
+        self._ids = list(ids)
+        self._raw = raw
+        self._row_of = {q_id: i for i, q_id in enumerate(self._ids)}
+        self._tree = _KDTree(self._normalize(raw))
+        self._hidden = set()    # tree rows replaced or removed since the build
+        self._pending = {}      # id -> raw features, added / changed since the build
+
+    def _normalize(self, raw):
+        # missing features sit at the mean, so they neither help nor hurt a match
+        return np.nan_to_num((np.log(raw) - self._center) / self._scale)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids) - len(self._hidden) + len(self._pending)
+
+    # --- queries ---
+
+    def nearest(self, recipe, k=10, exclude_id=None):
+        """
+        The k saved qualities closest to `recipe` (a quality row or recipe
+        dict), as [(quality id, distance)], closest first. Distance is in
+        standard deviations of the log features (0 = same construction).
+        """
+        x = self._normalize(np.array(recipe_features(recipe), dtype=np.float64))
+        with self._lock:
+            skip = self._hidden
+            if exclude_id is not None and exclude_id in self._row_of:
+                skip = skip | {self._row_of[exclude_id]}
+            found = [(d2, self._ids[row]) for d2, row in self._tree.query(x, k, skip)]
+            if self._pending:
+                p_ids = [q_id for q_id in self._pending if q_id != exclude_id]
+                if p_ids:
+                    pts = self._normalize(np.array([self._pending[q_id] for q_id in p_ids]))
+                    d2 = ((pts - x) ** 2).sum(axis=1)
+                    found.extend(zip(d2.tolist(), p_ids))
+        found.sort()
+        return [(q_id, math.sqrt(d2)) for d2, q_id in found[:k]]
+
+    # --- incremental updates ---
+
+    def upsert(self, q_id, recipe):
+        """Add or replace one quality (after save_quality / update_quality)."""
+        with self._lock:
+            row = self._row_of.get(q_id)
+            if row is not None:
+                self._hidden.add(row)
+            self._pending[q_id] = recipe_features(recipe)
+            self._maybe_rebuild()
+
+    def remove(self, q_id):
+        """Drop one quality (after delete_quality)."""
+        with self._lock:
+            row = self._row_of.get(q_id)
+            if row is not None:
+                self._hidden.add(row)
+            self._pending.pop(q_id, None)
+            self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        churn = len(self._hidden) + len(self._pending)
+        if churn < max(REBUILD_MIN, REBUILD_FRACTION * len(self._ids)):
+            return
+        keep = [i for i in range(len(self._ids)) if i not in self._hidden and self._ids[i] not in self._pending]
+        ids = [self._ids[i] for i in keep] + list(self._pending)
+        pending = np.array(list(self._pending.values()), dtype=np.float64).reshape(-1, len(FEATURES))
+        self._reset(ids, np.vstack([self._raw[keep], pending]))
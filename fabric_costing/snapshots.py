@@ -0,0 +1,98 @@
+"""
+Dated Pricing Sheet snapshots – what we quoted, and when.
+
+A snapshot stores the computed sheet – per quality: sheet weight, grey and
+RFD cost and sale per metre – under a timestamp, in the narrow
+pricing_snapshot_rows table (see schema.sql). Reading one back is a
+primary-key range scan; comparing two is a single join in Postgres
+(db.diff_pricing_snapshots), not two recomputes.
+
+    snapshot_id = capture(label="Price list Oct")          # costs every quality with the latest yarn prices
+    db.diff_pricing_snapshots(older_id, snapshot_id)       # who moved, by how much
+
+    python -m fabric_costing.snapshots --capture --label "Price list Oct"
+    python -m fabric_costing.snapshots --list
+    python -m fabric_costing.snapshots --diff 3 4
+"""
+import argparse
+import sys
+import time
+
+from fabric_costing.sheets import sheet_weight
+
+# snapshot column -> kernel / calculate_costing output
+VALUE_SOURCES = {
+    "grey_cost": "grey_cost_per_m",
+    "grey_sale": "grey_sale_per_m",
+    "rfd_cost": "rfd_cost_per_m",
+    "rfd_sale": "rfd_sale_per_m",
+}
+
+
+def snapshot_rows(batch):
+    """[(quality_id, weight, grey_cost, grey_sale, rfd_cost, rfd_sale)] for a RecipeBatch – one evaluation."""
+    cost = batch.evaluate()
+    cols = [sheet_weight(cost)] + [cost[out] for out in VALUE_SOURCES.values()]
+    return list(zip(batch.ids.tolist(), *(c.tolist() for c in cols)))
+
+
+def capture(label=None, batch=None):
+    """
+    Cost the whole catalog (or a ready RecipeBatch) and store it as a new
+    snapshot. Returns the snapshot id.
+    """
+    from fabric_costing import db
+
+    if batch is None:
+        from fabric_costing.kernel import RecipeBatch
+        from fabric_costing.sheets import PRICING_SHEET_COLUMNS
+
+        batch = RecipeBatch.from_qualities(db.list_qualities(PRICING_SHEET_COLUMNS), db.get_latest_yarn_price_map())
+    return db.create_pricing_snapshot(snapshot_rows(batch), label=label)
+
+
+def _fmt(val):
+    return f"{'–':>9}" if val is None else f"{val:9.2f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capture, list and compare Pricing Sheet snapshots")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--capture", action="store_true", help="snapshot the current Pricing Sheet")
+    action.add_argument("--list", action="store_true", help="list snapshots, newest first")
+    action.add_argument("--diff", nargs=2, type=int, metavar=("OLD", "NEW"), help="compare two snapshots")
+    parser.add_argument("--label", help="with --capture: a name for the snapshot")
+    parser.add_argument("--limit", type=int, default=50, help="max rows to print (0 = all)")
+    args = parser.parse_args(argv)
+
+    from fabric_costing import db
+
+    if args.capture:
+        t0 = time.perf_counter()
+        snapshot_id = capture(label=args.label)
+        print(f"Snapshot #{snapshot_id} captured in {time.perf_counter() - t0:.2f}s")
+        return 0
+
+    if args.list:
+        for s in db.list_pricing_snapshots():
+            print(f"#{s['id']:<5} {s['taken_at']:%Y-%m-%d %H:%M}  {s['n_rows']:>7} qualities  {s['label'] or ''}")
+        return 0
+
+    t0 = time.perf_counter()
+    rows = db.diff_pricing_snapshots(*args.diff)
+    elapsed = time.perf_counter() - t0
+    shown = rows[:args.limit] if args.limit else rows
+    print(f"{'id':>7}  {'quality':<32} {'status':<8} {'RFD sale':>9} {'->':>9} {'change':>8}")
+    for r in shown:
+        old, new = r["old_rfd_sale"], r["new_rfd_sale"]
+        change = f"{new - old:+8.2f}" if old is not None and new is not None else f"{'':>8}"
+        name = (r["quality_name"] or "(deleted)")[:32]
+        print(f"{r['quality_id']:>7}  {name:<32} {r['status']:<8} {_fmt(old)} {_fmt(new)} {change}")
+    if len(rows) > len(shown):
+        print(f"... and {len(rows) - len(shown)} more")
+    print(f"{len(rows)} qualities moved ({elapsed * 1000:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
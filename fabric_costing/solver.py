@@ -0,0 +1,179 @@
+"""
+Reverse costing: what would one recipe input have to be to hit a target price?
+
+    batch = RecipeBatch.from_qualities(qualities, yarn_price_map)
+    sol = solve(batch, "rfd_sale", 55.0, "picks")      # arrays, one element per quality
+    sol["required"]                                     # NaN where the target can't be reached
+
+Targets (₹/m): grey_cost, grey_sale, rfd_cost, rfd_sale.
+Free variables:
+    picks          total picks (every weft scaled together, same denier mix)
+    weft_price     effective weft yarn price ₹/kg (pick/weight-weighted over the wefts)
+    warp_price     warp yarn price ₹/kg
+    weaving_rate   weaving charge ₹/pick/m
+    markup         grey markup % for grey_sale, RFD markup % for rfd_sale
+
+Every price is linear in the first four, so those are solved in closed
+form from two kernel evaluations (intercept + slope). Markup is a margin
+on the selling price (sale = cost / (1 - m/100)), so it is found by
+vectorized bisection over [0, MAX_MARKUP) – all qualities in lock step.
+
+    python -m fabric_costing.solver --target rfd_sale --value 55 --solve picks --name rubia
+"""
+import argparse
+import sys
+
+import numpy as np
+
+TARGETS = {
+    "grey_cost": "grey_cost_per_m",
+    "grey_sale": "grey_sale_per_m",
+    "rfd_cost": "rfd_cost_per_m",
+    "rfd_sale": "rfd_sale_per_m",
+}
+
+# variable -> costing input; None = depends on the target (markup)
+VARIABLES = {
+    "picks": "picks",
+    "weft_price": "weft_yarn_price",
+    "warp_price": "warp_yarn_price",
+    "weaving_rate": "weaving_rate_per_pick",
+    "markup": None,
+}
+LINEAR = frozenset({"picks", "weft_price", "warp_price", "weaving_rate"})
+
+_MARKUP_INPUT = {"grey_sale": "grey_markup_percent", "rfd_sale": "rfd_markup_percent"}
+
+MAX_MARKUP = 99.0
+BISECT_TOL = 1e-9
+
+
+def solve_input(target, variable):
+    """The calculate_costing input that `variable` stands for, for this target."""
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target: {target} (one of {', '.join(TARGETS)})")
+    if variable not in VARIABLES:
+        raise ValueError(f"Unknown variable: {variable} (one of {', '.join(VARIABLES)})")
+    if variable == "markup":
+        if target not in _MARKUP_INPUT:
+            raise ValueError("Markup only changes sale prices – choose a sale price as the target")
+        return _MARKUP_INPUT[target]
+    return VARIABLES[variable]
+
+
+def solve(batch, target, value, variable):
+    """
+    Solve every recipe in `batch` for `variable` so that `target` equals
+    `value` (scalar or one value per recipe).
+    Returns {"input", "current", "required", "current_target"} – arrays;
+    "required" is NaN where no value >= 0 (markup: below MAX_MARKUP) reaches the target.
+    """
+    name = solve_input(target, variable)
+    out = TARGETS[target]
+    value = np.broadcast_to(np.asarray(value, dtype=np.float64), len(batch))
+
+    if variable in LINEAR:
+        f0 = batch.evaluate(**{name: 0.0})[out]
+        slope = batch.evaluate(**{name: 1.0})[out] - f0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            required = (value - f0) / slope
+        required[~np.isfinite(required) | (required < 0)] = np.nan
+    else:
+        required = _bisect(batch, name, out, value, 0.0, MAX_MARKUP)
+
+    return {
+        "input": name,
+        "current": batch[name].copy(),
+        "required": required,
+        "current_target": batch.evaluate()[out],
+    }
+
+
+def _bisect(batch, name, out, value, lo, hi):
+    """Vectorized bisection for an input the target increases with; NaN where [lo, hi] doesn't bracket it."""
+    n = len(batch)
+    lo = np.full(n, lo)
+    hi = np.full(n, hi)
+    f_lo = batch.evaluate(**{name: lo})[out] - value
+    f_hi = batch.evaluate(**{name: hi})[out] - value
+    ok = (f_lo <= 0) & (f_hi >= 0)
+
+    # each step halves the bracket: ~40 steps from 99 down to 1e-9
+    steps = int(np.ceil(np.log2(max(hi.max(initial=1.0), 1.0) / BISECT_TOL)))
+    for _ in range(steps):
+        mid = (lo + hi) / 2.0
+        below = batch.evaluate(**{name: mid})[out] < value
+        lo = np.where(below, mid, lo)
+        hi = np.where(below, hi, mid)
+
+    required = (lo + hi) / 2.0
+    required[~ok] = np.nan
+    return required
+
+
+def solve_qualities(qualities, yarn_price_map, target, value, variable):
+    """solve() over quality rows, as [{id, quality_name, current, required, change_percent, current_target}]."""
+    from fabric_costing.kernel import RecipeBatch
+
+    batch = RecipeBatch.from_qualities(qualities, yarn_price_map)
+    sol = solve(batch, target, value, variable)
+    rows = []
+    for q, cur, req, cur_target in zip(qualities, sol["current"], sol["required"], sol["current_target"]):
+        req = None if np.isnan(req) else float(req)
+        rows.append({
+            "id": q["id"],
+            "quality_name": q["quality_name"],
+            "current_target": float(cur_target),
+            "current": float(cur),
+            "required": req,
+            "change_percent": (req / cur - 1.0) * 100.0 if req is not None and cur else None,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve one recipe input for a target price, over many qualities")
+    parser.add_argument("--target", choices=sorted(TARGETS), required=True)
+    parser.add_argument("--value", type=float, required=True, help="target price ₹/m")
+    parser.add_argument("--solve", choices=sorted(VARIABLES), required=True, dest="variable")
+    parser.add_argument("--ids", help="comma-separated quality ids")
+    parser.add_argument("--name", help="only qualities whose name contains this (case-insensitive)")
+    parser.add_argument("--limit", type=int, default=50, help="max rows to print (0 = all)")
+    args = parser.parse_args(argv)
+
+    from fabric_costing import db
+    from fabric_costing.costing import RECIPE_COLUMNS
+
+    try:
+        solve_input(args.target, args.variable)
+    except ValueError as e:
+        parser.error(str(e))
+
+    qualities = db.list_qualities(("quality_name",) + RECIPE_COLUMNS)
+    if args.ids:
+        wanted = {int(x) for x in args.ids.split(",") if x.strip()}
+        qualities = [q for q in qualities if q["id"] in wanted]
+    if args.name:
+        needle = args.name.lower()
+        qualities = [q for q in qualities if needle in (q["quality_name"] or "").lower()]
+    if not qualities:
+        print("No qualities match.")
+        return 1
+
+    rows = solve_qualities(qualities, db.get_latest_yarn_price_map(), args.target, args.value, args.variable)
+    shown = rows[:args.limit] if args.limit else rows
+    print(f"{'id':>7}  {'quality':<32} {args.target:>10} {args.variable:>12} {'required':>10} {'change':>8}")
+    for r in shown:
+        req = f"{r['required']:10.3f}" if r["required"] is not None else f"{'–':>10}"
+        chg = f"{r['change_percent']:+7.1f}%" if r["change_percent"] is not None else f"{'':>8}"
+        print(f"{r['id']:>7}  {r['quality_name'][:32]:<32} {r['current_target']:10.2f} {r['current']:12.3f} {req} {chg}")
+    if len(rows) > len(shown):
+        print(f"... and {len(rows) - len(shown)} more")
+    unreachable = sum(r["required"] is None for r in rows)
+    if unreachable:
+        print(f"{unreachable} of {len(rows)} can't reach ₹{args.value:.2f}/m by changing {args.variable} alone.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Seeded synthetic catalog – realistic sizes for benchmarks and load tests.
+
+    python -m fabric_costing.synth                                  # print a summary only
+    python -m fabric_costing.synth --load --reset                   # (re)fill SUPABASE_URI
+    python -m fabric_costing.synth --qualities 20000 --yarns 2000 --price-rows 200000 --seed 42 --load
+    python -m fabric_costing.synth --duplicates 0.03 --load --reset    # with re-saved copies (dedupe)
+
+Same seed + sizes -> same rows, so benchmark runs are comparable.
+
+Yarns get a price history (random walk over dates); qualities use 1–8 wefts
+linked to weft yarns (some manual prices) and carry stored costs computed
+from the latest prices, exactly like the New Costing page would save them.
+Never point --load --reset at the production database.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from fabric_costing.costing import build_yarn_price_map, compute_dynamic_cost
+from fabric_costing.db import HASH_COLUMNS, STORED_COST_COLUMNS
+from fabric_costing.dedupe import recipe_hashes
+
+DEFAULT_QUALITIES = 20000
+DEFAULT_YARNS = 2000
+DEFAULT_PRICE_ROWS = 200000
+
+_MATERIALS = ("Poly", "Nylon", "Viscose", "Cotton", "PV", "Linen", "Modal", "Lycra")
+_FINISHES = ("FDY", "DTY", "SD", "BR", "Slub", "Twist")
+_QUALITY_WORDS = ("Rubia", "Cambric", "Dobby", "Satin", "Twill", "Poplin", "Voile", "Crepe",
+                  "Georgette", "Chiffon", "Oxford", "Matty", "Jacquard", "Lawn", "Shirting")
+
+
+def generate_yarns(n_yarns, n_price_rows, rng, start=date(2023, 1, 1), days=730):
+    """
+    yarn_prices rows (without id), in insertion order.
+    Every yarn gets at least one price; the rest of the rows are spread
+    over random yarns as a price history.
+    """
+    yarns = []
+    for i in range(n_yarns):
+        yarn_type = rng.choices(("warp", "weft", "both"), weights=(3, 5, 2))[0]
+        if rng.random() < 0.25:
+            count = float(rng.choice((20, 24, 30, 36, 40, 50, 60, 80)))
+            name = f"{int(count)}s {rng.choice(_MATERIALS)} {i:04d}"
+            denier = None
+        else:
+            denier = float(rng.choice((20, 30, 40, 50, 68, 75, 100, 120, 150, 200, 300, 450)))
+            count = None
+            name = f"{int(denier)}D {rng.choice(_MATERIALS)} {rng.choice(_FINISHES)} {i:04d}"
+        yarns.append({
+            "name": name,
+            "yarn_type": yarn_type,
+            "count": count,
+            "denier": denier,
+            "price": rng.uniform(120.0, 450.0),
+        })
+
+    n_price_rows = max(n_price_rows, n_yarns)
+    picks = list(range(n_yarns)) + [rng.randrange(n_yarns) for _ in range(n_price_rows - n_yarns)]
+    dates = sorted(start + timedelta(days=rng.randrange(days)) for _ in picks)
+
+    rows = []
+    for yi, day in zip(picks, dates):
+        y = yarns[yi]
+        # small random walk, kept in a sane band
+        y["price"] = min(900.0, max(60.0, y["price"] * rng.uniform(0.96, 1.05)))
+        rows.append({
+            "name": y["name"],
+            "yarn_type": y["yarn_type"],
+            "count": y["count"],
+            "denier": y["denier"],
+            "price_per_kg": round(y["price"], 2),
+            "valid_from": day.isoformat(),
+        })
+    return rows
+
+
+def latest_yarn_rows(yarn_rows):
+    """Latest row per (name, yarn_type) – what list_latest_yarn_prices() returns."""
+    latest = {}
+    for r in yarn_rows:  # insertion order == id order, dates ascending
+        key = (r["name"], r["yarn_type"])
+        cur = latest.get(key)
+        if cur is None or r["valid_from"] >= cur["valid_from"]:
+            latest[key] = r
+    return list(latest.values())
+
+
+def generate_qualities(n_qualities, yarn_rows, rng, max_wefts=8, created=datetime(2024, 1, 1), duplicates=0.0):
+    """
+    qualities rows (without id) with stored costs from the latest prices.
+    duplicates: fraction of rows that re-save an earlier recipe under a new
+    name (half of them with different charges), like New Costing does.
+    """
+    latest = latest_yarn_rows(yarn_rows)
+    price_map = build_yarn_price_map(latest)
+    warp_yarns = [r for r in latest if r["yarn_type"] in ("warp", "both") and r["denier"]]
+    weft_yarns = [r for r in latest if r["yarn_type"] in ("weft", "both")]
+
+    rows = []
+    for i in range(n_qualities):
+        if duplicates and rows and rng.random() < duplicates:
+            q = dict(rng.choice(rows))
+            q["created_at"] = (created + timedelta(minutes=7 * i)).isoformat(timespec="seconds")
+            base = q["quality_name"].split(" copy #")[0].rsplit(" #", 1)[0]
+            q["quality_name"] = f"{base} copy #{i:05d}"
+            if rng.random() < 0.5:
+                q["grey_markup_percent"] = float(rng.choice((5, 6, 8, 10, 12, 15)))
+                q["weaving_rate_per_pick"] = round(rng.uniform(0.10, 0.25), 3)
+            rows.append(_with_costs(q, price_map))
+            continue
+
+        reed = float(rng.choice((48, 52, 56, 60, 64, 68, 72, 76, 80, 88, 96)))
+        rs = float(rng.choice((44, 48, 52, 56, 58, 60, 63, 66)))
+        borders = float(rng.choice((0, 24, 48, 64)))
+        calc_ends = rng.random() < 0.7
+        ends = reed * rs + borders if calc_ends else float(rng.randrange(2400, 9000, 10))
+
+        if warp_yarns and rng.random() < 0.85:
+            wy = rng.choice(warp_yarns)
+            warp_name, warp_denier, warp_price = wy["name"], wy["denier"], wy["price_per_kg"]
+        else:
+            warp_name = None
+            warp_denier = float(rng.choice((40, 50, 68, 75, 80, 100)))
+            warp_price = round(rng.uniform(140.0, 320.0), 2)
+
+        wefts = []
+        for _ in range(rng.randint(1, max_wefts)):
+            p = float(rng.choice((4, 8, 10, 12, 16, 20, 24, 28, 32, 40, 48, 56, 64)))
+            if weft_yarns and rng.random() < 0.85:
+                wy = rng.choice(weft_yarns)
+                if wy["count"]:
+                    wf = {"picks": p, "denier": round(5315.0 / wy["count"], 3), "price": wy["price_per_kg"],
+                          "mode": "count", "count": wy["count"], "yarn_name": wy["name"]}
+                else:
+                    wf = {"picks": p, "denier": wy["denier"], "price": wy["price_per_kg"],
+                          "mode": "denier", "count": 0.0, "yarn_name": wy["name"]}
+            else:
+                wf = {"picks": p, "denier": float(rng.choice((50, 75, 100, 150, 300))),
+                      "price": round(rng.uniform(150.0, 400.0), 2),
+                      "mode": "denier", "count": 0.0, "yarn_name": "(manual price)"}
+            wefts.append(wf)
+
+        total_picks = sum(w["picks"] for w in wefts)
+        num_den = sum(w["picks"] * w["denier"] for w in wefts)
+        num_price = sum(w["picks"] * w["denier"] * w["price"] for w in wefts)
+
+        q = {
+            "created_at": (created + timedelta(minutes=7 * i)).isoformat(timespec="seconds"),
+            "quality_name": f"{rng.choice(_QUALITY_WORDS)} {int(reed)}x{int(total_picks)} #{i:05d}",
+            "ends_mode": "calc" if calc_ends else "direct",
+            "ends": ends,
+            "reed": reed,
+            "rs": rs,
+            "borders": borders,
+            "warp_denier": warp_denier,
+            "warp_yarn_name": warp_name,
+            "warp_yarn_price": warp_price,
+            "picks": total_picks,
+            "weft_rs": rs,
+            "weft_denier_mode": "denier",
+            "weft_denier": num_den / total_picks,
+            "weft_count": None,
+            "weft_yarn_name": None,
+            "weft_yarn_price": num_price / num_den,
+            "weaving_rate_per_pick": round(rng.uniform(0.10, 0.25), 3),
+            "grey_markup_percent": float(rng.choice((5, 6, 8, 10, 12, 15))),
+            "rfd_charge_per_m": round(rng.uniform(1.0, 4.0), 2),
+            "rfd_shortage_percent": float(rng.choice((3, 4, 5, 5.5, 6, 8))),
+            "rfd_markup_percent": float(rng.choice((6, 8, 10, 12, 15))),
+            "include_interest": rng.random() < 0.8,
+            "wefts_json": json.dumps(wefts),
+        }
+        rows.append(_with_costs(q, price_map))
+    return rows
+
+
+def _with_costs(q, price_map):
+    """Fill the stored cost and recipe hash columns, as save_quality would."""
+    cost = compute_dynamic_cost(q, price_map)
+    for col in STORED_COST_COLUMNS:
+        q[col] = cost[col]
+    for col, val in zip(HASH_COLUMNS, recipe_hashes(q)):
+        q[col] = val
+    return q
+
+
+YARN_COLUMNS = ("name", "yarn_type", "count", "denier", "price_per_kg", "valid_from")
+QUALITY_COLUMNS = (
+    "created_at", "quality_name",
+    "ends_mode", "ends", "reed", "rs", "borders", "warp_denier",
+    "warp_yarn_name", "warp_yarn_price",
+    "picks", "weft_rs", "weft_denier_mode", "weft_denier", "weft_count",
+    "weft_yarn_name", "weft_yarn_price",
+    "weaving_rate_per_pick", "grey_markup_percent",
+    "rfd_charge_per_m", "rfd_shortage_percent", "rfd_markup_percent",
+) + STORED_COST_COLUMNS + ("include_interest", "wefts_json") + HASH_COLUMNS
+
+
+def generate(n_qualities=DEFAULT_QUALITIES, n_yarns=DEFAULT_YARNS, n_price_rows=DEFAULT_PRICE_ROWS, seed=42,
+             duplicates=0.0):
+    """(qualities, yarn_rows) – deterministic for a given seed and sizes."""
+    rng = random.Random(seed)
+    yarn_rows = generate_yarns(n_yarns, n_price_rows, rng)
+    qualities = generate_qualities(n_qualities, yarn_rows, rng, duplicates=duplicates)
+    return qualities, yarn_rows
+
+
+def with_ids(qualities, yarn_rows):
+    """Copies with serial ids, as the DB would assign them on an empty table."""
+    return (
+        [dict(q, id=i) for i, q in enumerate(qualities, start=1)],
+        [dict(r, id=i) for i, r in enumerate(yarn_rows, start=1)],
+    )
+
+
+def load(qualities, yarn_rows, reset=False, page_size=2000):
+    """Bulk insert into the configured database (creates the tables if missing)."""
+    from psycopg2.extras import execute_values
+
+    from fabric_costing import db
+
+    db.apply_schema()
+    conn = db.get_conn()
+    try:
+        cur = conn.cursor()
+        if reset:
+            # snapshots point at quality ids, which start over
+            cur.execute("TRUNCATE yarn_prices, qualities, pricing_snapshots, pricing_snapshot_rows RESTART IDENTITY")
+        execute_values(
+            cur,
+            f"INSERT INTO yarn_prices ({', '.join(YARN_COLUMNS)}) VALUES %s",
+            [tuple(r[c] for c in YARN_COLUMNS) for r in yarn_rows],
+            page_size=page_size,
+        )
+        execute_values(
+            cur,
+            f"INSERT INTO qualities ({', '.join(QUALITY_COLUMNS)}) VALUES %s",
+            [tuple(q[c] for c in QUALITY_COLUMNS) for q in qualities],
+            page_size=page_size,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic fabric catalog")
+    parser.add_argument("--qualities", type=int, default=DEFAULT_QUALITIES)
+    parser.add_argument("--yarns", type=int, default=DEFAULT_YARNS)
+    parser.add_argument("--price-rows", type=int, default=DEFAULT_PRICE_ROWS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="fraction of qualities that copy an earlier recipe (dedupe testing)")
+    parser.add_argument("--load", action="store_true", help="insert into the SUPABASE_URI database")
+    parser.add_argument("--reset", action="store_true", help="with --load: TRUNCATE the tables first")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    qualities, yarn_rows = generate(args.qualities, args.yarns, args.price_rows, args.seed, args.duplicates)
+    n_wefts = sum(len(json.loads(q["wefts_json"])) for q in qualities)
+    print(f"Generated {len(qualities)} qualities ({n_wefts} wefts), "
+          f"{len(yarn_rows)} yarn price rows in {time.perf_counter() - t0:.2f}s")
+
+    if args.load:
+        t0 = time.perf_counter()
+        load(qualities, yarn_rows, reset=args.reset)
+        print(f"Loaded in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
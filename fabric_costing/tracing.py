@@ -0,0 +1,327 @@
+"""
+Query tracing for every DB helper.
+
+Each statement that goes through a traced connection is
+  - tagged with the Python function that issued it
+    (prepended as an SQL comment, so it also shows in pg_stat_statements),
+  - timed into a latency histogram per (function, statement),
+  - written to a slow-query log (parameters redacted) when it takes
+    longer than FABRIC_SLOW_QUERY_MS (default 250 ms).
+
+Queries that arrive with their values already inlined (bytes from
+psycopg2.extras.execute_values / mogrify) are keyed, shown and logged as
+a template: literals become ?, a run of VALUES tuples becomes one tuple
+and "...". Logged SQL is cut at MAX_SQL_CHARS, and at most MAX_SERIES
+(function, statement) series are kept – later statements of a function
+are counted under statement="other".
+
+The histograms can be read as OpenMetrics text: render_openmetrics(),
+write_openmetrics(path) or a tiny HTTP endpoint via serve_metrics(port).
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_SLOW_QUERY_LOG = "slow_queries.jsonl"
+MAX_SQL_CHARS = 2000
+MAX_SERIES = 500
+OTHER_STATEMENT = "other"
+
+# Frames from these modules are never reported as "the caller"
+_SKIP_MODULE_PREFIXES = ("fabric_costing.tracing", "fabric_costing.perf", "pandas", "psycopg2", "sqlalchemy")
+# ... nor are these shared helpers (they run SQL on behalf of their caller)
+_SKIP_FUNCTIONS = frozenset({"execute_prepared"})
+
+_lock = threading.Lock()
+_histograms = {}     # (function, statement_id) -> _Histogram
+_statements = {}     # statement_id -> normalized SQL
+_slow_total = {}     # function -> count
+
+
+def slow_query_threshold_s():
+    return float(os.getenv("FABRIC_SLOW_QUERY_MS", "250")) / 1000.0
+
+
+def normalize_sql(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    return " ".join(str(query).split())
+
+
+# E'...' strings take backslash escapes; plain ones only '' (standard_conforming_strings)
+_STRING_LITERAL = re.compile(r"\bE'(?:[^'\\]|\\.|'')*'|'(?:[^']|'')*'", re.IGNORECASE)
+_NUMBER_LITERAL = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_TUPLE = r"\((?:\s*(?:\?|NULL|TRUE|FALSE)(?:::[\w\[\] ]+)?\s*,?)+\)"
+_VALUES_LIST = re.compile(rf"(VALUES\s*)({_TUPLE})(?:\s*,\s*{_TUPLE})*", re.IGNORECASE)
+
+
+def sql_template(normalized_sql):
+    """
+    Inlined literals replaced by ?, a VALUES list (any number of tuples,
+    e.g. execute_values pages) reduced to its first tuple + "...".
+    """
+    sql = _STRING_LITERAL.sub("?", normalized_sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    return _VALUES_LIST.sub(r"\1\2, ...", sql)
+
+
+def statement_id(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode("utf-8")).hexdigest()[:10]
+
+
+def calling_function():
+    """Name of the first function up the stack that is not DB plumbing."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_SKIP_MODULE_PREFIXES) and frame.f_code.co_name not in _SKIP_FUNCTIONS:
+            name = frame.f_code.co_name
+            return "page" if name == "<module>" else name
+        frame = frame.f_back
+    return "unknown"
+
+
+def redact_params(params):
+    """Keep the shape of the parameters, never their values."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: f"<{type(v).__name__}>" for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [f"<{type(v).__name__}>" for v in params]
+    return f"<{type(params).__name__}>"
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "sum_s", "created")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum_s = 0.0
+        self.created = time.time()
+
+    def observe(self, seconds):
+        for i, upper in enumerate(BUCKETS):
+            if seconds <= upper:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum_s += seconds
+
+
+def observe(function, normalized_sql, seconds, params=None):
+    normalized_sql = normalized_sql[:MAX_SQL_CHARS]
+    sid = statement_id(normalized_sql)
+    with _lock:
+        hist = _histograms.get((function, sid))
+        if hist is None:
+            if len(_histograms) >= MAX_SERIES:
+                sid = OTHER_STATEMENT
+                hist = _histograms.get((function, sid))
+            if hist is None:
+                hist = _histograms[(function, sid)] = _Histogram()
+        _statements.setdefault(sid, "(other statements)" if sid == OTHER_STATEMENT else normalized_sql)
+        hist.observe(seconds)
+        is_slow = seconds >= slow_query_threshold_s()
+        if is_slow:
+            _slow_total[function] = _slow_total.get(function, 0) + 1
+
+    if is_slow:
+        _log_slow_query(function, sid, normalized_sql, seconds, params)
+
+
+def _log_slow_query(function, sid, normalized_sql, seconds, params):
+    path = os.getenv("FABRIC_SLOW_QUERY_LOG", DEFAULT_SLOW_QUERY_LOG)
+    if not path:
+        return
+    entry = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "function": function,
+        "statement": sid,
+        "sql": normalized_sql,
+        "params": redact_params(params),
+        "ms": round(seconds * 1000.0, 2),
+    }
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError:
+        pass
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _statements.clear()
+        _slow_total.clear()
+
+
+def snapshot():
+    """
+    Per (function, statement) summary:
+    [{function, statement, sql, count, sum_ms, avg_ms}, ...] slowest total first.
+    """
+    with _lock:
+        out = [
+            {
+                "function": fn,
+                "statement": sid,
+                "sql": _statements.get(sid, ""),
+                "count": h.total,
+                "sum_ms": round(h.sum_s * 1000.0, 2),
+                "avg_ms": round(h.sum_s * 1000.0 / h.total, 2) if h.total else 0.0,
+            }
+            for (fn, sid), h in _histograms.items()
+        ]
+    out.sort(key=lambda r: r["sum_ms"], reverse=True)
+    return out
+
+
+# ---------------------------
+# Connection / cursor wrappers
+# ---------------------------
+
+class TracedCursor:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def _run(self, method, query, args, kwargs):
+        function = calling_function()
+        normalized = normalize_sql(query)
+        if isinstance(query, bytes):
+            # values already inlined (execute_values / mogrify): key on the template
+            normalized = sql_template(normalized)
+            if not query.lstrip().startswith(b"/*"):
+                query = f"/* fn:{function} */ ".encode("utf-8") + query
+        elif not query.lstrip().startswith("/*"):
+            query = f"/* fn:{function} */ {query}"
+        t0 = time.perf_counter()
+        try:
+            return method(query, *args, **kwargs)
+        finally:
+            params = args[0] if args else kwargs.get("vars", kwargs.get("params"))
+            observe(function, normalized, time.perf_counter() - t0, params)
+
+    def execute(self, query, *args, **kwargs):
+        return self._run(self._cur.execute, query, args, kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        return self._run(self._cur.executemany, query, args, kwargs)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class TracedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def wrap_connection(conn):
+    return TracedConnection(conn)
+
+
+# ---------------------------
+# OpenMetrics export
+# ---------------------------
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def render_openmetrics():
+    with _lock:
+        items = sorted(_histograms.items())
+        slow = sorted(_slow_total.items())
+
+    lines = [
+        "# TYPE fabric_db_query_duration_seconds histogram",
+        "# UNIT fabric_db_query_duration_seconds seconds",
+        "# HELP fabric_db_query_duration_seconds DB statement latency by calling function.",
+    ]
+    for (fn, sid), h in items:
+        labels = f'function="{_label(fn)}",statement="{sid}"'
+        cumulative = 0
+        for upper, count in zip(BUCKETS, h.counts):
+            cumulative += count
+            lines.append(f'fabric_db_query_duration_seconds_bucket{{{labels},le="{upper}"}} {cumulative}')
+        lines.append(f'fabric_db_query_duration_seconds_bucket{{{labels},le="+Inf"}} {h.total}')
+        lines.append(f"fabric_db_query_duration_seconds_count{{{labels}}} {h.total}")
+        lines.append(f"fabric_db_query_duration_seconds_sum{{{labels}}} {h.sum_s:.6f}")
+        lines.append(f"fabric_db_query_duration_seconds_created{{{labels}}} {h.created:.3f}")
+
+    lines += [
+        "# TYPE fabric_db_slow_queries counter",
+        "# HELP fabric_db_slow_queries Statements slower than FABRIC_SLOW_QUERY_MS.",
+    ]
+    for fn, count in slow:
+        lines.append(f'fabric_db_slow_queries_total{{function="{_label(fn)}"}} {count}')
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_openmetrics(path):
+    """Atomically (re)write the metrics file, e.g. for a node_exporter textfile collector."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_openmetrics())
+    os.replace(tmp, path)
+
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Serve GET /metrics from a daemon thread. Returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="fabric-metrics").start()
+    return server
@@ -0,0 +1,174 @@
+"""
+Cheapest weft mix for a target fabric weight.
+
+Warp, RS and charges come from a base recipe (resolve_recipe() inputs);
+the optimizer picks weft yarns from the latest yarn prices, and the pick
+split, so that fabric_weight_100 hits the target at the lowest grey cost.
+
+With x_i = picks_i * denier_i (each weft's share of the weft weight):
+
+    the target weight fixes   Σ x_i       = D       D = (target − warp weight) / weft weight per pick-denier
+    total picks               Σ x_i / d_i = P       P_min <= P <= P_max
+    grey cost / m adds        Σ x_i * v_i           v_i = a * price_i + weaving rate / d_i
+
+That is a linear program in x. Its optimal vertices use at most two yarns
+(two constraints), and a two-yarn mix sits at a picks bound – so the
+search is over single yarns and pairs, never more. Pairs are enumerated
+in order of v with branch and bound: every pair starting at yarn i costs
+at least D * v_i, so once that passes the k-th best mix found, the rest
+are pruned.
+
+    cands = weft_candidates(yarn_price_map, min_denier=50, max_denier=300)
+    result = cheapest_mixes(base, 9.5, (80, 120), cands, top=10)
+    result["mixes"]      # cheapest first; each with wefts, picks, costs, fabric_weight_100
+
+The coefficients (a, weft weight per pick-denier, warp weight) are read off
+calculate_costing, so the shortage and interest rules live in one place.
+"""
+import heapq
+
+import numpy as np
+
+from fabric_costing.costing import calculate_costing
+
+COUNT_TO_DENIER = 5315.0
+
+
+def weft_candidates(yarn_price_map, min_denier=None, max_denier=None):
+    """
+    Weft yarns (latest rows usable as weft, incl. "both") with a price and
+    a denier – from the count when only a count is stored – optionally
+    within [min_denier, max_denier].
+    yarn_price_map: a YarnTable (db.get_latest_yarn_price_map()).
+    """
+    rows = yarn_price_map.type_rows("weft")
+    price, denier, count = yarn_price_map.take(rows)
+    from_count = np.isnan(denier) & (count > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denier = np.where(from_count, COUNT_TO_DENIER / count, denier)
+
+    keep = (price > 0) & (denier > 0)
+    if min_denier:
+        keep &= denier >= min_denier
+    if max_denier:
+        keep &= denier <= max_denier
+    names = yarn_price_map.names
+    return {
+        "names": [names[i] for i in rows[keep].tolist()],
+        "denier": denier[keep],
+        "price": price[keep],
+        "count": np.nan_to_num(count[keep]),
+        "mode": np.where(from_count[keep], "count", "denier"),
+    }
+
+
+def _coefficients(base):
+    """(warp-only costing, weft weight per pick-denier, grey ₹/m per (pick-denier * ₹/kg), weaving ₹/m per pick)."""
+    zero_weft = dict(base, picks=0.0, weft_denier=0.0, weft_yarn_price=0.0)
+    warp = calculate_costing(**zero_weft)
+    per_xd = calculate_costing(**dict(base, picks=1.0, weft_denier=1.0))["weft_weight_100"]
+    yarn_only = dict(base, warp_yarn_price=0.0, weaving_rate_per_pick=0.0, picks=1.0, weft_denier=1.0)
+    a = calculate_costing(**dict(yarn_only, weft_yarn_price=1.0))["grey_cost_per_m"]
+    b = calculate_costing(**dict(base, warp_yarn_price=0.0, picks=1.0, weft_denier=0.0))["grey_cost_per_m"]
+    return warp, per_xd, a, b
+
+
+def cheapest_mixes(base, target_weight_100, picks_range, candidates, max_wefts=2, top=10):
+    """
+    The `top` cheapest weft mixes (1 or 2 yarns) that make the fabric weigh
+    target_weight_100 kg / 100 m with total picks in picks_range.
+    base: calculate_costing inputs of the base recipe (warp, RS, charges).
+    Returns {"mixes": [...], "candidates": n, "pairs_checked": n, "weft_denier_picks": D}.
+    """
+    p_min, p_max = float(picks_range[0]), float(picks_range[1])
+    warp, per_xd, a, b = _coefficients(base)
+    D = (target_weight_100 - warp["warp_weight_100"]) / per_xd if per_xd > 0 else 0.0
+    out = {"mixes": [], "candidates": len(candidates["names"]), "pairs_checked": 0, "weft_denier_picks": D}
+    if D <= 0 or p_max <= 0 or not out["candidates"]:
+        return out
+
+    order = np.argsort(a * candidates["price"] + b / candidates["denier"], kind="stable")
+    d = candidates["denier"][order]
+    u = 1.0 / d
+    v = a * candidates["price"][order] + b * u
+    eps = 1e-9 * D
+
+    best = []  # max-heap (-weft cost, seq, [(yarn, x)], P) of the `top` cheapest so far
+    seq = 0
+
+    def worst():
+        return -best[0][0] if len(best) == top else np.inf
+
+    def offer(cost, parts, picks):
+        nonlocal seq
+        seq += 1
+        if len(best) < top:
+            heapq.heappush(best, (-cost, seq, parts, picks))
+        elif cost < -best[0][0]:
+            heapq.heapreplace(best, (-cost, seq, parts, picks))
+
+    # one yarn: its picks are fixed by the weight
+    single_p = D * u
+    ok = (single_p >= p_min) & (single_p <= p_max)
+    for i in np.nonzero(ok)[0][:top].tolist():  # sorted by v, so the first `top` are the cheapest
+        offer(D * v[i], [(i, D)], single_p[i])
+
+    if max_wefts >= 2:
+        bounds = np.array(sorted({p_min, p_max}))
+        for i in range(len(v) - 1):
+            if D * v[i] >= worst():
+                break  # every later pair costs at least D * v[i]
+            uj, vj = u[i + 1:], v[i + 1:]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # x_i + x_j = D and x_i / d_i + x_j / d_j = P, at each picks bound
+                xi = (bounds[:, None] - D * uj) / (u[i] - uj)
+                xj = D - xi
+                cost = np.where((xi > eps) & (xj > eps), xi * v[i] + xj * vj, np.inf)
+            at = np.argmin(cost, axis=0)  # cheaper picks bound per pair
+            cost = cost[at, np.arange(len(vj))]
+            out["pairs_checked"] += len(vj)
+
+            hits = np.nonzero(cost < worst())[0]
+            if len(hits) > top:
+                hits = hits[np.argpartition(cost[hits], top)[:top]]
+            for k in hits.tolist():
+                x = float(xi[at[k], k])
+                offer(float(cost[k]), [(i, x), (i + 1 + k, D - x)], float(bounds[at[k]]))
+
+    mixes = sorted(best, key=lambda m: (-m[0], m[1]))
+    out["mixes"] = _describe(mixes, base, candidates, order, d, D)
+    return out
+
+
+def _describe(mixes, base, candidates, order, d, D):
+    """Mix rows with exact costing (calculate_costing over all of them at once)."""
+    if not mixes:
+        return []
+    price = candidates["price"][order]
+    picks = np.array([m[3] for m in mixes])
+    eff_price = np.array([sum(x * price[i] for i, x in m[2]) / D for m in mixes])
+    args = {k: np.full(len(mixes), float(val)) for k, val in base.items()}
+    args.update(picks=picks, weft_denier=D / picks, weft_yarn_price=eff_price)
+    cost = calculate_costing(**args)
+
+    rows = []
+    for n, (_, _, parts, total_picks) in enumerate(mixes):
+        wefts = []
+        for i, x in parts:
+            src = order[i]
+            wefts.append({
+                "yarn_name": candidates["names"][src],
+                "mode": str(candidates["mode"][src]),
+                "denier": float(d[i]),
+                "count": float(candidates["count"][src]),
+                "price": float(price[i]),
+                "picks": float(x / d[i]),
+            })
+        rows.append({
+            "wefts": wefts,
+            "picks": float(total_picks),
+            **{k: float(cost[k][n]) for k in (
+                "fabric_weight_100", "grey_cost_per_m", "grey_sale_per_m", "rfd_cost_per_m", "rfd_sale_per_m",
+            )},
+        })
+    return rows
@@ -0,0 +1,251 @@
+"""
+Columnar yarn price table – a compact, drop-in yarn price map.
+
+build_yarn_price_map() keeps one full row dict per (name, yarn_type) and
+puts every "both" row under three keys. YarnTable stores the latest rows
+column-wise instead:
+
+    names     list of interned str
+    types     array('B') bitmask: 1 = warp, 2 = weft (3 = both)
+    price / denier / count   array('d'), NaN = NULL
+    index     name -> (warp row, weft row, both row), -1 = none
+
+It is a read-only Mapping with the same keys as build_yarn_price_map()
+((name, "warp" | "weft" | "both")), so compute_dynamic_cost & co. accept
+it unchanged: table.get((name, "weft")) is O(1) and returns a small row
+view (row["price_per_kg"], row["denier"], row["count"]). The costing code
+uses table.lookup(name, yarn_type) -> (price, denier, count) directly, and
+batch engines can gather whole columns with numpy:
+
+    idx = table.indices(names, "weft")
+    price, denier, count = table.take(idx)       # float64 arrays, NaN where missing
+"""
+import math
+import sys
+from array import array
+from collections.abc import Mapping
+
+WARP = 1
+WEFT = 2
+BOTH = WARP | WEFT
+
+_TYPE_BITS = {"warp": WARP, "weft": WEFT, "both": BOTH}
+_TYPE_NAMES = {WARP: "warp", WEFT: "weft", BOTH: "both"}
+_SLOT = {"warp": 0, "weft": 1, "both": 2}   # position in an index entry
+_NO_ROW = (-1, -1, -1)
+
+_NAN = float("nan")
+
+
+def _f(val):
+    return _NAN if val is None else float(val)
+
+
+def _opt(val):
+    return None if math.isnan(val) else val
+
+
+class YarnRow(Mapping):
+    """View of one table row; reads like the latest yarn_prices row dict."""
+    __slots__ = ("_table", "_i")
+
+    _KEYS = ("name", "yarn_type", "price_per_kg", "denier", "count")
+
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    def __getitem__(self, key):
+        t, i = self._table, self._i
+        if key == "price_per_kg":
+            return _opt(t.price[i])
+        if key == "denier":
+            return _opt(t.denier[i])
+        if key == "count":
+            return _opt(t.count[i])
+        if key == "name":
+            return t.names[i]
+        if key == "yarn_type":
+            return _TYPE_NAMES[t.types[i]]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __repr__(self):
+        return f"YarnRow({dict(self)!r})"
+
+
+class YarnTable(Mapping):
+    __slots__ = ("names", "types", "price", "denier", "count", "_index", "_n_keys")
+
+    def __init__(self):
+        self.names = []
+        self.types = array("B")
+        self.price = array("d")
+        self.denier = array("d")
+        self.count = array("d")
+        self._index = {}
+        self._n_keys = 0
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        From the latest yarn_prices rows (one per (name, yarn_type)), with
+        the same precedence as build_yarn_price_map: later rows win, and a
+        "both" row also serves the warp and weft lookups. Rows of any other
+        yarn_type are ignored.
+        """
+        t = cls()
+        for r in rows:
+            t._add(r)
+        t._count_keys()
+        return t
+
+    def _add(self, r):
+        bits = _TYPE_BITS.get(r["yarn_type"])
+        if bits is None:
+            return
+        i = len(self.names)
+        name = sys.intern(r["name"])
+        self.names.append(name)
+        self.types.append(bits)
+        self.price.append(_f(r["price_per_kg"]))
+        self.denier.append(_f(r["denier"]))
+        self.count.append(_f(r["count"]))
+
+        slots = list(self._index.get(name, _NO_ROW))
+        if bits == BOTH:
+            slots = [i, i, i]
+        else:
+            slots[_SLOT[r["yarn_type"]]] = i
+        self._index[name] = tuple(slots)
+
+    def _count_keys(self):
+        self._n_keys = sum(3 if s[2] >= 0 else (s[0] >= 0) + (s[1] >= 0) for s in self._index.values())
+
+    def with_row(self, row):
+        """
+        A copy in which `row` (a yarn_prices row dict) is the latest for its
+        (name, yarn_type) – the table as it will read once that row is saved.
+        The name's other rows are re-applied in the same order as from_rows
+        gets them (by yarn_type), so "both" vs typed precedence is unchanged.
+        """
+        t = YarnTable()
+        t.names = list(self.names)
+        t.types = array("B", self.types)
+        t.price = array("d", self.price)
+        t.denier = array("d", self.denier)
+        t.count = array("d", self.count)
+        t._index = dict(self._index)
+
+        name = row["name"]
+        rows = [
+            dict(YarnRow(self, i)) for i in sorted(set(self._index.get(name, _NO_ROW)))
+            if i >= 0 and _TYPE_NAMES[self.types[i]] != row["yarn_type"]
+        ]
+        rows.append(row)
+        t._index.pop(name, None)
+        for r in sorted(rows, key=lambda r: r["yarn_type"]):
+            t._add(r)
+        t._count_keys()
+        return t
+
+    # --- Mapping interface: keys are (name, yarn_type) ---
+
+    def row_index(self, name, yarn_type):
+        """Row number for (name, yarn_type), or -1."""
+        slots = self._index.get(name)
+        if slots is None:
+            return -1
+        slot = _SLOT.get(yarn_type)
+        return -1 if slot is None else slots[slot]
+
+    def lookup(self, name, yarn_type):
+        """(price_per_kg, denier, count) for (name, yarn_type), or None – the costing fast path."""
+        slots = self._index.get(name)
+        if slots is None:
+            return None
+        i = slots[_SLOT[yarn_type]]
+        if i < 0:
+            return None
+        p, d, c = self.price[i], self.denier[i], self.count[i]
+        # NaN != NaN: NULL columns come back as None
+        return (p if p == p else None, d if d == d else None, c if c == c else None)
+
+    def get(self, key, default=None):
+        i = self.row_index(key[0], key[1])
+        return default if i < 0 else YarnRow(self, i)
+
+    def __getitem__(self, key):
+        i = self.row_index(key[0], key[1])
+        if i < 0:
+            raise KeyError(key)
+        return YarnRow(self, i)
+
+    def __contains__(self, key):
+        return self.row_index(key[0], key[1]) >= 0
+
+    def __iter__(self):
+        for name, slots in self._index.items():
+            for yarn_type, slot in _SLOT.items():
+                if slots[slot] >= 0:
+                    yield (name, yarn_type)
+
+    def __len__(self):
+        return self._n_keys
+
+    @property
+    def n_rows(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"<YarnTable {self.n_rows} rows, {len(self._index)} names>"
+
+    # --- Vectorized access (numpy) ---
+
+    def indices(self, names, yarn_type):
+        """numpy int array of row numbers for `names` (all of one yarn_type), -1 where missing."""
+        import numpy as np
+
+        slot = _SLOT[yarn_type]
+        get = self._index.get
+        return np.fromiter(
+            ((get(n) or _NO_ROW)[slot] if n else -1 for n in names),
+            dtype=np.int64,
+            count=len(names),
+        )
+
+    def type_rows(self, yarn_type):
+        """Row numbers that serve (name, yarn_type) lookups – one per name, as a numpy int array."""
+        import numpy as np
+
+        slot = _SLOT[yarn_type]
+        return np.fromiter((s[slot] for s in self._index.values() if s[slot] >= 0), dtype=np.int64)
+
+    def columns(self):
+        """(price, denier, count) as zero-copy float64 numpy views."""
+        import numpy as np
+
+        return (
+            np.frombuffer(self.price, dtype=np.float64),
+            np.frombuffer(self.denier, dtype=np.float64),
+            np.frombuffer(self.count, dtype=np.float64),
+        )
+
+    def take(self, idx):
+        """Gather (price, denier, count) for row numbers `idx`; NaN where idx < 0."""
+        import numpy as np
+
+        idx = np.asarray(idx, dtype=np.int64)
+        missing = idx < 0
+        safe = np.where(missing, 0, idx)
+        out = []
+        for col in self.columns():
+            vals = col.take(safe) if len(col) else np.full(len(idx), np.nan)
+            vals[missing] = np.nan
+            out.append(vals)
+        return tuple(out)
@@ -0,0 +1,195 @@
+import threading
+
+import pytest
+
+from fabric_costing import catalog
+from fabric_costing.catalog import RefreshAhead
+
+TTL = 100.0
+
+
+class Clock:
+    """Stands in for the time module in catalog: time() only moves when a test says so."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class Source:
+    """load() returning 1, 2, 3, ...; can be made to fail, or to block until released."""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.entered = threading.Event()
+        self.gate = None
+        self.threads = []
+
+    def load(self):
+        self.calls += 1
+        self.threads.append(threading.current_thread())
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise ConnectionError("db down")
+        return self.calls
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(catalog, "time", clock)
+    return clock
+
+
+def settle(holder):
+    """Wait for the background reload, if one was started."""
+    if holder._thread is not None:
+        holder._thread.join(5)
+
+
+def test_first_get_loads_then_serves_the_cached_value(clock):
+    src = Source()
+    holder = RefreshAhead("t", src.load, ttl=TTL)
+    assert holder.age() is None
+    assert holder.get() == 1
+    assert src.threads == [threading.current_thread()]
+    clock.now += TTL * 0.5
+    assert holder.get() == 1
+    assert src.calls == 1
+    assert holder.age() == pytest.approx(TTL * 0.5)
+
+
+def test_reload_ahead_of_expiry_runs_in_the_background(clock):
+    src = Source()
+    holder = RefreshAhead("t", src.load, ttl=TTL)
+    holder.get()
+    clock.now += TTL - holder.ahead + 1.0
+    src.gate = threading.Event()
+    src.entered.clear()
+    assert holder.get() == 1          # answered from the old value, not waiting for the load
+    assert src.entered.wait(5)
+    assert holder.get() == 1          # still loading: no second load is started
+    src.gate.set()
+    settle(holder)
+    assert holder.get() == 2
+    assert src.calls == 2
+    assert src.threads[1] is not threading.current_thread()
+    assert holder.version == 2
+
+
+def test_refresh_waits_for_a_running_background_load(clock):
+    src = Source()
+    holder = RefreshAhead("t", src.load, ttl=TTL)
+    holder.get()
+    clock.now += TTL - holder.ahead + 1.0
+    src.gate = threading.Event()
+    src.entered.clear()
+    holder.get()
+    assert src.entered.wait(5)
+
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(holder.refresh()))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()          # blocked on the background load's lock
+    src.gate.set()
+    waiter.join(5)
+    settle(holder)
+    assert result == [2]              # the background load's value, not a load of its own
+    assert src.calls == 2
+
+
+def test_failed_reload_keeps_the_old_value_and_backs_off(clock):
+    src = Source()
+    holder = RefreshAhead("t", src.load, ttl=TTL)
+    holder.get()
+    clock.now += TTL - holder.ahead + 1.0
+    src.fail = True
+    holder.get()
+    settle(holder)
+    assert src.calls == 2
+    assert isinstance(holder.last_error, ConnectionError)
+    assert holder.get() == 1 and holder.version == 1
+
+    # within RETRY_SECONDS of the failure get() doesn't try again
+    clock.now += catalog.RETRY_SECONDS - 1.0
+    holder.get()
+    settle(holder)
+    assert src.calls == 2
+
+    # after it, the next get() does – and a success clears the error
+    clock.now += 2.0
+    src.fail = False
+    assert holder.get() == 1
+    settle(holder)
+    assert src.calls == 3
+    assert holder.get() == 3 and holder.last_error is None
+
+
+def test_past_ttl_plus_max_stale_get_loads_in_the_foreground(clock):
+    src = Source()
+    holder = RefreshAhead("t", src.load, ttl=TTL, max_stale=50.0)
+    holder.get()
+    src.fail = True
+    clock.now += TTL + 50.0
+    with pytest.raises(ConnectionError):
+        holder.get()                  # too stale to serve: the caller sees the failure
+    src.fail = False
+    assert holder.get() == 3
+    assert src.threads[-1] is threading.current_thread()
+
+
+def test_first_load_failure_propagates(clock):
+    src = Source()
+    src.fail = True
+    holder = RefreshAhead("t", src.load, ttl=TTL)
+    with pytest.raises(ConnectionError):
+        holder.get()
+    assert holder.age() is None
+
+
+def test_warm_loads_once_in_the_background(clock):
+    src = Source()
+    holder = RefreshAhead("t", src.load, ttl=TTL)
+    holder.warm()
+    settle(holder)
+    holder.warm()                     # already loaded: nothing to do
+    settle(holder)
+    assert src.calls == 1
+    assert holder.get() == 1
+    assert src.threads[0] is not threading.current_thread()
+
+
+def test_dependents_rebuild_after_a_version_bump(clock):
+    base_src = Source()
+    base = RefreshAhead("base", base_src.load, ttl=TTL)
+    builds = []
+
+    def derive():
+        builds.append(base.get())
+        return base.get() * 10
+
+    assert base.get() == 1            # dependencies first, as the app warms them
+    derived = RefreshAhead("derived", derive, ttl=None, depends=(base,))
+    assert derived.get() == 10
+
+    clock.now += TTL * 0.5
+    assert derived.get() == 10        # unchanged dependency: no rebuild
+    clock.now += TTL * 50
+    base_src.fail = True
+    assert derived.get() == 10        # ttl=None: never expires by age (and base isn't touched)
+    settle(derived)
+    assert builds == [1] and base_src.calls == 1
+
+    base_src.fail = False
+    assert base.refresh() == 2
+    assert derived.get() == 10        # the old value while the rebuild runs
+    settle(derived)
+    assert derived.get() == 20
+    assert builds == [1, 2]
+    assert derived.get() == 20 and len(builds) == 2
@@ -0,0 +1,139 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from fabric_costing import similar, synth
+from fabric_costing.similar import SimilarityIndex, recipe_features
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    qualities, yarn_rows = synth.generate(n_qualities=3000, n_yarns=200, n_price_rows=1000, seed=11)
+    qualities, _ = synth.with_ids(qualities, yarn_rows)
+    return {q["id"]: q for q in qualities}
+
+
+@pytest.fixture
+def index(catalog):
+    return SimilarityIndex.build(list(catalog.values()))
+
+
+def brute_force(index, live, recipe, k, exclude_id=None):
+    """[(id, distance)] over every live recipe, with the index's current scaling."""
+    ids = [q_id for q_id in live if q_id != exclude_id]
+    pts = index._normalize(np.array([recipe_features(live[q_id]) for q_id in ids], dtype=np.float64))
+    x = index._normalize(np.array(recipe_features(recipe), dtype=np.float64))
+    d = np.sqrt(((pts - x) ** 2).sum(axis=1))
+    return sorted(zip(d.tolist(), ids))[:k]
+
+
+def assert_same(found, expected):
+    """Same distances; ids may differ only among equal distances."""
+    assert [d for _, d in found] == pytest.approx([d for d, _ in expected], abs=1e-9)
+    kth = expected[-1][0]
+    assert {q_id for q_id, d in found if d < kth - 1e-9} == {q_id for d, q_id in expected if d < kth - 1e-9}
+
+
+def perturbed(q, rng):
+    out = dict(q)
+    for key in ("ends", "picks", "warp_denier", "rs"):
+        out[key] = q[key] * rng.uniform(0.8, 1.25)
+    out.pop("reed")
+    return out
+
+
+def test_nearest_matches_brute_force(index, catalog):
+    rng = random.Random(3)
+    queries = [catalog[q_id] for q_id in rng.sample(sorted(catalog), 40)]
+    queries += [perturbed(q, rng) for q in queries[:40]]
+    for recipe in queries:
+        assert_same(index.nearest(recipe, k=10), brute_force(index, catalog, recipe, 10))
+
+
+def test_exact_recipe_is_found_at_distance_zero(index, catalog):
+    q = catalog[1234]
+    q_id, dist = index.nearest(q, k=1)[0]
+    assert dist == pytest.approx(0.0, abs=1e-12)
+    assert recipe_features(catalog[q_id]) == recipe_features(q)
+
+
+def test_exclude_id(index, catalog):
+    q = catalog[1234]
+    found = index.nearest(q, k=10, exclude_id=1234)
+    assert 1234 not in [q_id for q_id, _ in found]
+    assert_same(found, brute_force(index, catalog, q, 10, exclude_id=1234))
+    # also for a recipe that only lives in the pending set
+    index.upsert(1234, dict(q, picks=q["picks"] + 7))
+    found = index.nearest(dict(q, picks=q["picks"] + 7), k=10, exclude_id=1234)
+    assert 1234 not in [q_id for q_id, _ in found]
+
+
+def test_upsert_changed_recipe(index, catalog):
+    live = dict(catalog)
+    old = catalog[42]
+    new = dict(old, picks=old["picks"] * 1.6, wefts_json=None, weft_denier=old["weft_denier"] * 2.0)
+    index.upsert(42, new)
+    live[42] = new
+    assert len(index) == len(catalog)
+
+    assert index.nearest(new, k=1)[0] == (42, pytest.approx(0.0, abs=1e-12))
+    found = index.nearest(old, k=10)
+    assert 42 not in [q_id for q_id, d in found if d < 1e-9]  # the old recipe is gone from the tree
+    assert_same(found, brute_force(index, live, old, 10))
+    assert_same(index.nearest(new, k=10), brute_force(index, live, new, 10))
+
+
+def test_upsert_new_and_remove(index, catalog):
+    live = dict(catalog)
+    new = perturbed(catalog[7], random.Random(5))
+    index.upsert(90001, new)
+    live[90001] = new
+    assert len(index) == len(catalog) + 1
+    assert index.nearest(new, k=1)[0][0] == 90001
+
+    for q_id in (90001, 7, 8):  # pending, tree, tree
+        index.remove(q_id)
+        del live[q_id]
+    assert len(index) == len(catalog) - 2
+    for recipe in (new, catalog[7], catalog[8]):
+        found = index.nearest(recipe, k=10)
+        assert not {90001, 7, 8} & {q_id for q_id, _ in found}
+        assert_same(found, brute_force(index, live, recipe, 10))
+
+    index.remove(7)  # removing twice is a no-op
+    index.remove(123456)
+    assert len(index) == len(catalog) - 2
+
+
+def test_rebuild_threshold(index, catalog):
+    live = dict(catalog)
+    threshold = max(similar.REBUILD_MIN, similar.REBUILD_FRACTION * len(catalog))
+    tree = index._tree
+    rng = random.Random(9)
+    new_ids = iter(range(80001, 90000))
+    churn = 0
+    while churn + 1 < threshold:
+        q_id = next(new_ids)
+        live[q_id] = perturbed(catalog[rng.randrange(1, len(catalog) + 1)], rng)
+        index.upsert(q_id, live[q_id])
+        churn += 1
+    assert index._tree is tree and len(index._pending) == churn
+
+    index.remove(1)  # churn reaches the threshold: rebuilt with fresh scaling
+    del live[1]
+    assert index._tree is not tree
+    assert not index._pending and not index._hidden
+    assert len(index) == len(live)
+    for recipe in (catalog[1], catalog[500], live[80001]):
+        assert_same(index.nearest(recipe, k=10), brute_force(index, live, recipe, 10))
+
+
+def test_small_and_empty_indexes():
+    assert SimilarityIndex.build([]).nearest({"ends": 4000, "picks": 80}, k=5) == []
+    q = {"id": 1, "ends": 4000.0, "reed": 68.0, "rs": 58.0, "warp_denier": 75.0, "picks": 80.0,
+         "weft_denier": 100.0, "wefts_json": None}
+    index = SimilarityIndex.build([q])
+    assert index.nearest(q, k=5) == [(1, 0.0)]
+    assert math.isnan(recipe_features({"ends": None})[0])
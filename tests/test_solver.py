@@ -0,0 +1,92 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from fabric_costing import solver, synth
+from fabric_costing.costing import build_yarn_price_map, calculate_costing
+from fabric_costing.kernel import INPUTS, RecipeBatch
+
+
+@pytest.fixture(scope="module")
+def batch():
+    rng = random.Random(7)
+    yarn_rows = synth.generate_yarns(40, 200, rng)
+    qualities = synth.generate_qualities(60, yarn_rows, rng, max_wefts=4)
+    qualities = [dict(q, id=i) for i, q in enumerate(qualities, start=1)]
+    return RecipeBatch.from_qualities(qualities, build_yarn_price_map(synth.latest_yarn_rows(yarn_rows)))
+
+
+def _recost(batch, i, name, value):
+    """calculate_costing for row i of the batch with one input replaced – scalar, no kernel."""
+    args = {k: float(batch[k][i]) for k in INPUTS}
+    args["include_interest"] = bool(args["include_interest"])
+    args[name] = value
+    return calculate_costing(**args)
+
+
+CASES = [(target, variable) for target in solver.TARGETS for variable in solver.VARIABLES
+         if variable != "markup" or target in ("grey_sale", "rfd_sale")]
+
+
+@pytest.mark.parametrize("target,variable", CASES)
+def test_solution_recosts_to_the_target(batch, target, variable):
+    out = solver.TARGETS[target]
+    wanted = batch.evaluate()[out] * 1.1
+    sol = solver.solve(batch, target, wanted, variable)
+
+    assert sol["input"] == solver.solve_input(target, variable)
+    assert not np.isnan(sol["required"]).any()
+    for i, required in enumerate(sol["required"]):
+        cost = _recost(batch, i, sol["input"], float(required))
+        assert cost[out] == pytest.approx(wanted[i], rel=1e-7)
+
+
+def test_current_values_solve_to_themselves(batch):
+    sol = solver.solve(batch, "rfd_sale", batch.evaluate()["rfd_sale_per_m"], "picks")
+    np.testing.assert_allclose(sol["required"], batch["picks"], rtol=1e-9)
+    np.testing.assert_array_equal(sol["current"], batch["picks"])
+
+
+def test_negative_requirement_is_nan(batch):
+    # ₹0.01/m is below what the warp alone costs: picks would have to be negative
+    sol = solver.solve(batch, "grey_cost", 0.01, "picks")
+    assert np.isnan(sol["required"]).all()
+
+
+def test_infinite_requirement_is_nan():
+    # no weft weight -> the weft price has no effect on the price (slope 0)
+    inputs = {k: np.array([1.0]) for k in INPUTS}
+    inputs.update(ends=np.array([4000.0]), warp_denier=np.array([75.0]), picks=np.array([60.0]),
+                  weft_denier=np.array([0.0]), rs=np.array([58.0]), warp_yarn_price=np.array([200.0]),
+                  weft_yarn_price=np.array([250.0]), grey_markup_percent=np.array([8.0]),
+                  rfd_markup_percent=np.array([10.0]), weaving_rate_per_pick=np.array([0.15]))
+    one = RecipeBatch(np.array([1]), inputs)
+    price = one.evaluate()["grey_cost_per_m"][0]
+    assert np.isnan(solver.solve(one, "grey_cost", price + 5.0, "weft_price")["required"][0])
+    # ... while the current price itself is reached by any weft price: 0/0, also NaN
+    assert np.isnan(solver.solve(one, "grey_cost", price, "weft_price")["required"][0])
+
+
+def test_markup_outside_the_bracket_is_nan(batch):
+    cost = batch.evaluate()["rfd_cost_per_m"]
+    below_cost = solver.solve(batch, "rfd_sale", cost * 0.9, "markup")["required"]
+    above_max = solver.solve(batch, "rfd_sale", cost / (1 - 99.5 / 100.0), "markup")["required"]
+    assert np.isnan(below_cost).all()
+    assert np.isnan(above_max).all()
+
+
+def test_markup_bisection_matches_the_closed_form(batch):
+    # sale = cost / (1 - m/100)  =>  m = 100 * (1 - cost / sale)
+    cost = batch.evaluate()["grey_cost_per_m"]
+    wanted = cost * 1.25
+    sol = solver.solve(batch, "grey_sale", wanted, "markup")
+    np.testing.assert_allclose(sol["required"], 100.0 * (1.0 - 1.0 / 1.25), atol=1e-7)
+    assert math.isclose(float(sol["required"].max()), 20.0, abs_tol=1e-7)
+
+
+@pytest.mark.parametrize("target,variable", [("bogus", "picks"), ("rfd_sale", "bogus"), ("grey_cost", "markup")])
+def test_bad_target_or_variable(target, variable):
+    with pytest.raises(ValueError):
+        solver.solve_input(target, variable)
@@ -0,0 +1,125 @@
+import json
+from datetime import date
+
+import pytest
+from psycopg2.extensions import adapt
+from psycopg2.extras import execute_values
+
+from fabric_costing import tracing
+
+
+class FakeCursor:
+    """Just enough of a psycopg2 cursor for execute_values: mogrify (real quoting) and execute."""
+
+    class connection:
+        encoding = "UTF8"
+
+    def __init__(self):
+        self.executed = []
+
+    def mogrify(self, template, args):
+        return template % tuple(adapt(a).getquoted() for a in args)
+
+    def execute(self, query, *args, **kwargs):
+        self.executed.append(query)
+
+
+@pytest.fixture(autouse=True)
+def clean(monkeypatch, tmp_path):
+    monkeypatch.setenv("FABRIC_SLOW_QUERY_LOG", str(tmp_path / "slow.jsonl"))
+    tracing.reset()
+    yield
+    tracing.reset()
+
+
+def _insert_page(cur, rows):
+    execute_values(
+        cur,
+        "INSERT INTO yarn_prices (name, yarn_type, count, denier, price_per_kg, valid_from) VALUES %s",
+        rows,
+        page_size=len(rows),
+    )
+
+
+def _rows(n, seed):
+    return [(f"Yarn {seed}-{i} O'Neil", "weft", None, 75.0 + i, 180.5 + seed * i, date(2024, 1, 1 + i % 28))
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("sql,template", [
+    ("SELECT * FROM t WHERE name = 'x' AND id = 42", "SELECT * FROM t WHERE name = ? AND id = ?"),
+    ("SELECT 'it''s', E'a\\'b', e'c\\\\', 'd\\', -1.5e3, 0.25", "SELECT ?, ?, ?, ?, ?, ?"),
+    ("SELECT col1, t2.x FROM t2 WHERE v = $1 LIMIT 10", "SELECT col1, t2.x FROM t2 WHERE v = $1 LIMIT ?"),
+    ("INSERT INTO t (a, b) VALUES (1, 'x')", "INSERT INTO t (a, b) VALUES (?, ?), ..."),
+    ("INSERT INTO t (a, b) VALUES (1, 'x'),(2, NULL), (3,'z')", "INSERT INTO t (a, b) VALUES (?, ?), ..."),
+    ("INSERT INTO t (d) VALUES ('2024-01-01'::date), (NULL::date)", "INSERT INTO t (d) VALUES (?::date), ..."),
+    ("UPDATE q SET v = d.v FROM (VALUES (1, 2.5), (2, 3.5)) AS d (id, v) WHERE q.id = d.id",
+     "UPDATE q SET v = d.v FROM (VALUES (?, ?), ...) AS d (id, v) WHERE q.id = d.id"),
+])
+def test_sql_template(sql, template):
+    assert tracing.sql_template(sql) == template
+
+
+def test_execute_values_pages_share_one_series():
+    cur = tracing.TracedCursor(FakeCursor())
+    _insert_page(cur, _rows(1, 1))
+    _insert_page(cur, _rows(40, 2))
+    _insert_page(cur, _rows(7, 3))
+
+    series = tracing.snapshot()
+    assert len(series) == 1
+    s = series[0]
+    assert s["function"] == "_insert_page" and s["count"] == 3
+    assert s["sql"] == ("INSERT INTO yarn_prices (name, yarn_type, count, denier, price_per_kg, valid_from) "
+                        "VALUES (?,?,NULL,?,?,?::date), ...")
+    # the statements actually sent are still bytes, tagged with the caller
+    sent = cur._cur.executed
+    assert all(isinstance(q, bytes) and q.startswith(b"/* fn:_insert_page */ INSERT") for q in sent)
+    assert b"O''Neil" in sent[1]
+
+
+def test_slow_log_has_the_template_not_the_values(monkeypatch, tmp_path):
+    monkeypatch.setenv("FABRIC_SLOW_QUERY_MS", "0")
+    cur = tracing.TracedCursor(FakeCursor())
+    _insert_page(cur, _rows(5000, 4))
+
+    lines = (tmp_path / "slow.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    entry = json.loads(lines[0])
+    assert "Neil" not in entry["sql"] and "180.5" not in entry["sql"]
+    assert entry["sql"].endswith("VALUES (?,?,NULL,?,?,?::date), ...")
+    assert len(lines[0]) < 1000
+    assert entry["statement"] == tracing.snapshot()[0]["statement"]
+
+
+def test_logged_sql_is_truncated(monkeypatch, tmp_path):
+    monkeypatch.setenv("FABRIC_SLOW_QUERY_MS", "0")
+    long_sql = "SELECT " + ", ".join(f"col_{i}" for i in range(2000)) + " FROM wide"
+    tracing.observe("wide_read", long_sql, 0.5)
+    assert len(tracing.snapshot()[0]["sql"]) == tracing.MAX_SQL_CHARS
+    entry = json.loads((tmp_path / "slow.jsonl").read_text(encoding="utf-8"))
+    assert len(entry["sql"]) == tracing.MAX_SQL_CHARS
+
+
+def test_series_are_capped(monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_SERIES", 3)
+    for i in range(3):
+        tracing.observe("reader", f"SELECT c{i} FROM t", 0.001)
+    tracing.observe("reader", "SELECT c9 FROM t", 0.002)
+    tracing.observe("writer", "UPDATE t SET c = ?", 0.003)
+    tracing.observe("reader", "SELECT c0 FROM t", 0.004)   # known series: still counted as itself
+
+    series = {(s["function"], s["statement"]): s for s in tracing.snapshot()}
+    assert len(series) == 5
+    other = [s for s in series.values() if s["statement"] == tracing.OTHER_STATEMENT]
+    assert sorted((s["function"], s["count"]) for s in other) == [("reader", 1), ("writer", 1)]
+    assert all(s["sql"] == "(other statements)" for s in other)
+    c0 = series[("reader", tracing.statement_id("SELECT c0 FROM t"))]
+    assert c0["count"] == 2
+    assert 'statement="other"' in tracing.render_openmetrics()
+
+
+def test_parameters_are_redacted():
+    assert tracing.redact_params(("secret", 3, None)) == ["<str>", "<int>", "<NoneType>"]
+    assert tracing.redact_params({"name": "secret"}) == {"name": "<str>"}
+    assert tracing.redact_params(None) is None
@@ -0,0 +1,147 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from fabric_costing import weft_mix
+from fabric_costing.costing import calculate_costing, calculate_costing_multi_weft
+from fabric_costing.yarn_table import YarnTable
+
+YARNS = [
+    # name, yarn_type, price_per_kg, denier, count
+    ("50D Poly FDY", "weft", 310.0, 50.0, None),
+    ("75D Poly DTY", "weft", 205.0, 75.0, None),
+    ("100D Poly DTY", "both", 182.0, 100.0, None),
+    ("120D Viscose", "weft", 240.0, 120.0, None),
+    ("150D Poly DTY", "weft", 168.0, 150.0, None),
+    ("200D Slub", "weft", 175.0, 200.0, None),
+    ("300D Poly", "weft", 150.0, 300.0, None),
+    ("30s Cotton", "weft", 260.0, None, 30.0),
+    ("40s Cotton", "both", 290.0, None, 40.0),
+    ("68D Nylon", "weft", 420.0, 68.0, None),
+    ("80D Warp Only", "warp", 90.0, 80.0, None),   # cheap, but not a weft yarn
+    ("No Price", "weft", None, 120.0, None),
+]
+
+BASE = {
+    "ends": 4000.0, "warp_denier": 75.0, "picks": 0.0, "weft_denier": 0.0, "rs": 58.0,
+    "warp_yarn_price": 210.0, "weft_yarn_price": 0.0,
+    "weaving_rate_per_pick": 0.16, "grey_markup_percent": 8.0,
+    "rfd_charge_per_m": 2.5, "rfd_shortage_percent": 5.0, "rfd_markup_percent": 10.0,
+    "include_interest": True,
+}
+
+
+@pytest.fixture(scope="module")
+def candidates():
+    table = YarnTable.from_rows(
+        {"name": n, "yarn_type": t, "price_per_kg": p, "denier": d, "count": c} for n, t, p, d, c in YARNS
+    )
+    return weft_mix.weft_candidates(table)
+
+
+def _grey_cost(picks, D, parts):
+    """Grey ₹/m of a mix given as [(denier, price, x = picks * denier)], with total picks."""
+    price = sum(x * p for _, p, x in parts) / D
+    return calculate_costing(**dict(BASE, picks=picks, weft_denier=D / picks, weft_yarn_price=price))["grey_cost_per_m"]
+
+
+def brute_force(candidates, target, picks_range):
+    """Every single yarn and every pair at each picks bound – the vertices the optimizer searches."""
+    warp = calculate_costing(**BASE)["warp_weight_100"]
+    per_xd = calculate_costing(**dict(BASE, picks=1.0, weft_denier=1.0))["weft_weight_100"]
+    D = (target - warp) / per_xd
+    p_min, p_max = picks_range
+    yarns = list(zip(candidates["names"], candidates["denier"].tolist(), candidates["price"].tolist()))
+    mixes = []
+    for name, d, p in yarns:
+        if p_min <= D / d <= p_max:
+            mixes.append((_grey_cost(D / d, D, [(d, p, D)]), (name,)))
+    for (ni, di, pi), (nj, dj, pj) in itertools.combinations(yarns, 2):
+        if di == dj:
+            continue
+        for P in {p_min, p_max}:
+            xi = (P - D / dj) / (1.0 / di - 1.0 / dj)
+            xj = D - xi
+            if xi > 1e-9 * D and xj > 1e-9 * D:
+                mixes.append((_grey_cost(P, D, [(di, pi, xi), (dj, pj, xj)]), tuple(sorted((ni, nj)))))
+    mixes.sort()
+    return D, mixes
+
+
+def test_candidates_are_priced_weft_yarns(candidates):
+    assert "80D Warp Only" not in candidates["names"]
+    assert "No Price" not in candidates["names"]
+    assert "100D Poly DTY" in candidates["names"]
+    i = candidates["names"].index("30s Cotton")
+    assert candidates["mode"][i] == "count"
+    assert candidates["denier"][i] == pytest.approx(weft_mix.COUNT_TO_DENIER / 30.0)
+
+
+@pytest.mark.parametrize("target,picks_range", [(9.5, (80, 120)), (11.0, (60, 140)), (8.0, (90, 90)), (14.0, (40, 200))])
+def test_cheapest_mixes_match_brute_force(candidates, target, picks_range):
+    D, expected = brute_force(candidates, target, picks_range)
+    top = 8
+    result = weft_mix.cheapest_mixes(BASE, target, picks_range, candidates, top=top)
+
+    assert result["weft_denier_picks"] == pytest.approx(D)
+    got = [m["grey_cost_per_m"] for m in result["mixes"]]
+    want = [cost for cost, _ in expected[:top]]
+    assert got == pytest.approx(want, rel=1e-9)
+    assert tuple(sorted(w["yarn_name"] for w in result["mixes"][0]["wefts"])) == expected[0][1]
+
+
+def test_mixes_recost_to_the_target(candidates):
+    target, (p_min, p_max) = 9.5, (80, 120)
+    result = weft_mix.cheapest_mixes(BASE, target, (p_min, p_max), candidates, top=10)
+    assert result["mixes"]
+    for mix in result["mixes"]:
+        wefts = [{"picks": w["picks"], "weft_denier": w["denier"], "weft_yarn_price": w["price"]} for w in mix["wefts"]]
+        args = {k: v for k, v in BASE.items() if k not in ("picks", "weft_denier", "weft_yarn_price")}
+        cost = calculate_costing_multi_weft(weft_list=wefts, **args)
+        assert cost["fabric_weight_100"] == pytest.approx(target, rel=1e-9)
+        assert cost["grey_cost_per_m"] == pytest.approx(mix["grey_cost_per_m"], rel=1e-9)
+        assert mix["fabric_weight_100"] == pytest.approx(target, rel=1e-9)
+        assert p_min - 1e-9 <= sum(w["picks"] for w in mix["wefts"]) <= p_max + 1e-9
+
+
+def test_pairs_never_beat_their_pruning_bound(candidates):
+    # v_i = a * price_i + b / denier_i; a mix's weft-dependent cost is Σ x * v, so >= D * min(v)
+    _, _, a, b = weft_mix._coefficients(BASE)
+    v = dict(zip(candidates["names"], (a * candidates["price"] + b / candidates["denier"]).tolist()))
+    warp_only = calculate_costing(**dict(BASE, picks=0.0))["grey_cost_per_m"]
+    D, mixes = brute_force(candidates, 11.0, (60, 140))
+    assert len(mixes) > 10
+    for cost, names in mixes:
+        assert cost - warp_only >= D * min(v[n] for n in names) * (1 - 1e-12)
+
+
+def test_pruning_skips_pairs_without_changing_the_answer(candidates):
+    n = len(candidates["names"])
+    _, expected = brute_force(candidates, 11.0, (60, 140))
+    pruned = weft_mix.cheapest_mixes(BASE, 11.0, (60, 140), candidates, top=1)
+    assert pruned["pairs_checked"] < n * (n - 1) // 2
+    assert pruned["mixes"][0]["grey_cost_per_m"] == pytest.approx(expected[0][0], rel=1e-9)
+
+
+def test_pair_optimum_sits_at_a_picks_bound(candidates):
+    # sweeping picks between the bounds never finds a cheaper pair than the bound vertices
+    D, expected = brute_force(candidates, 9.5, (80, 120))
+    names = list(candidates["names"])
+    best = expected[0][0]
+    for i, j in itertools.combinations(range(len(names)), 2):
+        di, dj = candidates["denier"][i], candidates["denier"][j]
+        pi, pj = candidates["price"][i], candidates["price"][j]
+        if di == dj:
+            continue
+        for P in np.linspace(80, 120, 21):
+            xi = (P - D / dj) / (1.0 / di - 1.0 / dj)
+            if 0 < xi < D:
+                assert _grey_cost(P, D, [(di, pi, xi), (dj, pj, D - xi)]) >= best - 1e-9
+
+
+def test_unreachable_weight_gives_no_mixes(candidates):
+    warp = calculate_costing(**BASE)["warp_weight_100"]
+    assert weft_mix.cheapest_mixes(BASE, warp * 0.5, (80, 120), candidates)["mixes"] == []
+    # far too heavy for 120 picks of the thickest yarn
+    assert weft_mix.cheapest_mixes(BASE, 60.0, (80, 120), candidates, max_wefts=1)["mixes"] == []